@@ -0,0 +1,2 @@
+"""Benchmarks of the data preparation and inference hot paths, on
+synthetic corpora, see benchmarks/run.py."""
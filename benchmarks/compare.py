@@ -0,0 +1,82 @@
+"""Benchmark comparison
+Compares two result files of `python -m benchmarks.run`, e.g. of two
+commits, benchmark by benchmark and corpus size by corpus size.
+
+Usage:
+    python -m benchmarks.compare <baseline.json> <candidate.json> [--tolerance 0.1]
+
+A benchmark regresses when the candidate takes more than (1 + tolerance)
+times the seconds of the baseline; the exit status is 1 when any does.
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, List, Tuple
+
+
+def _rows(report: dict) -> Dict[Tuple[str, float], dict]:
+    return {(row["benchmark"], row["hours"]): row for row in report["results"]}
+
+
+def compare(baseline: dict, candidate: dict, tolerance: float = 0.1) -> List[dict]:
+    """Seconds of the candidate relative to the baseline for every
+    benchmark and size both of them ran.
+
+    Returns:
+        List[dict]: benchmark, hours, baseline and candidate seconds,
+            ratio (candidate / baseline) and regression (ratio above
+            1 + tolerance).
+    """
+    baseline_rows = _rows(baseline)
+    comparison = []
+    for key, row in _rows(candidate).items():
+        if key not in baseline_rows:
+            continue
+        before = baseline_rows[key]["seconds"]
+        ratio = row["seconds"] / before if before else float("inf")
+        comparison.append(
+            {
+                "benchmark": key[0],
+                "hours": key[1],
+                "baseline_seconds": before,
+                "candidate_seconds": row["seconds"],
+                "ratio": ratio,
+                "regression": ratio > 1 + tolerance,
+            }
+        )
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.compare", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument("baseline", help="results of the reference commit")
+    parser.add_argument("candidate", help="results of the commit to check")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="slowdown tolerated before a benchmark is a regression",
+    )
+    args = parser.parse_args(argv)
+    reports = []
+    for path in (args.baseline, args.candidate):
+        with open(path, "r", encoding="UTF-8") as infile:
+            reports.append(json.load(infile))
+    comparison = compare(reports[0], reports[1], args.tolerance)
+    print(
+        f"{'benchmark':<26}{'hours':>8}{'baseline s':>12}{'candidate s':>13}{'ratio':>8}"
+    )
+    for row in comparison:
+        print(
+            f"{row['benchmark']:<26}{row['hours']:>8g}{row['baseline_seconds']:>12.3f}"
+            f"{row['candidate_seconds']:>13.3f}{row['ratio']:>8.2f}"
+            f"{'  REGRESSION' if row['regression'] else ''}"
+        )
+    return 1 if any(row["regression"] for row in comparison) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Synthetic fixtures
+Generates corpora of WAV and RTTM files laid out like
+sampled_config_60mins/, so the benchmarks run offline on any amount of
+audio without the real data.
+
+    <root>/synth/train/audio/synth_00000.wav
+    <root>/synth/train/rttm/synth_00000.rttm
+
+Speech is low level noise with louder noise bursts where the RTTM has a
+speaker turn, every recording having several speakers with overlapping
+turns. Only `templates` distinct recordings are written, the others are
+hard links to them with the same RTTM content, so hundreds of hours of
+audio take the disk space of a few recordings.
+"""
+
+import logging
+import math
+import os
+import shutil
+from typing import Dict, List, Tuple
+
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+ANNOTATION_KEY = "synth_train"
+
+
+def speaker_turns(
+    duration: float, rng: np.random.Generator, speakers: int = 3
+) -> List[List[Tuple[float, float]]]:
+    """Speech turns of every speaker of a recording, exponentially
+    distributed turns of 2.5 s and pauses of 4 s on average.
+
+    Returns:
+        List[List[Tuple[float, float]]]: (start, end) turns in seconds,
+            per speaker.
+    """
+    turns = []
+    for _ in range(speakers):
+        speaker = []
+        time = float(rng.exponential(4.0))
+        while time < duration:
+            end = min(time + 0.2 + float(rng.exponential(2.5)), duration)
+            speaker.append((round(time, 2), round(end, 2)))
+            time = end + 0.1 + float(rng.exponential(4.0))
+        turns.append(speaker)
+    return turns
+
+
+def write_rttm(path: str, file_id: str, turns: List[List[Tuple[float, float]]]):
+    """Writes the turns of every speaker as RTTM SPEAKER lines."""
+    with open(path, "w", encoding="UTF-8") as outfile:
+        for speaker, speaker_turns_ in enumerate(turns):
+            for start, end in speaker_turns_:
+                outfile.write(
+                    f"SPEAKER {file_id} 1 {start:.2f} {end - start:.2f} "
+                    f"<NA> <NA> spk{speaker} <NA> <NA>\n"
+                )
+
+
+def synthetic_signal(
+    duration: float,
+    turns: List[List[Tuple[float, float]]],
+    rng: np.random.Generator,
+    sample_rate: int = SAMPLE_RATE,
+) -> np.ndarray:
+    """int16 noise at -50 dBFS with bursts at -20 dBFS during the turns."""
+    signal = rng.normal(0.0, 0.003, int(duration * sample_rate)).astype(np.float32)
+    for speaker in turns:
+        for start, end in speaker:
+            first, last = int(start * sample_rate), int(end * sample_rate)
+            signal[first:last] += rng.normal(0.0, 0.1, last - first).astype(np.float32)
+    return (np.clip(signal, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def _link(source: str, target: str):
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def make_corpus(
+    root: str,
+    hours: float,
+    recording_seconds: float = 600.0,
+    templates: int = 4,
+    speakers: int = 3,
+    sample_rate: int = SAMPLE_RATE,
+    seed: int = 0,
+) -> Dict[str, object]:
+    """Writes a synthetic corpus of at least `hours` hours of audio.
+
+    Args:
+        root (str): Folder of the corpus, the sampled data path.
+        hours (float): Hours of audio, rounded up to whole recordings.
+        recording_seconds (float, optional): Duration of every
+            recording, at most `hours`. Defaults to 600.0.
+        templates (int, optional): Distinct recordings written, the
+            others being hard links to them. Defaults to 4.
+        speakers (int, optional): Speakers per recording. Defaults to 3.
+        sample_rate (int, optional): Defaults to 16000.
+        seed (int, optional): Seed of the generator, the same seed gives
+            the same corpus. Defaults to 0.
+
+    Returns:
+        Dict[str, object]: root, recordings, audio_seconds, audio_paths,
+            rttm_paths and turns, the speaker turns of every recording.
+
+    Examples:
+        >>> corpus = make_corpus("/tmp/vad_bench/1h", hours=1)
+        >>> corpus["audio_seconds"]
+        3600.0
+    """
+    recording_seconds = min(recording_seconds, hours * 3600)
+    recordings = max(math.ceil(hours * 3600 / recording_seconds - 1e-9), 1)
+    audio_dir = os.path.join(root, "synth", "train", "audio")
+    rttm_dir = os.path.join(root, "synth", "train", "rttm")
+    os.makedirs(audio_dir, exist_ok=True)
+    os.makedirs(rttm_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    template_turns = []
+    audio_paths = []
+    rttm_paths = []
+    for index in range(recordings):
+        file_id = f"synth_{index:05d}"
+        audio_path = os.path.join(audio_dir, f"{file_id}.wav")
+        rttm_path = os.path.join(rttm_dir, f"{file_id}.rttm")
+        template = index % templates
+        if index < templates:
+            turns = speaker_turns(recording_seconds, rng, speakers)
+            template_turns.append(turns)
+            sf.write(
+                audio_path,
+                synthetic_signal(recording_seconds, turns, rng, sample_rate),
+                sample_rate,
+                subtype="PCM_16",
+            )
+        else:
+            _link(audio_paths[template], audio_path)
+        write_rttm(rttm_path, file_id, template_turns[template])
+        audio_paths.append(audio_path)
+        rttm_paths.append(rttm_path)
+    logger.info(f"{recordings} recordings of {recording_seconds} s in {root}")
+    return {
+        "root": root,
+        "recordings": recordings,
+        "audio_seconds": recordings * recording_seconds,
+        "audio_paths": audio_paths,
+        "rttm_paths": rttm_paths,
+        "turns": [template_turns[index % templates] for index in range(recordings)],
+    }
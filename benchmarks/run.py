@@ -0,0 +1,422 @@
+"""Benchmark runner
+Times the data preparation and inference hot paths on synthetic corpora
+of increasing size and writes the results as JSON, one file per commit,
+so two commits can be compared with `python -m benchmarks.compare`.
+
+Usage:
+    python -m benchmarks.run [--hours 0.1,1,10,100] [--max-audio-hours 10] [options]
+
+Benchmarks:
+    read_rttm, read_rttm_bulk: parsing every RTTM file of the corpus into
+        validated speech segments per file.
+    merge_overlap_segments: merging the speaker turns of every recording.
+    check_overlap, label_windows: labelling every 0.63 s window, one
+        window at a time and vectorised.
+    soundfile_chopping: SoundfileWrapper._soundfile_chopping of every
+        recording into 5 s chunk WAVs.
+    handle_generated_folders: ReadTrim.handle_generated_folders writing
+        the manifests of the 5 s chunks.
+    extract_logits: the NeMo test dataloader and MarbleNet forward pass
+        over 0.63 s offset manifest windows, only when NeMo and the
+        checkpoint are available.
+
+The benchmarks decoding or writing audio only run up to
+--max-audio-hours, the others up to the largest --hours.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.fixtures import ANNOTATION_KEY, make_corpus
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WINDOW = 0.63
+CHUNK = 5.0
+
+
+def _best_time(function: Callable[[], None], repeat: int) -> float:
+    seconds = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def _windows(duration: float, window: float) -> np.ndarray:
+    starts = np.arange(0.0, duration - window + 1e-9, window)
+    return np.round(np.stack((starts, starts + window), axis=1), 2)
+
+
+def bench_read_rttm(corpus: dict, workdir: str, repeat: int) -> dict:
+    from src.vad.data_prep.speech_segments import read_rttm, validate_segments
+
+    paths = corpus["rttm_paths"]
+    seconds = _best_time(
+        lambda: [validate_segments(read_rttm(path)) for path in paths], repeat
+    )
+    return {"items": len(paths), "unit": "files", "seconds": seconds}
+
+
+def bench_read_rttm_bulk(corpus: dict, workdir: str, repeat: int) -> dict:
+    from src.vad.data_prep.speech_segments import (
+        read_rttm_bulk,
+        rttm_table_to_segments,
+    )
+
+    paths = corpus["rttm_paths"]
+    seconds = _best_time(
+        lambda: rttm_table_to_segments(read_rttm_bulk(paths)[0]), repeat
+    )
+    return {"items": len(paths), "unit": "files", "seconds": seconds}
+
+
+def bench_merge_overlap_segments(corpus: dict, workdir: str, repeat: int) -> dict:
+    from src.vad.data_prep.speech_segments import merge_overlap_segments
+
+    turns = corpus["turns"]
+    seconds = _best_time(
+        lambda: [merge_overlap_segments(recording) for recording in turns], repeat
+    )
+    return {
+        "items": sum(len(speaker) for recording in turns for speaker in recording),
+        "unit": "turns",
+        "seconds": seconds,
+    }
+
+
+def _recording_windows(corpus: dict):
+    from src.vad.data_prep.speech_segments import merge_overlap_segments
+
+    duration = corpus["audio_seconds"] / corpus["recordings"]
+    windows = _windows(duration, WINDOW)
+    # recordings hard linked to the same template share their segments
+    segments = {}
+    for turns in corpus["turns"]:
+        if id(turns) not in segments:
+            segments[id(turns)] = merge_overlap_segments(turns)
+    return windows, [segments[id(turns)] for turns in corpus["turns"]]
+
+
+def bench_check_overlap(corpus: dict, workdir: str, repeat: int) -> dict:
+    from src.folder_audio_utils.audio_management import AudioUtils
+
+    windows, segments = _recording_windows(corpus)
+    window_list = windows.tolist()
+
+    def run():
+        for recording_segments in segments:
+            for window in window_list:
+                AudioUtils.check_overlap(window, recording_segments)
+
+    seconds = _best_time(run, repeat)
+    return {
+        "items": len(windows) * len(segments),
+        "unit": "windows",
+        "seconds": seconds,
+    }
+
+
+def bench_label_windows(corpus: dict, workdir: str, repeat: int) -> dict:
+    from src.folder_audio_utils.audio_management import AudioUtils
+
+    windows, segments = _recording_windows(corpus)
+    seconds = _best_time(
+        lambda: [
+            AudioUtils.label_windows(windows, recording_segments)
+            for recording_segments in segments
+        ],
+        repeat,
+    )
+    return {
+        "items": len(windows) * len(segments),
+        "unit": "windows",
+        "seconds": seconds,
+    }
+
+
+def bench_soundfile_chopping(corpus: dict, workdir: str, repeat: int) -> dict:
+    from src.vad.data_prep.audio_processing.wrapper_for_soundfile import (
+        SoundfileWrapper,
+    )
+
+    output_dir = os.path.join(workdir, "chopping")
+    wrapper = SoundfileWrapper({}, output_dir=output_dir, durations=CHUNK)
+
+    def run():
+        # only the chopping is timed, the chunks of a recording are removed
+        # before the next one so the disk holds one recording of chunks
+        elapsed = 0.0
+        for audio_path in corpus["audio_paths"]:
+            os.makedirs(output_dir, exist_ok=True)
+            start = time.perf_counter()
+            wrapper._soundfile_chopping(output_dir, audio_path)
+            elapsed += time.perf_counter() - start
+            shutil.rmtree(output_dir)
+        return elapsed
+
+    seconds = min(run() for _ in range(max(repeat, 1)))
+    return {"items": corpus["recordings"], "unit": "recordings", "seconds": seconds}
+
+
+def bench_handle_generated_folders(corpus: dict, workdir: str, repeat: int) -> dict:
+    from src.vad.data_prep.annotations import Annotations
+    from src.vad.data_prep.audio_processing.read_chunked_audio_files import ReadTrim
+
+    chunk_dir = os.path.join(workdir, "chunks")
+    trimmed_dir = os.path.join(chunk_dir, f"{ANNOTATION_KEY}_trimmed")
+    shutil.rmtree(chunk_dir, ignore_errors=True)
+    os.makedirs(trimmed_dir)
+    # handle_generated_folders only reads the chunk names, empty files
+    # named like the chunks of _soundfile_chopping stand in for them
+    duration = corpus["audio_seconds"] / corpus["recordings"]
+    windows = _windows(duration, CHUNK)
+    for audio_path in corpus["audio_paths"]:
+        file_id = os.path.splitext(os.path.basename(audio_path))[0]
+        for start, end in windows:
+            open(
+                os.path.join(
+                    trimmed_dir, f"{file_id}__{round(start, 2)}-{round(end, 2)}.wav"
+                ),
+                "wb",
+            ).close()
+    read_trim = ReadTrim(chunk_dir, Annotations(corpus["root"]))
+    seconds = _best_time(
+        lambda: read_trim.handle_generated_folders(
+            duration=CHUNK, manifest_folder_path=chunk_dir
+        ),
+        repeat,
+    )
+    shutil.rmtree(chunk_dir)
+    return {
+        "items": len(windows) * corpus["recordings"],
+        "unit": "chunks",
+        "seconds": seconds,
+    }
+
+
+def extract_logits_unavailable() -> Optional[str]:
+    """Why extract_logits cannot be benchmarked, None when it can."""
+    from src.vad.inference.marblenet_model import MODEL_PATH
+
+    try:
+        import nemo.collections.asr  # noqa: F401
+    except ImportError as error:
+        return f"NeMo is not importable: {error}"
+    if not os.path.isfile(MODEL_PATH):
+        return f"{MODEL_PATH} not found"
+    return None
+
+
+def bench_extract_logits(corpus: dict, workdir: str, repeat: int) -> dict:
+    import torch
+    from omegaconf import OmegaConf
+
+    from src.vad.data_prep.annotations import Annotations
+    from src.vad.data_prep.audio_processing.offset_manifests import (
+        OffsetManifestWriter,
+    )
+    from src.vad.inference.marblenet_model import extract_logits, load_model
+
+    manifest_dir = os.path.join(workdir, "manifests")
+    os.makedirs(manifest_dir, exist_ok=True)
+    annote_dict = Annotations(corpus["root"]).annotations_loader()
+    annote_dict = {key: value for key, value in annote_dict.items() if value}
+    manifests = OffsetManifestWriter(annote_dict, durations=WINDOW).write_manifests(
+        manifest_folder_path=manifest_dir
+    )
+    config = OmegaConf.load(os.path.join(REPO_ROOT, "marblenet_lite.yaml"))
+    config.model.test_ds.manifest_filepath = ",".join(manifests)
+    model = load_model()
+    model.setup_test_data(config.model.test_ds)
+    logits = []
+
+    def run():
+        with torch.no_grad():
+            logits[:] = [extract_logits(model, model._test_dl)[0]]
+
+    seconds = _best_time(run, repeat)
+    shutil.rmtree(manifest_dir)
+    return {"items": int(len(logits[0])), "unit": "windows", "seconds": seconds}
+
+
+# name: (function, decodes or writes audio)
+BENCHMARKS = {
+    "read_rttm": (bench_read_rttm, False),
+    "read_rttm_bulk": (bench_read_rttm_bulk, False),
+    "merge_overlap_segments": (bench_merge_overlap_segments, False),
+    "check_overlap": (bench_check_overlap, False),
+    "label_windows": (bench_label_windows, False),
+    "soundfile_chopping": (bench_soundfile_chopping, True),
+    "handle_generated_folders": (bench_handle_generated_folders, False),
+    "extract_logits": (bench_extract_logits, True),
+}
+
+
+def _git_commit() -> Dict[str, object]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                cwd=REPO_ROOT,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def run_benchmarks(
+    hours: List[float],
+    names: List[str],
+    workdir: str,
+    max_audio_hours: float = 10.0,
+    repeat: int = 3,
+) -> dict:
+    """Runs the benchmarks `names` on a synthetic corpus of every size in
+    `hours`.
+
+    Returns:
+        dict: The environment (commit, python, platform, cpus), results,
+            one row per benchmark and size with items, unit, seconds,
+            items_per_second and realtime_factor (seconds of audio per
+            second), and skipped, the reason of every skipped benchmark.
+    """
+    report = {
+        **_git_commit(),
+        "created": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "repeat": repeat,
+        "results": [],
+        "skipped": {},
+    }
+    if "extract_logits" in names:
+        reason = extract_logits_unavailable()
+        if reason:
+            logger.warning(f"extract_logits skipped: {reason}")
+            report["skipped"]["extract_logits"] = reason
+            names = [name for name in names if name != "extract_logits"]
+    for size in hours:
+        corpus = make_corpus(os.path.join(workdir, f"{size:g}h"), size)
+        for name in names:
+            function, uses_audio = BENCHMARKS[name]
+            if uses_audio and size > max_audio_hours:
+                continue
+            result = function(corpus, workdir, repeat)
+            row = {
+                "benchmark": name,
+                "hours": size,
+                "audio_seconds": corpus["audio_seconds"],
+                **result,
+                "items_per_second": (
+                    result["items"] / result["seconds"] if result["seconds"] else None
+                ),
+                "realtime_factor": (
+                    corpus["audio_seconds"] / result["seconds"]
+                    if result["seconds"]
+                    else None
+                ),
+            }
+            logger.info(
+                f"{name} {size:g} h: {result['seconds']:.3f} s, "
+                f"{row['items_per_second']:.1f} {result['unit']}/s, "
+                f"{row['realtime_factor']:.0f}x real time"
+            )
+            report["results"].append(row)
+    return report
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument(
+        "--hours",
+        default="0.1,1,10,100",
+        help="comma-separated hours of audio of the synthetic corpora",
+    )
+    parser.add_argument(
+        "--max-audio-hours",
+        type=float,
+        default=10.0,
+        help="largest corpus the audio decoding/writing benchmarks run on",
+    )
+    parser.add_argument(
+        "--benchmarks",
+        default=",".join(BENCHMARKS),
+        help="comma-separated benchmarks to run",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per benchmark, the best is kept"
+    )
+    parser.add_argument(
+        "--workdir",
+        default=os.path.join(tempfile.gettempdir(), "vad_benchmarks"),
+        help="folder of the synthetic corpora",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="JSON results, benchmarks/results/<commit>.json by default",
+    )
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = build_parser().parse_args(argv)
+    names = [name.strip() for name in args.benchmarks.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(
+            f"Unknown benchmarks {unknown}, choose from {list(BENCHMARKS)}"
+        )
+    report = run_benchmarks(
+        [float(size) for size in args.hours.split(",")],
+        names,
+        args.workdir,
+        max_audio_hours=args.max_audio_hours,
+        repeat=args.repeat,
+    )
+    output = args.output or os.path.join(
+        REPO_ROOT,
+        "benchmarks",
+        "results",
+        f"{(report['commit'] or 'unknown')[:12]}{'-dirty' if report['dirty'] else ''}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="UTF-8") as outfile:
+        json.dump(report, outfile, indent=2)
+    logger.info(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,7 @@ import os
 from os.path import basename, isdir, isfile, join
 import logging
 import torch
+import numpy as np
 import hydra
 import time
 import yaml
@@ -16,9 +17,27 @@ from omegaconf import open_dict
 
 from src.vad.data_prep.audio_processing.wrapper_for_soundfile import SoundfileWrapper
 from src.vad.data_prep.audio_processing.read_chunked_audio_files import ReadTrim
+from src.vad.data_prep.audio_processing.offset_manifests import OffsetManifestWriter
 from src.vad.data_prep.annotations import Annotations
-
-def chunking(sampled_data_path,save_to_folder):
+from src.vad.inference.marblenet_model import extract_logits, infer_chunks, load_model, load_model_config, speech_label_index
+from src.vad.inference.sliding_window import recording_speech_probs
+from src.vad.inference.quantization import calibration_windows, quantize_model
+from src.vad.inference.feature_cache import FeatureCache, cached_logits
+from src.vad.inference.manifest_audio import read_manifests
+from src.vad.inference.posteriors import reference_frame_labels, save_posteriors
+from src.vad.inference.results_store import ResultsStore
+from src.vad.inference.pipeline import InferencePipeline
+from src.vad.inference.bucketing import bucketing_report, entry_lengths
+from src.vad.inference.data_parallel import DataParallelInference
+from src.vad.inference.options import InferenceOptions
+from src.vad.inference.sharding import Shard
+from src.vad.evaluation.chunk_metrics import chunk_metrics
+from src.folder_audio_utils.audio_management import AudioUtils
+
+# seconds of audio classified per chunk, the same in every chunking mode
+CHUNK_DURATION = 5
+
+def chunking(sampled_data_path,save_to_folder,write_chunks=True,num_workers=1,incremental=True,shard=None):
 
     """Process raw data files and perform audio chunking for later inference.
 
@@ -28,10 +47,27 @@ def chunking(sampled_data_path,save_to_folder):
     The Annotations object is used to create a SoundfileWrapper object, which performs segmentation
     and saves the segmented audio chunks to the 'chunked_audio/' directory.
 
+    When 'write_chunks' is False, no chunk WAVs or manifests are written. The chunks are kept in
+    memory and returned together with the annotations so they can be passed to model_eval_in_memory.
+
+    When 'incremental' is True, a build state is kept in 'save_to_folder/.build_state.json' and only the
+    recordings whose WAV, RTTM or chunk duration changed since the previous run are chunked again. Only the
+    manifests of the annotation keys with such recordings are rewritten.
+
+    Args:
+        sampled_data_path (str): The path to the folder of sampled data.
+        save_to_folder (str): The path to the folder where the chunked audio files are saved.
+        write_chunks (bool, optional): Whether to write chunk WAVs and manifests. Defaults to True.
+        num_workers (int, optional): The number of processes used to segment recordings. Defaults to 1.
+        incremental (bool, optional): Whether to skip recordings chunked by a previous run. Defaults to True.
+        shard (Shard, optional): Only the recordings of this shard of an array job are chunked, see
+                                 Shard.select. Defaults to None, every recording.
+
     Returns:
-        tuple: A tuple containing:
+        str: A comma-separated string containing the paths to the manifest files, when 'write_chunks' is True.
+        tuple: When 'write_chunks' is False, a tuple containing:
+            - dict: The in-memory chunks returned by SoundfileWrapper.segmentation_loader.
             - dict: A dictionary containing the loaded annotations with non-empty values.
-            - str: The path to the folder where the chunked audio files are saved.
 
     Raises:
         Exception: If there are any errors during the process, they will be logged but not raised directly.
@@ -59,6 +95,8 @@ def chunking(sampled_data_path,save_to_folder):
         keys_which_are_empty = [key for key in annote_dict.keys() if not annote_dict[key]]
         for _ in keys_which_are_empty:
             del annote_dict[_]
+        if shard is not None:
+            annote_dict = shard.select(annote_dict)
         print(annote_dict.keys())
     except Exception as e:
         logging.error(e)
@@ -67,25 +105,65 @@ def chunking(sampled_data_path,save_to_folder):
         sf_wrapper = SoundfileWrapper(
             annotations=annote_dict,
             output_dir=save_to_folder,
-            durations=5, # seconds
+            durations=CHUNK_DURATION,
+            write_chunks=write_chunks,
+            num_workers=num_workers,
+            build_state_path=os.path.join(save_to_folder,".build_state.json") if incremental else None,
         )
-        sf_wrapper.segmentation_loader()
+        in_memory_chunks = sf_wrapper.segmentation_loader()
     except Exception as e:
         logging.error(
             f'segmentation has failed with error: {e}')
     logging.info("Data preparation pipeline has ended, please check the logs for any anomaly.")
-    inference_files = read_chunked_audio_files(save_to_folder,annote)
+    if not write_chunks:
+        return in_memory_chunks, annote_dict
+    inference_files = read_chunked_audio_files(
+        save_to_folder,annote,keys=sf_wrapper.changed_keys if incremental else None
+    )
     return inference_files
 
-def read_chunked_audio_files(data_folder_head,annote):
+def offset_manifest_files(sampled_data_path,save_to_folder,durations=CHUNK_DURATION,shard=None):
+    """Write manifests that point into the original recordings for later inference.
+
+    Unlike chunking, no audio is cut or written. Every window is a manifest entry against the original
+    recording in 'sampled_data_path', with the real 'offset' of the window in that recording.
+
+    Args:
+        sampled_data_path (str): The path to the folder of sampled data.
+        save_to_folder (str): The path to the folder where the manifest files are saved.
+        durations (float, optional): The duration of each window in seconds, the duration of the chunks
+                                     written by chunking. Defaults to CHUNK_DURATION.
+        shard (Shard, optional): Only the recordings of this shard of an array job are written, see Shard.select.
+                                 Defaults to None, every recording.
+
+    Returns:
+        str: A comma-separated string containing the paths to the manifest files.
+
+    Example:
+        # Usage of the offset_manifest_files function
+        inference_files = offset_manifest_files("sampled_config_60mins/", "chunked_audio/")
+        predicted_labels, ground_truth_labels = model_eval(inference_files)
+    """
+    annote_dict = Annotations(sampled_data_path).annotations_loader()
+    annote_dict = {key: value for key, value in annote_dict.items() if value}
+    if shard is not None:
+        annote_dict = shard.select(annote_dict)
+    writer = OffsetManifestWriter(annote_dict, durations=durations)
+    json_files = writer.write_manifests(manifest_folder_path=save_to_folder)
+    return ','.join(json_files)
+
+def read_chunked_audio_files(data_folder_head,annote,keys=None):
     """Reads and prepares the chunked audio files for inference.
 
     This function reads the chunked audio files generated by the 'ReadTrim' class in the specified 'data_folder_head'
-    directory. It prepares the list of JSON files containing annotation data to be used for inference.
+    directory. It prepares the list of JSON files containing annotation data to be used for inference. Only the
+    '*_manifest.json' files are collected, other JSON files of the folder such as the build state are not manifests.
 
     Args:
         data_folder_head (str): The path to the folder where the chunked audio files are saved.
         annote (Annotations): An instance of the Annotations class containing annotation data.
+        keys (set, optional): Only the manifests of these annotation keys are rewritten, the others are kept
+                              when they exist. Defaults to None, rewriting every manifest.
 
     Returns:
         str: A comma-separated string containing the paths to the JSON files containing annotation data.
@@ -98,23 +176,78 @@ def read_chunked_audio_files(data_folder_head,annote):
     """
     read_trim = ReadTrim(data_folder_head, annote)
     read_trim.handle_generated_folders(
-        duration=5, manifest_folder_path=data_folder_head # Chunk size seconds
+        duration=5, manifest_folder_path=data_folder_head, keys=keys # Chunk size seconds
     )
-    json_files = [os.path.join(data_folder_head,file) for file in os.listdir(data_folder_head) if ".json" in file]
+    json_files = [os.path.join(data_folder_head,file) for file in os.listdir(data_folder_head) if file.endswith("_manifest.json")]
     inference_files = ','.join(json_files)
     return inference_files
 
-def model_eval(inference_files = None,save_to_folder = None):
+def _save_chunk_posteriors(posteriors_path, logits, labels, speech_index):
+    """Saves the speech posterior and 0/1 label of every chunk for evaluation.threshold_sweep."""
+    save_posteriors(
+        posteriors_path,
+        {"chunks": torch.softmax(logits, dim=1)[:, speech_index].cpu().numpy()},
+        {"chunks": (labels == speech_index).cpu().numpy()},
+    )
+
+def _entry_window(entry):
+    """Recording id, start and end in seconds of a manifest entry. Chunk WAVs written by chunking are named
+    '<recording>__<start>-<end>.wav', other entries are windows of their audio file at 'offset'."""
+    stem = os.path.splitext(basename(entry["audio_filepath"]))[0]
+    recording_id, _, timing = stem.rpartition("__")
+    if recording_id:
+        try:
+            start, end = (float(value) for value in timing.split("-"))
+            return recording_id, start, end
+        except ValueError:
+            pass
+    offset = entry.get("offset") or 0.0
+    return stem, offset, offset + (entry.get("duration") or 0.0)
+
+def _append_manifest_results(results, inference_files, logits, labels, speech_index):
+    """Appends the results of every manifest entry to a RunWriter, grouped by recording."""
+    entries = read_manifests(inference_files)
+    if len(entries) != len(logits):
+        logging.warning(f"{len(logits)} logits for {len(entries)} manifest entries, results are not saved")
+        return
+    logits = logits.cpu()
+    probs = torch.softmax(logits, dim=1)[:, speech_index].numpy()
+    preds = logits.argmax(dim=1).numpy()
+    labels = labels.cpu().numpy()
+    windows = [_entry_window(entry) for entry in entries]
+    first = 0
+    for row in range(1, len(windows) + 1):
+        # rows of a recording are appended together
+        if row == len(windows) or windows[row][0] != windows[first][0]:
+            results.append(
+                windows[first][0],
+                [start for _, start, _ in windows[first:row]],
+                [end for _, _, end in windows[first:row]],
+                probs[first:row], preds[first:row], labels[first:row], logits[first:row].numpy(),
+            )
+            first = row
+
+def model_eval(inference_files = None,save_to_folder = None,options = None,posteriors_path = None,results = None):
     """Evaluate the MarbleNet Lite model on the provided audio files.
 
     This function evaluates the MarbleNet Lite model on the chunked audio files specified in the 'inference_files'.
     The model is loaded from the './MarbleNet-3x2x64.nemo' checkpoint file and then tested on the provided audio data.
     The evaluation results are logged, and the predicted labels and ground truth labels are returned.
 
+    How the model runs is set by 'options', see InferenceOptions: the NeMo test dataloader by default, a FeatureCache,
+    an InferencePipeline, or DataParallelInference when options.processes > 1. In the latter case only the config of
+    the checkpoint is read in this process, every worker process restores its own model.
+
     Args:
         inference_files (str): A comma-separated string containing the paths to JSON files with annotation data
                                 for the chunked audio files used for inference.
         save_to_folder (str): The path to the folder where the chunked audio files are saved.
+        options (InferenceOptions, optional): Quantization, feature cache, pipeline and process options, validated
+                                              together. Defaults to None, InferenceOptions().
+        posteriors_path (str, optional): Saves the speech posterior of every chunk there, see save_posteriors, so that
+                                         the threshold can be tuned with evaluation.threshold_sweep. Defaults to None.
+        results (RunWriter, optional): Run of a ResultsStore the recording, window, logits, probability, label and
+                                       prediction of every chunk are appended to. Defaults to None.
 
     Returns:
         torch.Tensor: A tensor containing the predicted labels.
@@ -125,7 +258,10 @@ def model_eval(inference_files = None,save_to_folder = None):
         inference_files = "file1.json,file2.json,file3.json"
         save_to_folder = "chunked_audio/"
         predicted_labels, ground_truth_labels = model_eval(inference_files, save_to_folder)
+        options = InferenceOptions(pipeline_workers=8, max_batch_samples=320 * 10080, processes=4)
+        predicted_labels, ground_truth_labels = model_eval(inference_files, save_to_folder, options)
     """
+    options = options or InferenceOptions()
     config_path = (
         "./marblenet_lite.yaml"
     )
@@ -133,20 +269,168 @@ def model_eval(inference_files = None,save_to_folder = None):
     config = OmegaConf.to_container(config, resolve=True)
     config = OmegaConf.create(config)
     config.model.test_ds.manifest_filepath = inference_files
-    model = nemo_asr.models.EncDecClassificationModel.restore_from(restore_path="./MarbleNet-3x2x64.nemo")
-    # model.cfg.labels = config.model.labels
-    model.setup_test_data(config.model.test_ds)
-    test_dl = model._test_dl
-    vad_model = model.cpu()
-    vad_model.eval()
+    batch_size = config.model.test_ds.batch_size
+    if options.mode == "data_parallel":
+        # the workers restore and quantize their own copies, labels and sample rate are enough here
+        model = load_model_config()
+    else:
+        model = load_model()
+    calibration = None
+    if options.quantize == "static":
+        calibration = calibration_windows(inference_files, round(CHUNK_DURATION * model.cfg.sample_rate))
+    if options.quantize and options.mode != "data_parallel":
+        model = quantize_model(model, options.quantize, calibration)
+    if options.mode == "feature_cache":
+        logits, labels = cached_logits(
+            model, read_manifests(inference_files), FeatureCache(options.feature_cache_dir), batch_size=batch_size,
+        )
+    elif options.mode == "dataloader":
+        # model.cfg.labels = config.model.labels
+        model.setup_test_data(config.model.test_ds)
+        test_dl = model._test_dl
+        with torch.no_grad():
+            logits, labels = extract_logits(model, test_dl)
+    else:
+        entries = read_manifests(inference_files)
+        if options.max_batch_samples:
+            # padding of the bucketed batches against fixed batches of batch_size
+            bucketing_report(entry_lengths(entries,model.cfg.sample_rate),options.max_batch_samples,batch_size)
+        if options.mode == "data_parallel":
+            engine = DataParallelInference(
+                options.processes, options.threads_per_process, batch_size=batch_size,
+                decode_workers=max(options.pipeline_workers // options.processes, 1),
+                max_batch_samples=options.max_batch_samples, quantize=options.quantize, calibration=calibration,
+            )
+            logits, labels = engine.run(entries)
+        else:
+            pipeline = InferencePipeline(
+                model, batch_size=batch_size, decode_workers=options.pipeline_workers,
+                max_batch_samples=options.max_batch_samples,
+            )
+            logits, labels = pipeline.run(entries)
     with torch.no_grad():
-        logits, labels = extract_logits(vad_model, test_dl)
+        if posteriors_path:
+            _save_chunk_posteriors(posteriors_path, logits, labels, speech_label_index(model))
+        if results is not None:
+            results.set_model(model)
+            _append_manifest_results(results, inference_files, logits, labels, speech_label_index(model))
         _, pred = logits.topk(1, dim=1, largest=True, sorted=True)
         pred = pred.squeeze()
         metric = ConfusionMatrix(num_classes=2, task='binary')
         logging.info(metric(pred, labels))
         return pred, labels
 
+def model_eval_in_memory(in_memory_chunks, annote_dict, batch_size=320, posteriors_path=None, results=None):
+    """Evaluate the MarbleNet Lite model on chunks held in memory.
+
+    This is the in-memory counterpart of model_eval. The chunks produced by
+    SoundfileWrapper.segmentation_loader(write_chunks=False) are passed to the model directly as
+    tensor batches, so no chunk WAV or manifest is read from disk. Ground truth labels are derived
+    from the chunk timings and the speech segments of each recording.
+
+    Args:
+        in_memory_chunks (dict): {annotation_key: {file_id: snippet_info}} as returned by chunking
+                                 with write_chunks=False.
+        annote_dict (dict): A dictionary containing the loaded annotations with non-empty values.
+        batch_size (int, optional): Number of chunks per forward pass. Defaults to 320.
+        posteriors_path (str, optional): Saves the speech posterior of every chunk there, per recording in time order,
+                                         see save_posteriors. Defaults to None.
+        results (RunWriter, optional): Run of a ResultsStore the recording, window, logits, probability, label and
+                                       prediction of every chunk are appended to. Defaults to None.
+
+    Returns:
+        torch.Tensor: A tensor containing the predicted labels.
+        torch.Tensor: A tensor containing the ground truth labels.
+
+    Example:
+        # Usage of the model_eval_in_memory function
+        in_memory_chunks, annote_dict = chunking(sample_path, save_path, write_chunks=False)
+        predicted_labels, ground_truth_labels = model_eval_in_memory(in_memory_chunks, annote_dict)
+    """
+    vad_model = load_model()
+    speech_index = speech_label_index(vad_model)
+    if results is not None:
+        results.set_model(vad_model)
+    pred_buffer = []
+    label_buffer = []
+    chunk_probs = {}
+    chunk_labels = {}
+    for annotation_key, recordings in in_memory_chunks.items():
+        for file_id, snippet_info in recordings.items():
+            speech_segments = annote_dict[annotation_key][file_id]["segments"]
+            logits = infer_chunks(vad_model, snippet_info["snippets"], batch_size)
+            _, pred = logits.topk(1, dim=1, largest=True, sorted=True)
+            overlaps, _ = AudioUtils.label_windows(snippet_info["timings"], speech_segments)
+            labels = np.where(overlaps, speech_index, 1 - speech_index)
+            recording_id = f"{annotation_key}/{file_id}"
+            probs = torch.softmax(logits, dim=1)[:, speech_index].numpy()
+            if posteriors_path:
+                chunk_probs[recording_id] = probs
+                chunk_labels[recording_id] = overlaps
+            if results is not None:
+                timings = np.asarray(snippet_info["timings"])
+                results.append(
+                    recording_id, timings[:, 0], timings[:, 1], probs,
+                    pred.squeeze(1).numpy(), labels, logits.numpy(),
+                )
+            pred_buffer.append(pred.squeeze(1))
+            label_buffer.append(torch.from_numpy(labels))
+    if posteriors_path:
+        save_posteriors(posteriors_path, chunk_probs, chunk_labels)
+    pred = torch.cat(pred_buffer, 0)
+    labels = torch.cat(label_buffer, 0)
+    metric = ConfusionMatrix(num_classes=2, task='binary')
+    logging.info(metric(pred, labels))
+    return pred, labels
+
+def model_eval_sliding_window(annote_dict, window=0.63, shift=0.01, smoothing="mean", batch_size=320, posteriors_path=None, collar=0.0):
+    """Compute a per-frame speech probability track for every recording with overlapping windows.
+
+    Instead of one hard label per non-overlapping chunk, every recording is classified with windows of
+    'window' seconds shifted by 'shift' seconds, and the overlapping window posteriors are aggregated
+    into one speech probability per frame of 'shift' seconds.
+
+    Args:
+        annote_dict (dict): A dictionary containing the loaded annotations with non-empty values.
+        window (float, optional): Window length in seconds. Defaults to 0.63.
+        shift (float, optional): Window shift and frame length in seconds. Defaults to 0.01.
+        smoothing (str, optional): 'mean' or 'median' aggregation of overlapping windows. Defaults to "mean".
+        batch_size (int, optional): Number of windows per forward pass. Defaults to 320.
+        posteriors_path (str, optional): Saves the frame probabilities there with the frame labels of the annotated
+                                         speech segments, see save_posteriors, for evaluation.threshold_sweep.
+                                         Defaults to None.
+        collar (float, optional): Frames within 'collar' seconds of an annotated boundary are saved as not scored.
+                                  Defaults to 0.0.
+
+    Returns:
+        dict: {annotation_key: {file_id: numpy.ndarray}} of speech probability per frame.
+
+    Example:
+        # Usage of the model_eval_sliding_window function
+        annote_dict = Annotations("sampled_config_60mins/").annotations_loader()
+        frame_probs = model_eval_sliding_window(annote_dict, window=0.63, shift=0.01)
+    """
+    vad_model = load_model()
+    frame_probs = {}
+    saved_probs = {}
+    saved_labels = {}
+    frame_shift = shift
+    for annotation_key, recordings in annote_dict.items():
+        for file_id, recording in recordings.items():
+            probs, frame_shift = recording_speech_probs(
+                vad_model, recording["audio_path"], window, shift, smoothing, batch_size
+            )
+            frame_probs.setdefault(annotation_key, {})[file_id] = probs
+            if posteriors_path:
+                recording_id = f"{annotation_key}/{file_id}"
+                saved_probs[recording_id] = probs
+                saved_labels[recording_id] = reference_frame_labels(
+                    recording["segments"], len(probs), frame_shift, collar
+                )
+    if posteriors_path:
+        save_posteriors(posteriors_path, saved_probs, saved_labels, frame_shift)
+    return frame_probs
+
 class ReverseMapLabel:
     """Helper class to map prediction and label indices back to their original labels.
 
@@ -178,94 +462,67 @@ class ReverseMapLabel:
     def __call__(self, pred_idx, label_idx):
         return self.id2label[pred_idx], self.id2label[label_idx]
 
-def extract_logits(model, dataloader):
-    """Extract logits from the model for each batch in the dataloader.
-
-    This function processes the data in 'dataloader' in batches using the provided 'model'
-    and extracts the logits (model's raw outputs) for each batch. It also collects the corresponding
-    ground truth labels from the dataloader.
-
-    Args:
-        model (torch.nn.Module): The model to use for inference.
-        dataloader (torch.utils.data.DataLoader): The DataLoader containing the data for inference.
-
-    Returns:
-        torch.Tensor: A tensor containing the concatenated logits for all batches.
-        torch.Tensor: A tensor containing the concatenated ground truth labels for all batches.
-
-    Example:
-        test_dl = model._test_dl
-        model = model.from_pretrained(model.ckpt)
-        logits, labels = extract_logits(model, test_dl)
-    """
-    logits_buffer = []
-    label_buffer = []
-    count = 0
-    for batch in dataloader:
-        count += 1
-        print(count)
-        audio_signal, audio_signal_len, labels, labels_len = batch
-        logits = model(input_signal=audio_signal, input_signal_length=audio_signal_len)
-        logits_buffer.append(logits)
-        label_buffer.append(labels)
-    print()
-
-    logging.info("Finished extracting logits !")
-    logits = torch.cat(logits_buffer, 0)
-    labels = torch.cat(label_buffer, 0)
-    return logits, labels
-
-
 if __name__ == "__main__":
     logging.info("starting inference")
     start_time = time.time()
     # feel free to change the sampled_config_60mins/ to anything other folder of sample you would like to have
     sampled_data_path = "sampled_config_60mins/"
     save_to_folder = "chunked_audio/"
-    inference_files = chunking(sampled_data_path,save_to_folder)
-    pred,labels = model_eval(inference_files,save_to_folder)
+    # "in_memory": chunks are passed to the model directly, nothing is written
+    # "offset_manifest": manifests with offsets into the original recordings, no chunk WAVs
+    # "chunk_files": chunk WAVs and manifests are written to save_to_folder, for debugging
+    chunking_mode = "in_memory"
+    # execution options of the manifest modes, see InferenceOptions; conflicting combinations raise ValueError
+    options = InferenceOptions(
+        # decode, featurize and classify the chunks as concurrent stages, 0 (without max_batch_samples) uses the
+        # NeMo dataloader
+        pipeline_workers=os.cpu_count(),
+        # padded samples per pipeline batch, the memory of 320 windows of 0.63 s whatever the chunk lengths
+        max_batch_samples=320 * 10080,
+        # > 1 splits the chunks across this many processes, each with its own model copy and threads_per_process
+        # torch threads, e.g. os.cpu_count(); worth it for large manifests, every process restores the model first
+        processes=0,
+        threads_per_process=1,
+    )
+    # every run gets its own folder of columnar results in save_to_folder/results, see ResultsStore
+    results_root = os.path.join(save_to_folder,"results")
+    # in a PBS array job (inference_array.pbs) only the recordings of this job's shard are classified, in its own
+    # folder, and `python -m src.vad.cli merge chunked_audio/shards/<job id>/results` scores the whole corpus
+    shard = Shard.from_environment()
+    if shard is not None:
+        results_root = os.path.join(save_to_folder,"shards",shard.job_id,"results")
+        save_to_folder = os.path.join(save_to_folder,"shards",shard.job_id,shard.name)
+        os.makedirs(save_to_folder,exist_ok=True)
+    # speech posteriors of every chunk, to tune the threshold with `python -m src.vad.cli sweep`
+    posteriors_path = os.path.join(save_to_folder,"posteriors.npz")
+    results_store = ResultsStore(results_root)
+    run = results_store.new_run(
+        model_path="./MarbleNet-3x2x64.nemo", chunking_mode=chunking_mode, sampled_data_path=sampled_data_path,
+        shard=shard.as_dict() if shard is not None else None,
+        options=options.as_dict() if chunking_mode != "in_memory" else None,
+    )
+    if chunking_mode == "chunk_files":
+        inference_files = chunking(sampled_data_path,save_to_folder,num_workers=os.cpu_count(),shard=shard)
+        pred,labels = model_eval(inference_files,save_to_folder,options,posteriors_path=posteriors_path,results=run)
+    elif chunking_mode == "offset_manifest":
+        inference_files = offset_manifest_files(sampled_data_path,save_to_folder,shard=shard)
+        pred,labels = model_eval(inference_files,save_to_folder,options,posteriors_path=posteriors_path,results=run)
+    else:
+        in_memory_chunks, annote_dict = chunking(sampled_data_path,save_to_folder,write_chunks=False,num_workers=os.cpu_count(),shard=shard)
+        pred,labels = model_eval_in_memory(in_memory_chunks, annote_dict, posteriors_path=posteriors_path, results=run)
     time_now = time.time()
     time_used = time_now - start_time
     logging.info(f"time used = {time_used} seconds")
-    pred_list = pred.tolist()
-    label_list = labels.tolist()
-    labels_pred = [(lab,pre) for lab,pre in zip(label_list,pred_list)]
-    with open(os.path.join(save_to_folder,"result.txt"),'a') as r:
-        r.write("label,Pred \n")
-        for line in labels_pred:
-            r.write(f"{line[0]},{line[1]}\n")
-    
-    from sklearn.metrics import roc_auc_score
-
-    # Read the file and parse the data
-    with open(os.path.join(save_to_folder,"result.txt"),'r') as file:
-        lines = file.readlines()
-
-    actual_labels = []
-    predicted_labels = []
-    for line in lines[1:]:  # Skip the header line
-        parts = line.strip().split(',')
-        actual_labels.append(int(parts[0]))
-        predicted_labels.append(int(parts[1]))
-
-    # Calculate accuracy
-    accuracy = sum(1 for true, pred in zip(actual_labels, predicted_labels) if true == pred) / len(actual_labels)
-
-    # Calculate false alarm rate (FAR)
-    false_positives = sum(1 for true, pred in zip(actual_labels, predicted_labels) if pred == 1 and true == 0)
-    total_negatives = sum(1 for label in actual_labels if label == 0)
-    FAR = false_positives / total_negatives
-
-    # Calculate missed detection rate (MDR)
-    false_negatives = sum(1 for true, pred in zip(actual_labels, predicted_labels) if pred == 0 and true == 1)
-    total_positives = sum(1 for label in actual_labels if label == 1)
-    MDR = false_negatives / total_positives
-
-    # Calculate ROC-AUC
-    roc_auc = roc_auc_score(actual_labels, predicted_labels)
+
+    run.close(seconds=time_used)
+    columns, _ = results_store.load(run.run_id)
+    if len(columns.get("label", [])) != len(labels):
+        # the manifest entries did not line up with the logits, score the returned tensors
+        columns = {"label": labels.numpy(), "pred": pred.numpy()}
+    metrics = chunk_metrics(columns["label"], columns["pred"], columns.get("prob"))
 
     # Print results
-    print("Accuracy:", accuracy)
-    print("False Alarm Rate (FAR):", FAR)
-    print("Missed Detection Rate (MDR):", MDR)
-    print("ROC-AUC:", roc_auc)
+    print("Accuracy:", metrics["accuracy"])
+    print("False Alarm Rate (FAR):", metrics["far"])
+    print("Missed Detection Rate (MDR):", metrics["mdr"])
+    print("ROC-AUC:", metrics["roc_auc"])
@@ -1,7 +1,88 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 
 class AudioUtils:
+    @staticmethod
+    def frame_signal(signal, window_len, hop_len=None, number_of_windows=None):
+        """
+        Frames a 1D signal into windows in one shot, without a Python loop over windows
+
+        The windows are a strided view over a single buffer. The buffer is the signal itself when
+        it is long enough, otherwise the signal is copied once into a zero-padded buffer.
+        The returned array is read-only.
+
+        Args:
+            signal (numpy.ndarray): 1D signal.
+            window_len (int): The number of samples of a window.
+            hop_len (int, optional): The number of samples between the starts of two consecutive
+                windows. Windows overlap when it is smaller than window_len. Defaults to window_len.
+            number_of_windows (int, optional): The number of windows to return. Missing samples
+                at the end are zero padded and extra samples are dropped. Defaults to the number
+                of windows needed to cover the whole signal.
+
+        Returns:
+            numpy.ndarray: Array of shape (number_of_windows, window_len).
+
+        Examples:
+            >>> AudioUtils.frame_signal(np.arange(7), 3, 2)
+            array([[0, 1, 2],
+                   [2, 3, 4],
+                   [4, 5, 6]])
+        """
+        hop_len = hop_len or window_len
+        if number_of_windows is None:
+            number_of_windows = AudioUtils.count_windows(len(signal), window_len, hop_len)
+        if number_of_windows <= 0:
+            return np.zeros((0, window_len), dtype=signal.dtype)
+
+        needed_len = (number_of_windows - 1) * hop_len + window_len
+        if len(signal) >= needed_len:
+            buffer = signal[:needed_len]
+        else:
+            buffer = np.zeros(needed_len, dtype=signal.dtype)
+            buffer[: len(signal)] = signal
+        return sliding_window_view(buffer, window_len)[::hop_len]
+
+    @staticmethod
+    def count_windows(signal_len, window_len, hop_len):
+        """
+        Number of windows needed to cover signal_len samples, the last window being zero padded
+
+        Args:
+            signal_len (int): The number of samples of the signal.
+            window_len (int): The number of samples of a window.
+            hop_len (int): The number of samples between the starts of two consecutive windows.
+
+        Returns:
+            int: The number of windows.
+        """
+        if signal_len <= 0:
+            return 0
+        return -(-max(signal_len - window_len, 0) // hop_len) + 1
+
+    @staticmethod
+    def window_timings(
+        number_of_windows, window_len, hop_len, signal_len, sample_rate, first_window=0
+    ):
+        """
+        Start and end time of windows produced by frame_signal
+
+        Args:
+            number_of_windows (int): The number of windows.
+            window_len (int): The number of samples of a window.
+            hop_len (int): The number of samples between the starts of two consecutive windows.
+            signal_len (int): The number of samples of the signal, window ends are clipped to it.
+            sample_rate (int): The sample rate of the signal.
+            first_window (int, optional): The index of the first window. Defaults to 0.
+
+        Returns:
+            numpy.ndarray: Array of shape (number_of_windows, 2) of start and end times in seconds.
+        """
+        start_samples = np.arange(first_window, first_window + number_of_windows) * hop_len
+        end_samples = np.minimum(start_samples + window_len, signal_len)
+        return np.stack((start_samples, end_samples), axis=1) / sample_rate
+
     @staticmethod
     def check_overlap(left_list, right_list):
         """
@@ -38,6 +119,106 @@ class AudioUtils:
         else:
             return False, 0.0
 
+    @staticmethod
+    def label_windows(timings, segments):
+        """
+        Vectorised check_overlap of every window of a recording, see SegmentIndex
+
+        Args:
+            timings (numpy.ndarray): Array of shape (number_of_windows, 2) of window start and end
+                times, e.g. from AudioUtils.window_timings.
+            segments (list): A list of tuples representing multiple (start_time, end_time) intervals.
+
+        Returns:
+            tuple: A tuple containing two arrays of length number_of_windows:
+                - overlap (numpy.ndarray): check_overlap's overlap of every window.
+                - offset (numpy.ndarray): check_overlap's offset of every window.
+
+        Examples:
+            >>> AudioUtils.label_windows([[0, 1], [1, 2], [3, 4]], [(1.5, 1.8)])
+            (array([False,  True, False]), array([0. , 0.5, 0. ]))
+        """
+        return SegmentIndex(segments).query(timings)
+
+    @staticmethod
+    def frame_labels(
+        segments,
+        duration,
+        sample_rate=16000,
+        frame_duration=0.02,
+        per=0.0,
+        start_time=0.0,
+    ):
+        """
+        Speech labels of every frame of a recording, computed from the segment boundaries
+
+        Sample i of the recording is speech when a segment covers it, i.e.
+        round(start * sample_rate) <= i < round(end * sample_rate). The number of speech samples
+        of every frame comes from a cumulative speech count evaluated at the frame boundaries
+        with np.searchsorted, so no per-sample array is built and the cost depends on the number
+        of frames and segments only. The last frame is zero padded up to frame_duration.
+
+        Args:
+            segments (list): A list of tuples representing multiple (start_time, end_time) intervals.
+            duration (float): Duration in seconds to label, from start_time.
+            sample_rate (int): sample rate of audio default 16000
+            frame_duration (float): default 20 ms i.e. 0.02s duration (usually in s) of a frame
+            per (float): a frame is speech when more than this fraction of its samples is speech,
+                defaults to 0 i.e. any speech sample
+            start_time (float): start in seconds of the first frame in the recording, defaults to 0
+
+        Returns:
+            numpy.ndarray: uint8 array of 1 for speech and 0 for non-speech frames, of length
+                ceil(duration / frame_duration).
+
+        Examples:
+            >>> AudioUtils.frame_labels([(0.01, 0.03), (0.09, 0.095)], 0.1, per=0.4)
+            array([1, 1, 0, 0, 0], dtype=uint8)
+        """
+        frame_len = int(round(frame_duration * sample_rate))
+        first_sample = int(round(start_time * sample_rate))
+        number_of_samples = int(round(duration * sample_rate))
+        number_of_frames = -(-number_of_samples // frame_len)
+
+        segments = np.asarray(segments, dtype=float).reshape(-1, 2)
+        starts = np.clip(
+            np.round(segments[:, 0] * sample_rate) - first_sample, 0, number_of_samples
+        )
+        ends = np.clip(
+            np.round(segments[:, 1] * sample_rate) - first_sample, 0, number_of_samples
+        )
+        keep = ends > starts
+        starts, ends = starts[keep], ends[keep]
+        if not len(starts):
+            return np.zeros(number_of_frames, dtype=np.uint8)
+
+        # merge overlapping segments so that speech samples are counted once
+        order = np.argsort(starts, kind="stable")
+        starts, ends = starts[order], np.maximum.accumulate(ends[order])
+        new_run = np.ones(len(starts), dtype=bool)
+        new_run[1:] = starts[1:] > ends[:-1]
+        run_ids = np.cumsum(new_run) - 1
+        run_starts = starts[new_run]
+        run_ends = np.zeros(len(run_starts))
+        np.maximum.at(run_ends, run_ids, ends)
+
+        # speech samples before every frame boundary
+        speech_before_run = np.concatenate(([0.0], np.cumsum(run_ends - run_starts)))
+        boundaries = np.minimum(
+            np.arange(number_of_frames + 1) * frame_len, number_of_samples
+        )
+        run = np.searchsorted(run_starts, boundaries, side="right") - 1
+        run_clipped = np.maximum(run, 0)
+        inside = np.clip(
+            boundaries - run_starts[run_clipped],
+            0,
+            run_ends[run_clipped] - run_starts[run_clipped],
+        )
+        cumulative = np.where(run >= 0, speech_before_run[run_clipped] + inside, 0.0)
+
+        speech_fraction = np.diff(cumulative) / frame_len
+        return (speech_fraction > float(per)).astype(np.uint8)
+
     @staticmethod
     def get_label_frame(
         left_list, right_list, sample_rate=16000, frame_duration=0.02, per=0
@@ -45,85 +226,109 @@ class AudioUtils:
         """
         Get labels for time intervals, for frame vad
 
+        Kept for the manifest label format, see AudioUtils.frame_labels.
+
         Args:
             left_list (list): A list in the format [start_time, end_time].
             right_list (list): A list of tuples representing multiple (start_time, end_time) intervals.
             sample_rate (int): sample rate of audio default 16000
             frame_duration (float): default 20 ms i.e. 0.02s duration (usually in s) of a frame
-            per (float): minimum percentage of 1 in a frame to be considered as speech defaults to 0.5
+            per (float): minimum percentage of 1 in a frame to be considered as speech defaults to 0
 
         Returns:
-            tuple: A tuple containing two values:
-                - overlap (bool): True if there is an overlap, False otherwise.
-                - offset (float or None): The offset between the start time of the left interval and the
-                  correctly identified segment in the right intervals. If no overlap is found, None is returned.
+            str: space separated 0/1 label of every frame of the interval.
         """
         start_time_left = float(left_list[0])
         end_time_left = float(left_list[1])
-        duration = (end_time_left - start_time_left) * sample_rate
-        duration = int(duration)
-
-        data_point_per_frame = int(frame_duration * sample_rate)
-        impt_tuples = list(
-            filter(
-                lambda x: not (x[1] <= start_time_left) | (x[0] >= end_time_left),
-                right_list,
-            )
+        labels = AudioUtils.frame_labels(
+            right_list,
+            end_time_left - start_time_left,
+            sample_rate=sample_rate,
+            frame_duration=frame_duration,
+            per=per,
+            start_time=start_time_left,
         )
-        if impt_tuples:
-            impt_tuples.sort(key=lambda x: x[0])
-            try:
-                if impt_tuples[0][0] < start_time_left:
-                    impt_tuples[0] = (start_time_left, impt_tuples[0][1])
-                if impt_tuples[-1][-1] > end_time_left:
-                    impt_tuples[-1] = (impt_tuples[-1][0], end_time_left)
-            except Exception as e:
-                print(e)
-
-            array_init = np.zeros(duration)
-            try:
-                for seg in impt_tuples:
-                    idx_left_no_adjust = (
-                        0 if seg[0] == 0 else (seg[0] * sample_rate) - 1
-                    )
-                    idx_right_no_adjust = seg[1] * sample_rate
-                    idx_left_adjusted = (
-                        0
-                        if idx_left_no_adjust == 0
-                        else idx_left_no_adjust - (start_time_left * 16000 - 1)
-                    )
-                    idx_right_adjusted = idx_right_no_adjust - (start_time_left * 16000)
-                    array_init[int(idx_left_adjusted) : int(idx_right_adjusted)] = 1
-            except Exception as e:
-                print(f"seg failed with {e}")
-
-            if len(array_init) % data_point_per_frame > 0:
-                pad_to_be_added = data_point_per_frame - (
-                    len(array_init) % data_point_per_frame
-                )
-            else:
-                pad_to_be_added = 0
-            if pad_to_be_added > 0:
-                array_padded = np.pad(
-                    array_init, (0, pad_to_be_added), "constant", constant_values=0
-                )
-            else:
-                array_padded = array_init
-            mean_per_row = array_padded.reshape(-1, data_point_per_frame).mean(axis=1)
-            try:
-                per = float(per)
-            except Exception as e:
-                try:
-                    print(f"per of {str(per)} can't be converted to float due to {e}")
-                    print(
-                        "min percentage count of 1 in frame to be considered speech defaults to 0"
-                    )
-                    per = 0
-                except Exception as error:
-                    print(error)
-            labels = np.where(mean_per_row > per, 1, 0)
-            labels = labels.tolist()
-            str_form_labels = " ".join(map(str, labels))
+        return " ".join(map(str, labels.tolist()))
+
+
+class SegmentIndex:
+    """
+    Interval index over the speech segments of one recording
+
+    Built once per recording, it answers AudioUtils.check_overlap for any number of windows at once.
+    The segments are sorted by start time, and the running maximum of their end times makes the
+    first segment ending after a time a single np.searchsorted, so labelling W windows against S
+    segments costs O((W + S) log S) instead of O(W * S).
+
+    Args:
+        segments (list): A list of tuples representing multiple (start_time, end_time) intervals.
+
+    Examples:
+        >>> index = SegmentIndex([(1.5, 1.8), (5.0, 6.0)])
+        >>> index.query([[0, 1], [1, 2], [4.5, 5.5]])
+        (array([False,  True,  True]), array([0. , 0.5, 0.5]))
+    """
+
+    def __init__(self, segments):
+        segments = np.asarray(segments, dtype=float).reshape(-1, 2)
+        # stable, so segments starting together keep the order check_overlap sees them in
+        order = np.argsort(segments[:, 0], kind="stable")
+        self.segments = segments
+        self.starts = segments[order, 0]
+        self.ends = segments[order, 1]
+        self.running_max_ends = np.maximum.accumulate(self.ends)
+        # check_overlap reports the first overlapping segment in list order, which is the first
+        # in start order only when the segments are sorted
+        self.is_sorted = bool(np.all(order == np.arange(len(order))))
+
+    def query(self, timings):
+        """
+        check_overlap of every window
+
+        Args:
+            timings (numpy.ndarray): Array of shape (number_of_windows, 2) of window start and end
+                times.
+
+        Returns:
+            tuple: A tuple containing two arrays of length number_of_windows:
+                - overlap (numpy.ndarray): True where the window overlaps a segment.
+                - offset (numpy.ndarray): The offset between the start time of the window and the
+                  first overlapping segment, 0.0 when it starts before the window or no segment
+                  overlaps.
+        """
+        timings = np.asarray(timings, dtype=float).reshape(-1, 2)
+        window_starts = timings[:, 0]
+        window_ends = timings[:, 1]
+        offsets = np.zeros(len(timings))
+        if not len(self.starts):
+            return np.zeros(len(timings), dtype=bool), offsets
+
+        # segments starting at or before the window end are a prefix of the sorted segments
+        candidates = np.searchsorted(self.starts, window_ends, side="right")
+        # first segment ending at or after the window start
+        first = np.searchsorted(self.running_max_ends, window_starts, side="left")
+        overlap = first < candidates
+
+        if self.is_sorted:
+            segment_starts = self.starts[
+                np.minimum(first[overlap], len(self.starts) - 1)
+            ]
         else:
-            str_form_labels = " ".join(["0"] * 50)
-        return str_form_labels
+            segment_starts = np.array(
+                [
+                    self._first_in_list_order(start, end)
+                    for start, end in timings[overlap]
+                ]
+            )
+        differences = segment_starts - window_starts[overlap]
+        offsets[overlap] = [
+            round(difference, 2) if difference > 0 else 0.0
+            for difference in differences.tolist()
+        ]
+        return overlap, offsets
+
+    def _first_in_list_order(self, window_start, window_end):
+        overlapping = np.flatnonzero(
+            (self.segments[:, 1] >= window_start) & (self.segments[:, 0] <= window_end)
+        )
+        return self.segments[overlapping[0], 0]
@@ -1,6 +1,7 @@
+import glob
 import os
 import shutil
-from os.path import isdir, join
+from os.path import isdir, isfile, join
 
 import numpy as np
 
@@ -57,6 +58,42 @@ class FolderUtils:
         }
         return annotation_dict_compatible_key, dictionary_of_files
 
+    @staticmethod
+    def collect_audio_files(inputs, extensions=(".wav", ".flac")):
+        """
+        Collects audio files from directories, glob patterns, file lists and audio files.
+
+        Args:
+            inputs (list): Each item is either
+                - a directory, searched recursively for audio files,
+                - a glob pattern e.g. "data/**/*.wav",
+                - a text file (.txt or .lst) with one audio path per line,
+                - an audio file.
+            extensions (tuple, optional): Audio file extensions to keep from directories.
+                Defaults to (".wav", ".flac").
+
+        Returns:
+            list: Audio file paths, sorted within each input, without duplicates.
+        """
+        audio_files = []
+        for item in inputs:
+            if isdir(item):
+                found = [
+                    join(root, filename)
+                    for root, _, filenames in os.walk(item)
+                    for filename in filenames
+                    if filename.lower().endswith(extensions)
+                ]
+            elif isfile(item) and item.lower().endswith((".txt", ".lst")):
+                with open(item, "r", encoding="UTF-8") as file_list:
+                    found = [line.strip() for line in file_list if line.strip()]
+            elif isfile(item):
+                found = [item]
+            else:
+                found = glob.glob(item, recursive=True)
+            audio_files.extend(sorted(found))
+        return list(dict.fromkeys(audio_files))
+
     @staticmethod
     def remove_folders_with_files(folder_path):
         """
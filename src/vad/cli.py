@@ -0,0 +1,597 @@
+"""Command line interface of the VAD pipeline.
+
+Usage:
+    python -m src.vad.cli infer <audio dir | glob | file list | audio file> ... [options]
+    python -m src.vad.cli serve [--port PORT | --unix-socket PATH] [options]
+    python -m src.vad.cli export <output .onnx | .ts> [--verify] [options]
+    python -m src.vad.cli quantize <manifest.json,...> [--mode dynamic|static] [options]
+    python -m src.vad.cli evaluate <reference rttm dir> <hypothesis rttm dir> [options]
+    python -m src.vad.cli sweep <posteriors.npz> [--smoothing mean:1,median:25] [options]
+    python -m src.vad.cli merge <shard results dir> [--posteriors shard-*/posteriors.npz] [options]
+
+`infer` runs MarbleNet over audio without any RTTM annotation and writes
+the speech segments of every recording as soon as it is processed.
+`serve` keeps MarbleNet loaded in a local server, which `infer --server`
+submits to instead of restoring the model itself.
+`export` converts the .nemo checkpoint to ONNX or TorchScript, which
+`--model` of `infer` and `serve` accepts in place of the checkpoint.
+`quantize` compares the INT8 model with the fp32 model on manifests,
+`--quantize` of `infer` and `serve` runs the INT8 model instead.
+`evaluate` scores the RTTM files written by `infer` against reference
+RTTM files, frame by frame.
+`sweep` scores posteriors saved by marblenet_infer.py over a grid of
+thresholds and smoothing settings, and picks the threshold meeting a
+target false alarm rate.
+`merge` combines the results saved by the jobs of a PBS array job, each
+classifying one shard of the recordings, into the metrics of the whole
+corpus.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import soundfile as sf
+
+from src.folder_audio_utils.folder_management import FolderUtils
+from src.vad.data_prep import speech_segments as sseg
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ("rttm", "json", "csv")
+
+
+def _decode(audio_file):
+    return sf.read(audio_file, dtype="float32")
+
+
+def _prefetch(function, items, workers):
+    """Applies `function` to `items` in a thread pool, keeping at most
+    `workers` items in flight, and yields (item, result, error) in the
+    order of `items`.
+    """
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        pending = []
+        items = iter(items)
+        for item in items:
+            pending.append((item, executor.submit(function, item)))
+            if len(pending) >= workers:
+                break
+        while pending:
+            item, future = pending.pop(0)
+            next_item = next(items, None)
+            if next_item is not None:
+                pending.append((next_item, executor.submit(function, next_item)))
+            try:
+                yield item, future.result(), None
+            except Exception as error:
+                yield item, None, error
+
+
+def _write_segments(args, audio_file, segments, json_file):
+    file_id = Path(audio_file).stem
+    if args.output_format == "rttm":
+        sseg.write_rttm(
+            segments, os.path.join(args.output_dir, f"{file_id}.rttm"), file_id=file_id
+        )
+    elif args.output_format == "csv":
+        with open(
+            os.path.join(args.output_dir, f"{file_id}.csv"), "w", encoding="UTF-8"
+        ) as outfile:
+            outfile.write("start,end\n")
+            for start, end in segments:
+                outfile.write(f"{start},{end}\n")
+    else:
+        json.dump({"audio_filepath": audio_file, "segments": segments}, json_file)
+        json_file.write("\n")
+        json_file.flush()
+
+
+def _duplicate_stems(audio_files):
+    """Stems shared by several audio files, whose .rttm/.csv outputs,
+    named by the stem, would overwrite each other."""
+    paths_by_stem = {}
+    for audio_file in audio_files:
+        paths_by_stem.setdefault(Path(audio_file).stem, []).append(audio_file)
+    return {stem: paths for stem, paths in paths_by_stem.items() if len(paths) > 1}
+
+
+def _postprocessing_options(args):
+    return {
+        "onset": args.onset,
+        "offset": args.offset,
+        "pad_onset": args.pad_onset,
+        "pad_offset": args.pad_offset,
+        "min_duration_on": args.min_duration_on,
+        "min_duration_off": args.min_duration_off,
+    }
+
+
+def _load_model(args):
+    """Restores `--model`, quantized to INT8 when `--quantize` is set."""
+    from src.vad.inference.marblenet_model import load_model
+
+    model = load_model(args.model)
+    if not args.quantize:
+        return model
+
+    from src.vad.inference.quantization import calibration_windows, quantize_model
+
+    calibration = None
+    if args.quantize == "static":
+        if not args.calibration_manifests:
+            raise ValueError("--quantize static needs --calibration-manifests")
+        calibration = calibration_windows(
+            args.calibration_manifests, round(args.window * model.cfg.sample_rate)
+        )
+    return quantize_model(model, args.quantize, calibration, args.batch_size)
+
+
+def infer_with_server(args, audio_files):
+    """Runs `vad infer --server`, the model is held by a `vad serve`
+    process and the audio files are read by the server."""
+    from src.vad.inference.server import VADClient
+
+    client = VADClient(args.server)
+    if not client.health():
+        logger.error(f"No VAD server answering on {args.server}")
+        return 1
+    options = {
+        "window": args.window,
+        "shift": args.shift,
+        "smoothing": args.smoothing,
+        **_postprocessing_options(args),
+    }
+    json_file = (
+        open(os.path.join(args.output_dir, "segments.jsonl"), "w", encoding="UTF-8")
+        if args.output_format == "json"
+        else None
+    )
+    failed = 0
+    try:
+        for audio_file, response, error in _prefetch(
+            lambda audio_file: client.infer_file(audio_file, **options),
+            audio_files,
+            args.workers,
+        ):
+            if error is not None:
+                failed += 1
+                logger.error(f"inference for {audio_file} failed due to {error}")
+                continue
+            segments = [tuple(segment) for segment in response["segments"]]
+            _write_segments(args, audio_file, segments, json_file)
+            logger.info(f"{audio_file}: {len(segments)} speech segments")
+    finally:
+        if json_file is not None:
+            json_file.close()
+    return 1 if failed else 0
+
+
+def infer(args):
+    """Runs `vad infer`, see `build_parser` for the arguments."""
+    import torch
+
+    from src.vad.inference.postprocessing import probs_to_segments
+    from src.vad.inference.sliding_window import frame_speech_probs
+
+    audio_files = FolderUtils.collect_audio_files(args.inputs)
+    if not audio_files:
+        logger.error(f"No audio file found in {args.inputs}")
+        return 1
+    duplicates = _duplicate_stems(audio_files) if args.output_format != "json" else {}
+    if duplicates:
+        logger.error(
+            f"Audio files with the same name would write the same "
+            f"{args.output_format} file, rename them or use --output-format json: "
+            f"{duplicates}"
+        )
+        return 1
+    logger.info(f"{len(audio_files)} audio files to process")
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.server:
+        return infer_with_server(args, audio_files)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    model = _load_model(args)
+    json_file = (
+        open(os.path.join(args.output_dir, "segments.jsonl"), "w", encoding="UTF-8")
+        if args.output_format == "json"
+        else None
+    )
+    failed = 0
+    start_time = time.time()
+    try:
+        for audio_file, decoded, error in _prefetch(_decode, audio_files, args.workers):
+            if error is not None:
+                failed += 1
+                logger.error(f"decoding {audio_file} failed due to {error}")
+                continue
+            try:
+                signal, sample_rate = decoded
+                if signal.ndim > 1:
+                    signal = signal.mean(axis=1)
+                probs, frame_shift = frame_speech_probs(
+                    model,
+                    signal,
+                    sample_rate,
+                    window=args.window,
+                    shift=args.shift,
+                    smoothing=args.smoothing,
+                    batch_size=args.batch_size,
+                )
+                segments = probs_to_segments(
+                    probs,
+                    frame_shift,
+                    duration=len(signal) / sample_rate,
+                    **_postprocessing_options(args),
+                )
+                _write_segments(args, audio_file, segments, json_file)
+                logger.info(f"{audio_file}: {len(segments)} speech segments")
+            except Exception as error:
+                failed += 1
+                logger.error(f"inference for {audio_file} failed due to {error}")
+    finally:
+        if json_file is not None:
+            json_file.close()
+    logger.info(
+        f"{len(audio_files) - failed}/{len(audio_files)} files processed "
+        f"in {time.time() - start_time:.1f} seconds"
+    )
+    return 1 if failed else 0
+
+
+def serve(args):
+    """Runs `vad serve`, see `build_parser` for the arguments."""
+    import torch
+
+    from src.vad.inference.server import VADService
+    from src.vad.inference.server import serve as serve_forever
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    service = VADService(
+        _load_model(args),
+        batch_size=args.batch_size,
+        max_wait_ms=args.max_wait_ms,
+        latency_target_ms=args.latency_target_ms,
+    )
+    serve_forever(service, args.host, args.port, args.unix_socket)
+    return 0
+
+
+def export(args):
+    """Runs `vad export`, see `build_parser` for the arguments."""
+    from src.vad.inference.export import export_model, verify_export
+
+    export_model(args.output, args.model, args.format, args.window, args.opset)
+    if args.verify:
+        try:
+            verify_export(args.output, args.model, args.manifests, atol=args.atol)
+        except RuntimeError as error:
+            logger.error(error)
+            return 1
+    return 0
+
+
+def quantize(args):
+    """Runs `vad quantize`, see `build_parser` for the arguments."""
+    import torch
+
+    from src.vad.inference.marblenet_model import load_model
+    from src.vad.inference.quantization import quantization_report
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    report = quantization_report(
+        load_model(args.model),
+        args.manifests,
+        mode=args.mode,
+        calibration_files=args.calibration_manifests,
+        n_calibration=args.calibration_windows,
+        window=args.window,
+        batch_size=args.batch_size,
+        output_path=args.output,
+    )
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def evaluate(args):
+    """Runs `vad evaluate`, see `build_parser` for the arguments."""
+    from src.vad.evaluation.frame_metrics import evaluate_segments, read_segments
+
+    references = read_segments(args.references, num_workers=args.workers)
+    hypotheses = read_segments(args.hypotheses, num_workers=args.workers)
+    durations = None
+    if args.audio_dir:
+        durations = {
+            Path(audio_file).stem: sf.info(audio_file).duration
+            for audio_file in FolderUtils.collect_audio_files([args.audio_dir])
+            if Path(audio_file).stem in references
+        }
+    report = evaluate_segments(
+        references,
+        hypotheses,
+        durations,
+        frame_shift=args.frame_shift,
+        collar=args.collar,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="UTF-8") as outfile:
+            json.dump(report, outfile, indent=2)
+    print(json.dumps(report["total"], indent=2))
+    return 0
+
+
+def sweep(args):
+    """Runs `vad sweep`, see `build_parser` for the arguments."""
+    import numpy as np
+
+    from src.vad.evaluation.threshold_sweep import parse_smoothing, sweep_file
+
+    report = sweep_file(
+        args.posteriors,
+        thresholds=np.round(np.arange(0.0, 1.0 + args.step / 2, args.step), 6),
+        smoothing=parse_smoothing(args.smoothing),
+        target_far=args.target_far,
+        output_path=args.output,
+    )
+    print(json.dumps(report["operating_point"], indent=2))
+    return 0 if report["operating_point"] else 1
+
+
+def merge(args):
+    """Runs `vad merge`, see `build_parser` for the arguments."""
+    from src.vad.inference.sharding import merge_posteriors, merge_shards
+
+    report = merge_shards(args.results, output_path=args.output)
+    if args.posteriors:
+        merge_posteriors(args.posteriors, args.posteriors_output)
+    print(
+        json.dumps(
+            {key: report[key] for key in ("count", "missing", "total")}, indent=2
+        )
+    )
+    return 1 if report["missing"] else 0
+
+
+def _add_quantize_arguments(parser):
+    parser.add_argument(
+        "--quantize",
+        choices=("dynamic", "static"),
+        default=None,
+        help="run the .nemo checkpoint with INT8 quantization",
+    )
+    parser.add_argument(
+        "--calibration-manifests",
+        default=None,
+        help="comma-separated manifests to calibrate --quantize static on",
+    )
+
+
+def build_parser():
+    """Builds the argument parser of every `vad` sub command."""
+    parser = argparse.ArgumentParser(prog="vad", description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    infer_parser = subparsers.add_parser(
+        "infer", help="run VAD over audio files without annotations"
+    )
+    infer_parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="audio directories, glob patterns, .txt/.lst file lists or audio files",
+    )
+    infer_parser.add_argument("--output-dir", default="vad_output")
+    infer_parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default="rttm",
+        help="rttm/csv: one file per recording, json: one line per recording "
+        "in segments.jsonl",
+    )
+    infer_parser.add_argument(
+        "--model",
+        default="./MarbleNet-3x2x64.nemo",
+        help=".nemo checkpoint, or .onnx/.ts artifact from `vad export`",
+    )
+    infer_parser.add_argument("--batch-size", type=int, default=320)
+    infer_parser.add_argument(
+        "--workers", type=int, default=2, help="audio decoding threads"
+    )
+    infer_parser.add_argument(
+        "--threads", type=int, default=0, help="torch threads, 0 keeps the default"
+    )
+    infer_parser.add_argument("--window", type=float, default=0.63)
+    infer_parser.add_argument("--shift", type=float, default=0.01)
+    infer_parser.add_argument("--smoothing", choices=("mean", "median"), default="mean")
+    infer_parser.add_argument("--onset", type=float, default=0.5)
+    infer_parser.add_argument("--offset", type=float, default=None)
+    infer_parser.add_argument("--pad-onset", type=float, default=0.0)
+    infer_parser.add_argument("--pad-offset", type=float, default=0.0)
+    infer_parser.add_argument("--min-duration-on", type=float, default=0.0)
+    infer_parser.add_argument("--min-duration-off", type=float, default=0.0)
+    infer_parser.add_argument(
+        "--server",
+        default=None,
+        help="address of a running `vad serve`, http://host:port or unix:/path",
+    )
+    _add_quantize_arguments(infer_parser)
+    infer_parser.set_defaults(func=infer)
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="keep the model loaded and serve inference requests"
+    )
+    serve_parser.add_argument(
+        "--model",
+        default="./MarbleNet-3x2x64.nemo",
+        help=".nemo checkpoint, or .onnx/.ts artifact from `vad export`",
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument(
+        "--unix-socket", default=None, help="serve on this Unix socket instead"
+    )
+    serve_parser.add_argument(
+        "--batch-size", type=int, default=320, help="maximum windows per batch"
+    )
+    serve_parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=10.0,
+        help="maximum time a request waits for its batch to fill up",
+    )
+    serve_parser.add_argument(
+        "--latency-target-ms",
+        type=float,
+        default=None,
+        help="shorten the wait so waiting plus the forward pass meets this target",
+    )
+    serve_parser.add_argument(
+        "--threads", type=int, default=0, help="torch threads, 0 keeps the default"
+    )
+    serve_parser.add_argument(
+        "--window",
+        type=float,
+        default=0.63,
+        help="calibration window length in seconds of --quantize static",
+    )
+    _add_quantize_arguments(serve_parser)
+    serve_parser.set_defaults(func=serve)
+
+    export_parser = subparsers.add_parser(
+        "export", help="export the model to ONNX or TorchScript"
+    )
+    export_parser.add_argument("output", help="artifact path, .onnx or .ts")
+    export_parser.add_argument("--model", default="./MarbleNet-3x2x64.nemo")
+    export_parser.add_argument(
+        "--format", choices=("onnx", "torchscript"), default=None
+    )
+    export_parser.add_argument("--window", type=float, default=0.63)
+    export_parser.add_argument("--opset", type=int, default=17)
+    export_parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="check that the artifact reproduces the NeMo logits",
+    )
+    export_parser.add_argument(
+        "--manifests",
+        default=None,
+        help="comma-separated manifests to verify on, random windows otherwise",
+    )
+    export_parser.add_argument("--atol", type=float, default=1e-3)
+    export_parser.set_defaults(func=export)
+
+    quantize_parser = subparsers.add_parser(
+        "quantize", help="compare the INT8 model with the fp32 model"
+    )
+    quantize_parser.add_argument(
+        "manifests", help="comma-separated manifests, e.g. the chunked_audio/ ones"
+    )
+    quantize_parser.add_argument("--model", default="./MarbleNet-3x2x64.nemo")
+    quantize_parser.add_argument(
+        "--mode", choices=("dynamic", "static"), default="dynamic"
+    )
+    quantize_parser.add_argument(
+        "--calibration-manifests",
+        default=None,
+        help="comma-separated manifests to calibrate on, the evaluated ones "
+        "otherwise",
+    )
+    quantize_parser.add_argument("--calibration-windows", type=int, default=512)
+    quantize_parser.add_argument("--window", type=float, default=0.63)
+    quantize_parser.add_argument("--batch-size", type=int, default=320)
+    quantize_parser.add_argument(
+        "--threads", type=int, default=0, help="torch threads, 0 keeps the default"
+    )
+    quantize_parser.add_argument(
+        "--output", default="quantization_report.json", help="JSON report path"
+    )
+    quantize_parser.set_defaults(func=quantize)
+
+    evaluate_parser = subparsers.add_parser(
+        "evaluate", help="score hypothesis RTTM files against reference ones"
+    )
+    evaluate_parser.add_argument(
+        "references", help="reference RTTM file or directory, e.g. an rttm/ split"
+    )
+    evaluate_parser.add_argument(
+        "hypotheses", help="hypothesis RTTM file or directory, e.g. vad_output/"
+    )
+    evaluate_parser.add_argument(
+        "--audio-dir",
+        default=None,
+        help="recordings to read the durations from, the last segment end otherwise",
+    )
+    evaluate_parser.add_argument(
+        "--collar",
+        type=float,
+        default=0.0,
+        help="seconds around every reference boundary which are not scored",
+    )
+    evaluate_parser.add_argument("--frame-shift", type=float, default=0.01)
+    evaluate_parser.add_argument(
+        "--workers", type=int, default=1, help="RTTM parsing processes"
+    )
+    evaluate_parser.add_argument(
+        "--output", default="evaluation.json", help="JSON report with every file"
+    )
+    evaluate_parser.set_defaults(func=evaluate)
+
+    sweep_parser = subparsers.add_parser(
+        "sweep", help="tune the speech threshold on saved posteriors"
+    )
+    sweep_parser.add_argument(
+        "posteriors", help=".npz posteriors, e.g. chunked_audio/posteriors.npz"
+    )
+    sweep_parser.add_argument(
+        "--step", type=float, default=0.01, help="spacing of the thresholds in [0, 1]"
+    )
+    sweep_parser.add_argument(
+        "--smoothing",
+        default="mean:1",
+        help="comma-separated method:frames moving mean/median filters, "
+        "mean:1 is no smoothing",
+    )
+    sweep_parser.add_argument("--target-far", type=float, default=0.05)
+    sweep_parser.add_argument(
+        "--output", default="sweep.json", help="JSON report with every grid point"
+    )
+    sweep_parser.set_defaults(func=sweep)
+
+    merge_parser = subparsers.add_parser(
+        "merge", help="combine the shard results of a PBS array job"
+    )
+    merge_parser.add_argument(
+        "results",
+        help="results folder of the shards, chunked_audio/shards/<job id>/results",
+    )
+    merge_parser.add_argument(
+        "--posteriors",
+        nargs="*",
+        default=None,
+        help="posteriors.npz of every shard, merged into --posteriors-output",
+    )
+    merge_parser.add_argument("--posteriors-output", default="posteriors.npz")
+    merge_parser.add_argument(
+        "--output", default="merged.json", help="JSON report with every shard"
+    )
+    merge_parser.set_defaults(func=merge)
+
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,24 @@
 """This `data_prep` module includes module(s) which contains
-utilities for processing and cleaning data."""
+utilities for processing and cleaning data.
 
-from . import (
-    annotations,
-    audio_processing,
-    dataloadfolders,
-    speech_segments,
-)
+The submodules are imported on first access, so that importing
+speech_segments alone, e.g. from the inference CLI, does not import the
+hydra, pandas and matplotlib dependencies of annotations.
+"""
+
+import importlib
+
+__all__ = [
+    "annotations",
+    "audio_processing",
+    "dataloadfolders",
+    "speech_segments",
+]
 
 # from . import process_text
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -20,15 +20,22 @@ class Annotations:
 
     Attributes:
         audio_data (str) : absolute path of root folder of sampled data
+        bulk_rttm (bool) : read rttm files with sseg.read_rttm_bulk, see DataLoadFolders
+        num_workers (int) : processes reading rttm files when bulk_rttm is True
     """
 
     def __init__(
         self,
         root_path_of_sampled_data: str,
         root_path_of_primary: str = None,
+        bulk_rttm: bool = False,
+        num_workers: int = 1,
     ):
         self.root = root_path_of_sampled_data
         self.primary = root_path_of_primary
+        # passed on to DataLoadFolders
+        self.bulk_rttm = bulk_rttm
+        self.num_workers = num_workers
 
     def annotations_loader(self):
         """
@@ -68,7 +75,10 @@ class Annotations:
     def _get_annote_dict(self, list_of_annote):
         try:
             annote_dict = {
-                path[0]: DataLoadFolders(path[1]).to_dict() for path in list_of_annote
+                path[0]: DataLoadFolders(
+                    path[1], bulk_rttm=self.bulk_rttm, num_workers=self.num_workers
+                ).to_dict()
+                for path in list_of_annote
             }
         except Exception as e:
             logger.info(
@@ -77,7 +87,9 @@ class Annotations:
             annote_dict = {}
             for path in list_of_annote:
                 try:
-                    annote_dict[path[0]] = DataLoadFolders(path[1]).to_dict()
+                    annote_dict[path[0]] = DataLoadFolders(
+                        path[1], bulk_rttm=self.bulk_rttm, num_workers=self.num_workers
+                    ).to_dict()
                 except Exception as e:
                     logger.info(f"{path} cannot be converted to annotations due to {e}")
         finally:
@@ -1 +1 @@
-from . import read_chunked_audio_files, wrapper_for_soundfile
+from . import offset_manifests, read_chunked_audio_files, wrapper_for_soundfile
@@ -0,0 +1,133 @@
+import json
+import logging
+from os.path import join
+
+import numpy as np
+import soundfile as sf
+
+from src.folder_audio_utils.audio_management import AudioUtils
+from src.vad.data_prep.audio_processing.wrapper_for_soundfile import (
+    EXCLUDED_RECORDINGS,
+    deriving_snippets,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class OffsetManifestWriter:
+    """Class for creating Nemo-compliant manifest files that point into the original recordings.
+
+    Instead of cutting every recording into physical chunk files, every window of a recording is
+    described by one manifest entry whose 'audio_filepath' is the original recording, 'offset' is
+    the start of the window in that recording and 'duration' is the length of the window.
+    The windows are the same as the ones SoundfileWrapper writes to disk with the same durations,
+    so the manifests can be used by model_eval in place of the chunk manifests.
+
+    Args:
+        annotations (dict): A dictionary of annotations with non-empty values, as loaded by
+                            Annotations.annotations_loader.
+        durations (float, optional): The duration of each window in seconds. Defaults to 0.63.
+
+    Attributes:
+        annotations (dict): A dictionary of annotations.
+        durations (float): The duration of each window in seconds.
+
+    Example:
+        # Usage of the OffsetManifestWriter class
+        annote_dict = Annotations("sampled_config_60mins/").annotations_loader()
+        writer = OffsetManifestWriter(annote_dict, durations=0.63)
+        manifest_files = writer.write_manifests(manifest_folder_path="chunked_audio/")
+    """
+
+    def __init__(self, annotations: dict, durations: float = 0.63):
+        self.annotations = annotations
+        self.durations = durations
+
+    def write_manifests(self, manifest_folder_path: str):
+        """Write one speech and one non-speech manifest per annotation key.
+
+        Args:
+            manifest_folder_path (str): The path to the folder where the manifest files will be saved.
+
+        Returns:
+            list: The paths of the manifest files written.
+        """
+        manifest_files = []
+        for annotation_key, recordings in self.annotations.items():
+            collector_of_information_speech = []
+            collector_of_information_non_speech = []
+            for file_id, recording in recordings.items():
+                audio_path = recording["audio_path"]
+                if any(name in audio_path for name in EXCLUDED_RECORDINGS):
+                    continue
+                try:
+                    entries = self.recording_entries(audio_path, recording["segments"])
+                except Exception as error:
+                    logger.error(
+                        f"manifest entries for {audio_path} failed due to {error}"
+                    )
+                    continue
+                for entry in entries:
+                    if entry["label"] == "speech":
+                        collector_of_information_speech.append(entry)
+                    else:
+                        collector_of_information_non_speech.append(entry)
+
+            for suffix, collector in (
+                ("speech", collector_of_information_speech),
+                ("non_speech", collector_of_information_non_speech),
+            ):
+                manifest_path = join(
+                    manifest_folder_path, f"{annotation_key}_{suffix}_manifest.json"
+                )
+                with open(manifest_path, "w", encoding="UTF-8") as outfile:
+                    for information in collector:
+                        json.dump(information, outfile)
+                        outfile.write("\n")
+                manifest_files.append(manifest_path)
+        return manifest_files
+
+    def recording_entries(self, audio_path, speech_segments):
+        """Create the manifest entries of every window of a single recording.
+
+        Only the header of the recording is read, the audio itself is not decoded.
+
+        The last window of a recording is given its truncated duration, up to the end of the
+        recording, while SoundfileWrapper zero pads the last chunk file to the full window. A
+        declared full duration would not pad it either, the audio is read up to the end of the
+        file, so that window is shorter than its chunk file counterpart.
+
+        Args:
+            audio_path (str): The path to the original recording.
+            speech_segments (list): A list of (start_time, end_time) speech segments of the recording.
+
+        Returns:
+            list: Nemo-compliant dictionaries, one per window, ordered by offset.
+        """
+        info = sf.info(audio_path)
+        window_len = round(self.durations * info.samplerate)
+        # the windows of the chunk files SoundfileWrapper writes with the same durations
+        number_of_windows, _ = deriving_snippets(
+            info.frames / info.samplerate, self.durations
+        )
+
+        start_samples = np.arange(number_of_windows) * window_len
+        end_samples = np.minimum(start_samples + window_len, info.frames)
+        offsets = start_samples / info.samplerate
+        durations = (end_samples - start_samples) / info.samplerate
+        overlaps, _ = AudioUtils.label_windows(
+            np.stack((offsets, offsets + durations), axis=1), speech_segments
+        )
+
+        entries = []
+        for offset, duration, overlap_bool in zip(offsets, durations, overlaps):
+            entries.append(
+                {
+                    "audio_filepath": audio_path,
+                    "duration": round(float(duration), 6),
+                    "label": "speech" if overlap_bool else "background",
+                    "text": "_",
+                    "offset": round(float(offset), 6),
+                }
+            )
+        return entries
@@ -52,7 +52,10 @@ class ReadTrim:
         )
 
     def handle_generated_folders(
-        self, duration: float = 0.63, manifest_folder_path: str = None
+        self,
+        duration: float = 0.63,
+        manifest_folder_path: str = None,
+        keys: set = None,
     ):
         """Handle generated folders and create Nemo-compliant manifest files.
 
@@ -64,6 +67,10 @@ class ReadTrim:
             duration (float, optional): The duration (in seconds) to consider for each segment. Defaults to 0.63.
             manifest_folder_path (str, optional): The path to the folder where the manifest files will be saved.
                                                   Defaults to None.
+            keys (set, optional): The annotation keys whose manifests are rewritten, e.g.
+                                  SoundfileWrapper.changed_keys after an incremental segmentation. The
+                                  manifests of other keys are kept when they exist. Defaults to None,
+                                  rewriting every manifest.
 
         Example:
             # Usage of the handle_generated_folders method
@@ -84,8 +91,16 @@ class ReadTrim:
                     manifest_folder_path,
                     f"{annotation_dict_compatible_key}_non_speech_manifest.json",
                 )
+                if (
+                    keys is not None
+                    and annotation_dict_compatible_key not in keys
+                    and os.path.isfile(manifest_path_speech)
+                    and os.path.isfile(manifest_path_non_speech)
+                ):
+                    continue
                 collector_of_information_speech = []
                 collector_of_information_non_speech = []
+                chunks_per_recording = {}
                 for file_path, info in trim_info.items():
                     try:
                         filename_org, timings = list(info.items())[0]
@@ -93,14 +108,30 @@ class ReadTrim:
                         print(
                             f"{annotation_dict_compatible_key} is out of dictionary range and failed with {e}"
                         )
+                        continue
+                    chunks_per_recording.setdefault(filename_org, []).append(
+                        (file_path, timings)
+                    )
 
+                # every chunk of a recording is labelled in one SegmentIndex query
+                labels_of_chunks = {}
+                for filename_org, chunks in chunks_per_recording.items():
                     speech_segments = self.annotations[annotation_dict_compatible_key][
                         filename_org
                     ]["segments"]
-
-                    overlap_bool, offset = AudioUtils.check_overlap(
-                        timings, speech_segments
+                    overlaps, offsets = AudioUtils.label_windows(
+                        [timings for _, timings in chunks], speech_segments
                     )
+                    for (file_path, _), overlap_bool, offset in zip(
+                        chunks, overlaps.tolist(), offsets.tolist()
+                    ):
+                        labels_of_chunks[file_path] = (overlap_bool, offset)
+
+                # written in the order of the chunk files, as before
+                for file_path in trim_info:
+                    if file_path not in labels_of_chunks:
+                        continue
+                    overlap_bool, offset = labels_of_chunks[file_path]
                     if overlap_bool:
                         to_nemo_file = self._nemo_compliant_dict(
                             file_path,
@@ -1,13 +1,54 @@
+import glob
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import soundfile as sf
 
+from src.folder_audio_utils.audio_management import AudioUtils
 from src.vad.data_prep.annotations import Annotations
+from src.vad.data_prep.build_state import BuildState
 
 logger = logging.getLogger(__name__)
 
+# recordings known to be unusable, skipped during segmentation
+EXCLUDED_RECORDINGS = ("R1021_M1947", "EN2005a.Headset-3", "ES2011c.Headset-2")
+
+
+def deriving_snippets(audio_length, durations, hop_duration=None):
+    """
+    Calculates number of snippets and remainder duration of a recording, i.e. the snippets
+    SoundfileWrapper cuts it into and the windows OffsetManifestWriter describes.
+
+    Args:
+        audio_length (float) : The length of audio_length to be chunked
+        durations (float) : The duration of each snippet in seconds
+        hop_duration (float, optional) : The time in seconds between the starts of two
+            consecutive snippets. Defaults to None, i.e. durations.
+    """
+    if hop_duration and hop_duration != durations:
+        number_of_snippets = (
+            int((audio_length - durations) / hop_duration) + 1
+            if audio_length >= durations
+            else 0
+        )
+        covered_duration = (
+            (number_of_snippets - 1) * hop_duration + durations
+            if number_of_snippets
+            else 0
+        )
+        remainder_duration = round(audio_length - covered_duration)
+        if remainder_duration > 0:
+            number_of_snippets += 1
+        return number_of_snippets, remainder_duration
+
+    number_of_snippets = int(audio_length / durations)
+    remainder_duration = round(audio_length - (number_of_snippets * durations))
+    if remainder_duration > 0:
+        number_of_snippets += 1
+    return number_of_snippets, remainder_duration
+
 
 class SoundfileWrapper:
     def __init__(
@@ -15,6 +56,12 @@ class SoundfileWrapper:
         annotations: dict,
         output_dir: str = "",
         durations: float = 0.63,
+        write_chunks: bool = True,
+        num_workers: int = 1,
+        dtype: str = "float32",
+        stream_block_duration: float = 60.0,
+        hop_duration: float = None,
+        build_state_path: str = None,
     ):
         """
         A class that uses Soundfile to stream and chunk audiofiles into smaller size
@@ -28,49 +75,253 @@ class SoundfileWrapper:
             output_dir (str, optional): The output directory for the segmented files. Defaults to "".
             durations (float, optional): The duration of each segment in seconds. Defaults to 0.63.
             hard_limit (float, optional): The hard limit for the number of segments. Defaults to None.
+            write_chunks (bool, optional): Whether to write every snippet to its own WAV file.
+                If False, snippets are kept in memory and returned by segmentation_loader,
+                and nothing is written to output_dir. Defaults to True.
+            num_workers (int, optional): The number of worker processes used to segment
+                recordings. 1 segments the recordings serially in this process. Defaults to 1.
+            dtype (str, optional): The dtype audio is decoded to, 'float32' or 'int16'.
+                Defaults to "float32".
+            stream_block_duration (float, optional): The duration in seconds of the blocks
+                read at a time when chunks are written to WAV files. Peak memory per recording
+                is bounded by this, not by the length of the recording. Defaults to 60.0.
+            hop_duration (float, optional): The time in seconds between the starts of two
+                consecutive segments. Segments overlap when it is smaller than durations.
+                Defaults to None, i.e. durations.
+            build_state_path (str, optional): Path of a BuildState JSON file. When given and
+                write_chunks is True, only recordings whose WAV, RTTM or chunking parameters
+                changed since the last segmentation are chunked again. Defaults to None,
+                chunking every recording.
         """
         self.lvl_1_keys = list(annotations.keys())
         self.annotations = annotations
         self.train_val_test_meta_info = self._meta_data_of_files()
         self.output_dir = output_dir
         self.durations = durations
+        self.write_chunks = write_chunks
+        self.num_workers = num_workers
+        self.dtype = dtype
+        self.stream_block_duration = stream_block_duration
+        self.hop_duration = hop_duration
+        self.build_state = (
+            BuildState(build_state_path, self.build_params())
+            if build_state_path and write_chunks
+            else None
+        )
+        self.rttm_paths = self._rttm_paths()
+        self.segmentation_errors = {}
+        self.skipped_recordings = []
+        self.changed_keys = set()
 
     def segmentation_loader(self):
         logger.info("Starting audio segmentation...")
         """
         Performs audio segmentation using soundfile in parallel for the specified files.
+
+        Returns:
+            dict: Only when write_chunks is False, a dictionary of
+                {annotation_key: {file_id: snippet_info}} where snippet_info is the
+                dictionary returned by _soundfile_snippets. Otherwise an empty dictionary.
         """
+        in_memory_snippets = {}
+        self.segmentation_errors = {}
+        self.skipped_recordings = []
+        self.changed_keys = set()
         try:
-            new_fold_loc_w_aud_files = self._make_trim_folder_appear()
+            if self.write_chunks:
+                new_fold_loc_w_aud_files = self._make_trim_folder_appear()
+            else:
+                new_fold_loc_w_aud_files = self._audio_files_per_key()
         except Exception as error:
             logger.error(
                 f"Unable to create output files for trimmed files due to: {error}"
             )
         try:
-            for new_output_fold, corr_aud_files in new_fold_loc_w_aud_files.items():
-                param_for_sf_chop_func = [
-                    (new_output_fold, audio_file)
-                    for audio_file in corr_aud_files
-                    if ("R1021_M1947" not in audio_file)
-                    and ("EN2005a.Headset-3" not in audio_file)
-                    and ("ES2011c.Headset-2" not in audio_file)
-                ]
+            param_for_sf_chop_func = [
+                (new_output_fold, audio_file)
+                for new_output_fold, corr_aud_files in new_fold_loc_w_aud_files.items()
+                for audio_file in corr_aud_files
+                if not any(name in audio_file for name in EXCLUDED_RECORDINGS)
+            ]
+            if self.write_chunks and self.build_state is not None:
+                param_for_sf_chop_func = self._outdated_recordings(
+                    param_for_sf_chop_func
+                )
 
+            if self.num_workers > 1:
+                with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                    futures = [
+                        executor.submit(
+                            _segment_recording,
+                            self._worker_params(),
+                            outfold_aud_file[0],
+                            outfold_aud_file[1],
+                        )
+                        for outfold_aud_file in param_for_sf_chop_func
+                    ]
+                    # collected in submission order so the output order does not
+                    # depend on which worker finishes first
+                    for outfold_aud_file, future in zip(param_for_sf_chop_func, futures):
+                        try:
+                            snippet_info = future.result()
+                            self._collect_segmented(
+                                in_memory_snippets, outfold_aud_file, snippet_info
+                            )
+                        except Exception as error:
+                            self._collect_error(outfold_aud_file, error)
+            else:
                 for outfold_aud_file in param_for_sf_chop_func:
                     logger.info(f"new_output_fold and corr file is: {outfold_aud_file}")
                     try:
-                        self._soundfile_chopping(
+                        snippet_info = self._segment_one(
                             outfold_aud_file[0], outfold_aud_file[1]
                         )
-                        logger.info(f"chunking done for {outfold_aud_file[1]}")
-                    except Exception as error:
-                        logger.error(
-                            f"chunking for {outfold_aud_file[1]} failed due to {error}"
+                        self._collect_segmented(
+                            in_memory_snippets, outfold_aud_file, snippet_info
                         )
+                    except Exception as error:
+                        self._collect_error(outfold_aud_file, error)
+            if self.write_chunks and self.build_state is not None:
+                self.build_state.save()
             logger.info("Audio segmentation completed.")
+            if self.segmentation_errors:
+                logger.warning(
+                    f"{len(self.segmentation_errors)} recordings failed segmentation, "
+                    "see segmentation_errors"
+                )
 
         except Exception as error:
             logger.error(f"Unable to trim files due to: {error}")
+        return in_memory_snippets
+
+    def build_params(self):
+        """
+        The parameters the chunks of a recording depend on, see BuildState.
+        """
+        return {
+            "durations": self.durations,
+            "hop_duration": self.hop_duration,
+            "dtype": self.dtype,
+        }
+
+    def _outdated_recordings(self, param_for_sf_chop_func):
+        """
+        Filters out the recordings the build state knows are chunked already, and removes the
+        chunks of recordings which are chunked again or which are gone from the annotations.
+
+        Args:
+            param_for_sf_chop_func (list): (output_fold_path, audio_file) of every recording.
+
+        Returns:
+            list: (output_fold_path, audio_file) of the recordings to chunk.
+        """
+        rttm_paths = self.rttm_paths
+        for record in self.build_state.prune(
+            audio_file for _, audio_file in param_for_sf_chop_func
+        ):
+            self._remove_chunks(record["output"], record["audio_path"])
+
+        outdated = []
+        for output_fold_path, audio_file in param_for_sf_chop_func:
+            if self.build_state.is_current(
+                audio_file, rttm_paths.get(str(audio_file)), output_fold_path
+            ):
+                self.skipped_recordings.append(audio_file)
+                continue
+            self._remove_chunks(output_fold_path, audio_file)
+            outdated.append((output_fold_path, audio_file))
+        logger.info(
+            f"{len(self.skipped_recordings)} recordings unchanged since the last build, "
+            f"{len(outdated)} to chunk"
+        )
+        return outdated
+
+    def _remove_chunks(self, output_fold_path, audio_file):
+        """
+        Deletes the chunk WAVs of a recording, so chunks of a previous build do not linger.
+        """
+        audio_base_name = os.path.basename(audio_file).split(".wav")[0]
+        for chunk in glob.glob(
+            os.path.join(
+                glob.escape(output_fold_path), glob.escape(audio_base_name) + "__*.wav"
+            )
+        ):
+            os.remove(chunk)
+        self.changed_keys.add(self._annotation_key(output_fold_path))
+
+    @staticmethod
+    def _annotation_key(output_fold_path):
+        folder_name = os.path.basename(os.path.normpath(output_fold_path))
+        return (
+            folder_name[: -len("_trimmed")]
+            if folder_name.endswith("_trimmed")
+            else folder_name
+        )
+
+    def _rttm_paths(self):
+        """
+        {audio_path: rttm_path} of every recording of the annotations.
+        """
+        return {
+            str(info["audio_path"]): info.get("rttm_path") and str(info["rttm_path"])
+            for meta_info_list in self.train_val_test_meta_info.values()
+            for info in meta_info_list
+        }
+
+    def _segment_one(self, output_fold_path, audio_file):
+        """
+        Segments a single recording, either to WAV files or in memory depending on write_chunks.
+
+        Args:
+            output_fold_path (str): The folder for the snippets, or the annotation key when
+                write_chunks is False.
+            audio_file (str): The path to the audio file.
+
+        Returns:
+            dict: snippet_info of _soundfile_snippets when write_chunks is False, otherwise None.
+        """
+        if self.write_chunks:
+            self._soundfile_chopping(output_fold_path, audio_file)
+            return None
+        return self._soundfile_snippets(audio_file)
+
+    def _worker_params(self):
+        """
+        The chunking parameters a worker process needs to rebuild this SoundfileWrapper.
+        """
+        return {
+            "durations": self.durations,
+            "write_chunks": self.write_chunks,
+            "dtype": self.dtype,
+            "stream_block_duration": self.stream_block_duration,
+            "hop_duration": self.hop_duration,
+        }
+
+    def _collect_segmented(self, in_memory_snippets, outfold_aud_file, snippet_info):
+        """
+        Stores the in-memory snippets of a recording that was segmented successfully.
+        """
+        if snippet_info is not None:
+            file_id = os.path.basename(outfold_aud_file[1]).split(".wav")[0]
+            in_memory_snippets.setdefault(outfold_aud_file[0], {})[
+                file_id
+            ] = snippet_info
+        if self.write_chunks and self.build_state is not None:
+            self.build_state.mark(
+                outfold_aud_file[1],
+                self.rttm_paths.get(str(outfold_aud_file[1])),
+                outfold_aud_file[0],
+            )
+        logger.info(f"chunking done for {outfold_aud_file[1]}")
+
+    def _collect_error(self, outfold_aud_file, error):
+        """
+        Records the error of a recording that failed segmentation, keyed by its audio path.
+        """
+        self.segmentation_errors[outfold_aud_file[1]] = repr(error)
+        if self.build_state is not None:
+            self.build_state.forget(outfold_aud_file[1])
+        logger.error(f"chunking for {outfold_aud_file[1]} failed due to {error}")
 
     def _meta_data_of_files(self):
         logger.info("Retrieving metadata of files for segmentation...")
@@ -111,51 +362,152 @@ class SoundfileWrapper:
         Args:
             audio_length (float) : The length of audio_length to be chunked
         """
-        number_of_snippets = int(audio_length / self.durations)
-        remainder_duration = round(audio_length - (number_of_snippets * self.durations))
-        if remainder_duration > 0:
-            number_of_snippets += 1
-        return number_of_snippets, remainder_duration
+        return deriving_snippets(audio_length, self.durations, self.hop_duration)
 
-    def _soundfile_chopping(self, output_fold_path, audio_file):
-        logger.info(f"chunking {os.path.basename(audio_file)}...")
+    def _soundfile_snippets(self, audio_file):
+        logger.info(f"chunking {os.path.basename(audio_file)} in memory...")
         """
-        Performs audio chunking using soundfile for a single audio file.
+        Cuts a single audio file into fixed-length snippets without writing them to disk.
+
+        The snippets are rows of a read-only strided view built by AudioUtils.frame_signal.
+        When the recording does not need padding the view is over the decoded recording,
+        otherwise the recording is copied once into a zero-padded buffer.
 
         Args:
             audio_file (str): The path to the audio file.
+
+        Returns:
+            dict: A dictionary containing:
+                - snippets (numpy.ndarray): Array of shape (number_of_snippets, snippet_len).
+                - timings (numpy.ndarray): Array of shape (number_of_snippets, 2) with the
+                  start and end time in seconds of each snippet in the recording.
+                - sample_rate (int): The sample rate of the recording.
         """
-        audio_data, sample_rate = sf.read(audio_file)
+        audio_data, sample_rate = sf.read(audio_file, dtype=self.dtype)
         audio_duration = len(audio_data) / sample_rate
-        duration_to_use = audio_duration
 
-        number_of_snippets, remainder_duration = self._deriving_snippets(
-            duration_to_use
+        number_of_snippets, _ = self._deriving_snippets(audio_duration)
+        snippet_len, hop_len = self._snippet_and_hop_len(sample_rate)
+
+        snippets = AudioUtils.frame_signal(
+            audio_data, snippet_len, hop_len, number_of_snippets
         )
+        timings = AudioUtils.window_timings(
+            number_of_snippets, snippet_len, hop_len, len(audio_data), sample_rate
+        )
+
+        return {
+            "snippets": snippets,
+            "timings": timings,
+            "sample_rate": sample_rate,
+        }
 
-        for snippet_index in range(number_of_snippets):
-            start_sample = round(self.durations * snippet_index * sample_rate)
-            end_sample = round(self.durations * (snippet_index + 1) * sample_rate)
+    def _snippet_and_hop_len(self, sample_rate):
+        """
+        The number of samples of a snippet and between the starts of two snippets.
+        """
+        snippet_len = round(self.durations * sample_rate)
+        hop_len = round((self.hop_duration or self.durations) * sample_rate)
+        return snippet_len, hop_len
 
-            if snippet_index == number_of_snippets - 1 and remainder_duration > 0:
-                end_sample = len(audio_data)
-            snippet_data = audio_data[start_sample:end_sample]
-            snippet_duration = len(snippet_data) / sample_rate
-            padding_samples = round((self.durations - snippet_duration) * sample_rate)
-            padded_snippet_data = snippet_data
+    def _soundfile_stream_snippets(self, audio_file):
+        """
+        Streams a single audio file block by block and yields its fixed-length snippets.
 
-            if padding_samples > 0:
-                padding_data = np.zeros((padding_samples,))
-                padded_snippet_data = np.concatenate((snippet_data, padding_data))
+        Blocks of stream_block_duration seconds are read with SoundFile.read. Samples not yet
+        covered by a complete snippet at the end of a block, including the overlap with the
+        next snippet, are carried over to the next block, so the snippets are the same as the
+        ones of _soundfile_snippets while only one block is held in memory.
 
-            name_of_output_audio_file = (
-                os.path.basename(audio_file).split(".wav")[0]
-                + f"__{round(start_sample/sample_rate,2)}-{round(end_sample/sample_rate,2)}.wav"
-            )
+        Args:
+            audio_file (str): The path to the audio file.
 
-            output_file = os.path.join(output_fold_path, name_of_output_audio_file)
+        Yields:
+            tuple: A tuple containing:
+                - numpy.ndarray: Array of shape (snippets_in_block, snippet_len).
+                - numpy.ndarray: Array of shape (snippets_in_block, 2) with the start and end
+                  time in seconds of each snippet in the recording.
+                - int: The sample rate of the recording.
+        """
+        with sf.SoundFile(audio_file) as sound_file:
+            sample_rate = sound_file.samplerate
+            total_frames = sound_file.frames
+            number_of_snippets, _ = self._deriving_snippets(total_frames / sample_rate)
+            snippet_len, hop_len = self._snippet_and_hop_len(sample_rate)
+            block_frames = max(round(self.stream_block_duration * sample_rate), 1)
 
-            sf.write(output_file, padded_snippet_data, sample_rate)
+            carry_over = np.zeros(0, dtype=self.dtype)
+            snippets_done = 0
+            while snippets_done < number_of_snippets:
+                block = sound_file.read(block_frames, dtype=self.dtype)
+                end_of_file = len(block) < block_frames
+                if len(carry_over):
+                    block = np.concatenate((carry_over, block))
+
+                if end_of_file:
+                    # remaining snippets, the last one is zero padded
+                    snippets_in_block = number_of_snippets - snippets_done
+                elif len(block) >= snippet_len:
+                    snippets_in_block = min(
+                        (len(block) - snippet_len) // hop_len + 1,
+                        number_of_snippets - snippets_done,
+                    )
+                else:
+                    snippets_in_block = 0
+
+                if snippets_in_block:
+                    snippets = AudioUtils.frame_signal(
+                        block, snippet_len, hop_len, snippets_in_block
+                    )
+                    timings = AudioUtils.window_timings(
+                        snippets_in_block,
+                        snippet_len,
+                        hop_len,
+                        total_frames,
+                        sample_rate,
+                        first_window=snippets_done,
+                    )
+                    snippets_done += snippets_in_block
+                    yield snippets, timings, sample_rate
+
+                carry_over = block[snippets_in_block * hop_len :]
+                if end_of_file:
+                    break
+
+    def _soundfile_chopping(self, output_fold_path, audio_file):
+        logger.info(f"chunking {os.path.basename(audio_file)}...")
+        """
+        Performs audio chunking using soundfile for a single audio file.
+
+        The audio file is streamed with _soundfile_stream_snippets, so recordings of any length
+        are chunked with the same peak memory.
+
+        Args:
+            audio_file (str): The path to the audio file.
+        """
+        audio_base_name = os.path.basename(audio_file).split(".wav")[0]
+
+        for snippets, timings, sample_rate in self._soundfile_stream_snippets(audio_file):
+            for snippet_data, (start_time, end_time) in zip(snippets, timings):
+                name_of_output_audio_file = (
+                    audio_base_name + f"__{round(start_time,2)}-{round(end_time,2)}.wav"
+                )
+
+                output_file = os.path.join(output_fold_path, name_of_output_audio_file)
+
+                sf.write(output_file, snippet_data, sample_rate)
+
+    def _audio_files_per_key(self):
+        """
+        Lists the audio files of every annotation key, without creating any folder.
+
+        Returns:
+            dict: {annotation_key: [audio_path, ...]}
+        """
+        return {
+            key: [info["audio_path"] for info in meta_info_list]
+            for key, meta_info_list in self.train_val_test_meta_info.items()
+        }
 
     def _make_trim_folder_appear(self):
         logger.info("creating output folders for trimmed files")
@@ -180,3 +532,14 @@ class SoundfileWrapper:
                 info["audio_path"] for info in meta_info_list
             ]
         return location_of_trim_folders
+
+
+def _segment_recording(wrapper_params, output_fold_path, audio_file):
+    """
+    Entry point of the worker processes of SoundfileWrapper.segmentation_loader.
+
+    A SoundfileWrapper without annotations is built in the worker, so only the
+    chunking parameters are sent to the worker instead of the whole annotations.
+    """
+    sf_wrapper = SoundfileWrapper({}, **wrapper_params)
+    return sf_wrapper._segment_one(output_fold_path, audio_file)
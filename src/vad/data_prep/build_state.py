@@ -0,0 +1,147 @@
+"""Build state
+Records which recordings have already been processed, so that data
+preparation can skip the ones whose inputs and parameters did not change.
+
+The state is a JSON file holding, for every source WAV, the size,
+modification time and sha1 of the WAV and of its RTTM, the hash of the
+parameters it was processed with and its output folder.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+
+def params_hash(params: dict) -> str:
+    """sha1 of a JSON serialisable parameter dictionary, independent of
+    the key order."""
+    return hashlib.sha1(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def _sha1(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as infile:
+        for block in iter(lambda: infile.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BuildState:
+    """Per recording record of the last successful processing.
+
+    Whether a file changed is first decided from its size and mtime; it
+    is only hashed again when those differ, so touching a file without
+    changing its content does not invalidate it.
+
+    Args:
+        state_path (str): Path of the JSON state file, e.g.
+            chunked_audio/.build_state.json. Missing means empty.
+        params (dict): The processing parameters, e.g. chunk duration and
+            hop. Recordings processed with other parameters are stale.
+
+    Examples:
+        >>> state = BuildState("chunked_audio/.build_state.json", {"durations": 5})
+        >>> if not state.is_current(wav, rttm, "chunked_audio/ami_far_train_trimmed"):
+        ...     process(wav)
+        ...     state.mark(wav, rttm, "chunked_audio/ami_far_train_trimmed")
+        >>> state.save()
+    """
+
+    def __init__(self, state_path: str, params: dict):
+        self.state_path = state_path
+        self.params_hash = params_hash(params)
+        self.recordings: Dict[str, dict] = {}
+        if os.path.isfile(state_path):
+            try:
+                with open(state_path, "r", encoding="UTF-8") as infile:
+                    state = json.load(infile)
+                if state.get("version") == STATE_VERSION:
+                    self.recordings = state.get("recordings", {})
+            except (OSError, ValueError) as error:
+                logger.warning(f"Ignoring unreadable build state {state_path}: {error}")
+
+    def _fingerprint(self, path: Optional[str], previous: Optional[dict]) -> dict:
+        if not path:
+            return {}
+        stat = os.stat(path)
+        fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if (
+            previous
+            and previous.get("size") == stat.st_size
+            and previous.get("mtime_ns") == stat.st_mtime_ns
+        ):
+            fingerprint["sha1"] = previous["sha1"]
+        else:
+            fingerprint["sha1"] = _sha1(path)
+        return fingerprint
+
+    def is_current(
+        self, audio_path: str, rttm_path: Optional[str], output: str
+    ) -> bool:
+        """Whether `audio_path` was processed into `output` with the same
+        parameters, WAV and RTTM content, and `output` still exists."""
+        record = self.recordings.get(str(audio_path))
+        if (
+            record is None
+            or record.get("params_hash") != self.params_hash
+            or record.get("output") != str(output)
+            or not os.path.exists(output)
+        ):
+            return False
+        try:
+            for kind, path in (("audio", audio_path), ("rttm", rttm_path)):
+                fingerprint = self._fingerprint(path, record.get(kind))
+                if fingerprint.get("sha1") != record.get(kind, {}).get("sha1"):
+                    return False
+                # refreshed so a touched but identical file is not hashed again
+                record[kind] = fingerprint
+        except OSError:
+            return False
+        return True
+
+    def mark(self, audio_path: str, rttm_path: Optional[str], output: str):
+        """Records that `audio_path` was processed into `output`."""
+        previous = self.recordings.get(str(audio_path), {})
+        self.recordings[str(audio_path)] = {
+            "audio": self._fingerprint(audio_path, previous.get("audio")),
+            "rttm": self._fingerprint(rttm_path, previous.get("rttm")),
+            "params_hash": self.params_hash,
+            "output": str(output),
+        }
+
+    def forget(self, audio_path: str) -> Optional[dict]:
+        """Drops the record of `audio_path`, e.g. after a failure."""
+        return self.recordings.pop(str(audio_path), None)
+
+    def prune(self, audio_paths: Iterable[str]) -> List[dict]:
+        """Drops the records of recordings which are not in `audio_paths`
+        any more.
+
+        Returns:
+            List[dict]: the dropped records, with their "audio_path".
+        """
+        present = {str(path) for path in audio_paths}
+        removed = []
+        for audio_path in [path for path in self.recordings if path not in present]:
+            removed.append({"audio_path": audio_path, **self.forget(audio_path)})
+        return removed
+
+    def save(self):
+        """Writes the state atomically, a crash never leaves it corrupt."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        temporary_path = f"{self.state_path}.tmp"
+        with open(temporary_path, "w", encoding="UTF-8") as outfile:
+            json.dump(
+                {"version": STATE_VERSION, "recordings": self.recordings},
+                outfile,
+                indent=1,
+            )
+        os.replace(temporary_path, self.state_path)
@@ -32,7 +32,12 @@ class DataLoadFolders:
     Dataset can be exported to a dict using self.to_dict()
     """
 
-    def __init__(self, data_path: Union[str, Path]) -> None:
+    def __init__(
+        self,
+        data_path: Union[str, Path],
+        bulk_rttm: bool = False,
+        num_workers: int = 1,
+    ) -> None:
         """Initialize DataLoadFolders object. Reads in 'train', 'val'
         and 'test' folders in the given `data_path` and for each one,
         read in .wav files in 'audio' subfolder, rttm files in 'rttm
@@ -49,10 +54,20 @@ class DataLoadFolders:
                 <data_path>/val/rttm/ (contains *.rttm files)
                 <data_path>/test/audio/ (contains *.wav files)
                 <data_path>/test/rttm/ (contains *.rttm files)
+            bulk_rttm (bool, optional): If True, the rttm files of a
+                split are read at once with `sseg.read_rttm_bulk`, and
+                invalid rttm lines are dropped and kept in
+                `self.bad_rttm_rows` instead of raising. Defaults to
+                False.
+            num_workers (int, optional): Number of processes reading
+                rttm files when `bulk_rttm` is True. Defaults to 1.
 
         """
 
         self.data_path = Path(data_path)
+        self.bulk_rttm = bulk_rttm
+        self.num_workers = num_workers
+        self.bad_rttm_rows = []
         self.train, dangling_train = self.load_files_in_split(
             "train", return_dangling=True
         )
@@ -146,9 +161,24 @@ class DataLoadFolders:
             audio_paths, rttm_paths, return_dangling=True
         )
 
+        segments_by_rttm = {}
+        if self.bulk_rttm and file_ids:
+            table, bad_rows = sseg.read_rttm_bulk(
+                [self._rttm_path(split, file_id) for file_id in file_ids],
+                num_workers=self.num_workers,
+            )
+            segments_by_rttm = sseg.rttm_table_to_segments(table)
+            self.bad_rttm_rows.extend(bad_rows)
+
         loaded_items = {}
         for file_id in file_ids:
-            audio_path, rttm_path, segments = self._load_item(split, file_id)
+            audio_path, rttm_path, segments = self._load_item(
+                split,
+                file_id,
+                segments=segments_by_rttm.get(self._rttm_path(split, file_id), [])
+                if self.bulk_rttm
+                else None,
+            )
             file_id = str(file_id)
 
             loaded_items[file_id] = {
@@ -162,7 +192,14 @@ class DataLoadFolders:
         else:
             return loaded_items
 
-    def _load_item(self, split: str, file_id: str) -> Tuple:
+    def _rttm_path(self, split: str, file_id: str) -> str:
+        return str(
+            self.data_path.joinpath(split).joinpath("rttm").joinpath(file_id + ".rttm")
+        )
+
+    def _load_item(
+        self, split: str, file_id: str, segments: Optional[List] = None
+    ) -> Tuple:
         """Given a fileid (filename stem), generates audio path, rttm
         path, and reads in the rttm file as a list of segment tuples.
 
@@ -170,6 +207,9 @@ class DataLoadFolders:
             split (str): 'train', 'val', or 'test'
             file_id (str): string denoting the fileid aka filename stem
                 (without the extension)
+            segments (List, optional): already validated segments of
+                the rttm file, e.g. from `sseg.read_rttm_bulk`. Defaults
+                to None, reading the rttm file.
 
         Returns:
             Tuple[Path, Path, List[[Tuple[float]]]]: returns an audio
@@ -180,11 +220,10 @@ class DataLoadFolders:
         audio_path = str(
             self.data_path.joinpath(split).joinpath("audio").joinpath(file_id + ".wav")
         )
-        rttm_path = str(
-            self.data_path.joinpath(split).joinpath("rttm").joinpath(file_id + ".rttm")
-        )
-        segments = sseg.read_rttm(rttm_path)
-        segments = sseg.validate_segments(segments)
+        rttm_path = self._rttm_path(split, file_id)
+        if segments is None:
+            segments = sseg.read_rttm(rttm_path)
+            segments = sseg.validate_segments(segments)
 
         return (audio_path, rttm_path, segments)
 
@@ -5,15 +5,26 @@ Contains methods to manipulate speech annotations.
 import logging
 import os
 import xml.etree.ElementTree as eltree
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Union  # Dict, Optional,
+from typing import Dict, List, Tuple, Union  # Optional,
 
-from textgrid import TextGrid
 import numpy as np
 
 
 logger = logging.getLogger(__name__)
 
+# columns of the table returned by read_rttm_bulk
+RTTM_TABLE_DTYPE = np.dtype(
+    [
+        ("file_id", object),
+        ("speaker", object),
+        ("onset", np.float64),
+        ("duration", np.float64),
+        ("rttm_path", object),
+    ]
+)
+
 
 def validate_segments(segments: List[Tuple]) -> List[Tuple[float]]:
     """Checks segments list for any invalid segments
@@ -89,6 +100,8 @@ def read_textgrid(textgrid_filepath: Union[str, Path]):
         list: List of tuples representing start and end
                 times of each speech segment.
     """
+    from textgrid import TextGrid
+
     # parse the textgrid file
     textgrid = TextGrid()
     if os.path.isfile(textgrid_filepath):
@@ -145,6 +158,315 @@ def read_rttm(rttm_filepath: Union[str, Path]):
     return segments  # , speaker_ids, file_ids
 
 
+def _parse_rttm_lines(rttm_filepath: str) -> Tuple[np.ndarray, List[dict]]:
+    """Line by line fallback of _parse_rttm_buffers, for files which are
+    not plain ASCII.
+    """
+    rows = []
+    bad_rows = []
+    with open(rttm_filepath, "rb") as f:
+        for line_number, line in enumerate(f, 1):
+            if line.startswith(b"SPKR-INFO") or not line.strip():
+                continue
+            try:
+                onset, dur, file_id, speaker_id = parse_rttm_line(line)
+            except (IOError, UnicodeDecodeError) as error:
+                bad_rows.append(
+                    {
+                        "rttm_path": rttm_filepath,
+                        "line": line_number,
+                        "text": line.decode("utf-8", "replace").strip(),
+                        "reason": str(error).split(". LINE")[0],
+                    }
+                )
+                continue
+            rows.append((file_id, speaker_id, onset, dur, rttm_filepath))
+    return np.array(rows, dtype=RTTM_TABLE_DTYPE), bad_rows
+
+
+_SPKR_INFO = np.frombuffer(b"SPKR-INFO", dtype=np.uint8)
+# bytes of the files parsed in one pass
+_BUFFER_BYTES = 64 * 1024**2
+# reasons of parse_rttm_line, in the order it checks them
+_RTTM_ERRORS = (
+    "",
+    "Number of fields < 9",
+    "Segment onset not FLOAT",
+    "Segment onset < 0 seconds",
+    "Segment duration not FLOAT",
+    "Segment duration <= 0 seconds",
+)
+
+
+def _gather_tokens(data: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+    """Tokens data[start:end] as a fixed width bytes array."""
+    lengths = ends - starts
+    width = max(int(lengths.max(initial=0)), 1)
+    columns = np.arange(width)
+    index = np.minimum(starts[:, None] + columns, len(data) - 1)
+    chars = np.where(columns < lengths[:, None], data[index], 0)
+    return chars.astype(np.uint8).view(f"S{width}").ravel()
+
+
+def _tokens_to_float(tokens: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """float() of every token, and where float() fails."""
+    try:
+        return tokens.astype(np.float64), np.zeros(len(tokens), dtype=bool)
+    except ValueError:
+        values = np.empty(len(tokens), dtype=np.float64)
+        failed = np.zeros(len(tokens), dtype=bool)
+        for index, token in enumerate(tokens.tolist()):
+            try:
+                values[index] = float(token)
+            except ValueError:
+                values[index] = np.nan
+                failed[index] = True
+        return values, failed
+
+
+def _tokens_to_str(tokens: np.ndarray) -> np.ndarray:
+    """Tokens decoded to str, each run of equal tokens, e.g. the file id
+    of a file, decoded once."""
+    if not len(tokens):
+        return np.empty(0, dtype=object)
+    runs = np.flatnonzero(np.concatenate(([True], tokens[1:] != tokens[:-1])))
+    decoded = {}
+    for token in tokens[runs].tolist():
+        if token not in decoded:
+            decoded[token] = token.decode()
+    strings = np.empty(len(runs), dtype=object)
+    strings[:] = [decoded[token] for token in tokens[runs].tolist()]
+    return np.repeat(strings, np.diff(np.append(runs, len(tokens))))
+
+
+def _parse_rttm_buffers(
+    rttm_paths: List[str], buffers: List[bytes]
+) -> Tuple[np.ndarray, List[dict]]:
+    """Parses the content of several ASCII RTTM files in one pass into a
+    table of RTTM_TABLE_DTYPE, with the checks of parse_rttm_line applied
+    to whole columns at once.
+
+    The files are joined into one byte array, split into lines at "\n"
+    as iterating over a file does, and into fields at the whitespace
+    str.split splits on. Lines starting with SPKR-INFO and blank lines
+    are skipped like _parse_rttm_lines does.
+    """
+    buffers = [
+        buffer if not buffer or buffer.endswith(b"\n") else buffer + b"\n"
+        for buffer in buffers
+    ]
+    data = np.frombuffer(b"".join(buffers), dtype=np.uint8)
+    if not len(data):
+        return np.empty(0, dtype=RTTM_TABLE_DTYPE), []
+    line_counts = np.array([buffer.count(b"\n") for buffer in buffers], dtype=np.int64)
+    file_of_line = np.repeat(np.arange(len(buffers)), line_counts)
+    newlines = np.flatnonzero(data == 10)
+    line_starts = np.concatenate(([0], newlines[:-1] + 1)).astype(np.int64)
+
+    # every line ends with "\n", a separator, so every token ends in its line
+    # the bytes str.split splits on once decoded, \t\n\x0b\x0c\r and
+    # \x1c-\x1f and space, bytes.split misses \x1c-\x1f
+    separator = ((data - np.uint8(9)) <= 4) | ((data - np.uint8(28)) <= 4)
+    token_starts = np.flatnonzero(np.concatenate(([True], separator[:-1])) > separator)
+    token_ends = np.flatnonzero(separator[:-1] < separator[1:]) + 1
+    tokens_before_line_end = np.searchsorted(token_starts, newlines)
+    first_token = np.concatenate(([0], tokens_before_line_end[:-1]))
+    fields = tokens_before_line_end - first_token
+
+    # SPKR-INFO prefix of the raw line, as read_rttm checks it
+    prefix = np.minimum(
+        line_starts[:, None] + np.arange(len(_SPKR_INFO)), len(data) - 1
+    )
+    spkr_info = (data[prefix] == _SPKR_INFO).all(axis=1)
+    kept = ~spkr_info & (fields > 0)
+    for line in np.flatnonzero(~spkr_info & (fields == 0)).tolist():
+        # a line of separators bytes.strip keeps, e.g. \x1c, is not blank
+        kept[line] = bool(bytes(data[line_starts[line] : newlines[line]]).strip())
+    lines = np.flatnonzero(kept)
+
+    line_fields = fields[lines]
+    enough_fields = line_fields >= 9
+
+    def field(number, rows):
+        token = first_token[lines[rows]] + number
+        return _gather_tokens(data, token_starts[token], token_ends[token])
+
+    onset, onset_failed = _tokens_to_float(field(3, enough_fields))
+    dur, dur_failed = _tokens_to_float(field(4, enough_fields))
+    errors = np.ones(len(lines), dtype=np.int8)
+    errors[enough_fields] = np.select(
+        [onset_failed, onset < 0, dur_failed, dur <= 0], [2, 3, 4, 5], default=0
+    )
+    valid = errors == 0
+
+    # zeros, np.empty is much slower to create object fields
+    table = np.zeros(int(valid.sum()), dtype=RTTM_TABLE_DTYPE)
+    table["file_id"] = _tokens_to_str(field(1, valid))
+    table["speaker"] = _tokens_to_str(field(7, valid))
+    table["onset"] = onset[valid[enough_fields]]
+    table["duration"] = dur[valid[enough_fields]]
+    table["rttm_path"] = np.array(rttm_paths, dtype=object)[file_of_line[lines[valid]]]
+
+    bad_rows = []
+    if not valid.all():
+        first_line = np.cumsum(line_counts) - line_counts
+        for row in np.flatnonzero(~valid).tolist():
+            line = lines[row]
+            text = bytes(data[line_starts[line] : newlines[line]])
+            bad_rows.append(
+                {
+                    "rttm_path": rttm_paths[file_of_line[line]],
+                    "line": int(line - first_line[file_of_line[line]]) + 1,
+                    "text": text.decode("utf-8", "replace").strip(),
+                    "reason": _RTTM_ERRORS[errors[row]],
+                }
+            )
+    return table, bad_rows
+
+
+def _parse_rttm_files(rttm_paths: List[str]) -> Tuple[np.ndarray, List[dict]]:
+    """Parses RTTM files, the ASCII ones in passes of up to _BUFFER_BYTES,
+    the others line by line, into one table in the order of rttm_paths.
+    """
+    tables = []
+    bad_rows = []
+    group_paths = []
+    group_buffers = []
+    group_bytes = 0
+
+    def parse_group():
+        if group_paths:
+            table, rows = _parse_rttm_buffers(group_paths, group_buffers)
+            tables.append(table)
+            bad_rows.extend(rows)
+
+    for rttm_path in rttm_paths:
+        with open(rttm_path, "rb") as f:
+            buffer = f.read()
+        if not buffer.isascii() or b"\x00" in buffer:
+            parse_group()
+            group_paths, group_buffers, group_bytes = [], [], 0
+            table, rows = _parse_rttm_lines(rttm_path)
+            tables.append(table)
+            bad_rows.extend(rows)
+            continue
+        if group_bytes + len(buffer) > _BUFFER_BYTES:
+            parse_group()
+            group_paths, group_buffers, group_bytes = [], [], 0
+        group_paths.append(rttm_path)
+        group_buffers.append(buffer)
+        group_bytes += len(buffer)
+    parse_group()
+    table = np.concatenate(tables) if tables else np.empty(0, dtype=RTTM_TABLE_DTYPE)
+    return table, bad_rows
+
+
+def read_rttm_bulk(
+    rttm_paths: Union[str, Path, List[Union[str, Path]]],
+    num_workers: int = 1,
+) -> Tuple[np.ndarray, List[dict]]:
+    """Reads many RTTM files into one columnar table.
+
+    The files are joined and split into lines and fields with numpy, many
+    files per pass, and the checks of parse_rttm_line are applied to
+    whole columns at once. Invalid rows are dropped and reported instead
+    of aborting the read.
+
+    Args:
+        rttm_paths (str | Path | List): An RTTM file, a directory searched
+            recursively for *.rttm files, or a list of RTTM files.
+        num_workers (int, optional): The number of processes parsing
+            contiguous groups of files in parallel. The table is pickled
+            back from the workers, which is slower than parsing in one
+            process below millions of lines. Defaults to 1.
+
+    Returns:
+        Tuple[np.ndarray, List[dict]]: A structured array of
+            RTTM_TABLE_DTYPE (file_id, speaker, onset, duration,
+            rttm_path) with the valid rows in file order, and the
+            invalid rows as dicts of rttm_path, line, text and reason.
+
+    Example:
+        # Usage of the read_rttm_bulk function
+        table, bad_rows = read_rttm_bulk("sampled_config_60mins/", num_workers=4)
+        segments = rttm_table_to_segments(table)
+    """
+    if isinstance(rttm_paths, (str, Path)):
+        rttm_paths = (
+            sorted(Path(rttm_paths).rglob("*.rttm"))
+            if os.path.isdir(rttm_paths)
+            else [rttm_paths]
+        )
+    rttm_paths = [str(path) for path in rttm_paths]
+
+    if num_workers > 1 and len(rttm_paths) > 1:
+        # contiguous groups, so the table stays in file order
+        groups = [
+            group.tolist()
+            for group in np.array_split(
+                np.array(rttm_paths, dtype=object), min(num_workers, len(rttm_paths))
+            )
+        ]
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = list(executor.map(_parse_rttm_files, groups))
+    else:
+        results = [_parse_rttm_files(rttm_paths)]
+
+    bad_rows = [row for _, rows in results for row in rows]
+    if bad_rows:
+        logger.warning(
+            "%s invalid RTTM rows dropped, e.g. %s", len(bad_rows), bad_rows[0]
+        )
+    table = np.concatenate([table for table, _ in results])
+    return table, bad_rows
+
+
+def _round_like_python(values: np.ndarray, decimals: int = 2) -> np.ndarray:
+    """round(value, decimals) of every value.
+
+    np.round scales by 10**decimals first, which only differs from
+    Python's correctly rounded round where the scaled value is within
+    its rounding error of a half, e.g. 1333.153 + 12.332. Those values
+    are rounded with round().
+    """
+    scaled = values * 10.0**decimals
+    rounded = np.round(scaled) / 10.0**decimals
+    with np.errstate(invalid="ignore"):
+        distance = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5)
+        near_half = ~(distance > 8 * np.spacing(np.abs(scaled)) + 1e-12)
+    for index in np.flatnonzero(near_half & np.isfinite(values)).tolist():
+        rounded[index] = round(float(values[index]), decimals)
+    return rounded
+
+
+def rttm_table_to_segments(table: np.ndarray) -> Dict[str, List[Tuple[float]]]:
+    """Groups a table of read_rttm_bulk into speech segments per RTTM
+    file, as read_rttm followed by validate_segments would return them.
+
+    Args:
+        table (np.ndarray): Table of RTTM_TABLE_DTYPE.
+
+    Returns:
+        Dict[str, List[Tuple[float]]]: {rttm_path: [(start, end), ...]}
+            in file order.
+    """
+    starts = table["onset"]
+    ends = _round_like_python(starts + table["duration"])
+    keep = (starts >= 0) & (ends > starts)
+    segments = {path: [] for path in dict.fromkeys(table["rttm_path"].tolist())}
+
+    paths = table["rttm_path"][keep]
+    starts = starts[keep].tolist()
+    ends = ends[keep].tolist()
+    # rows of a file are contiguous, slice the rows between path changes
+    boundaries = np.flatnonzero(paths[1:] != paths[:-1]) + 1
+    bounds = [0, *boundaries.tolist(), len(paths)]
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        if last > first:
+            segments[paths[first]] = list(zip(starts[first:last], ends[first:last]))
+    return segments
+
+
 def write_rttm(
     segments: List[Tuple[float]],
     output_rttm_filepath: Union[Path, str],
@@ -0,0 +1,4 @@
+"""This `evaluation` module includes module(s) which score VAD
+predictions against ground truth labels."""
+
+from . import chunk_metrics, frame_metrics, threshold_sweep
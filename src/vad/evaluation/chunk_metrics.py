@@ -0,0 +1,78 @@
+"""Chunk level metrics
+Accuracy, false alarm rate, missed detection rate and ROC-AUC of one
+speech/non-speech decision per chunk, computed with numpy.
+"""
+
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def roc_auc(labels: np.ndarray, scores: np.ndarray) -> float:
+    """Area under the ROC curve, from the ranks of the scores
+    (Mann-Whitney U), tied scores getting their average rank.
+
+    Args:
+        labels (np.ndarray): 1 for speech, 0 for non-speech.
+        scores (np.ndarray): Higher means more likely speech, e.g.
+            speech probabilities or hard 0/1 predictions.
+
+    Returns:
+        float: ROC-AUC, nan when only one class is present.
+
+    Examples:
+        >>> roc_auc(np.array([0, 0, 1, 1]), np.array([0.1, 0.4, 0.35, 0.8]))
+        0.75
+    """
+    labels = np.asarray(labels).astype(bool)
+    scores = np.asarray(scores, dtype=np.float64)
+    positives = int(labels.sum())
+    negatives = len(labels) - positives
+    if positives == 0 or negatives == 0:
+        return float("nan")
+
+    order = np.argsort(scores, kind="mergesort")
+    sorted_scores = scores[order]
+    # average rank (1-based) of every group of tied scores
+    _, group_start, group_count = np.unique(
+        sorted_scores, return_index=True, return_counts=True
+    )
+    group_rank = group_start + (group_count + 1) / 2
+    ranks = np.empty(len(scores))
+    ranks[order] = np.repeat(group_rank, group_count)
+
+    rank_sum = ranks[labels].sum()
+    return float((rank_sum - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+def chunk_metrics(
+    labels: np.ndarray, preds: np.ndarray, scores: Optional[np.ndarray] = None
+) -> Dict[str, float]:
+    """Accuracy, FAR, MDR and ROC-AUC of chunk predictions.
+
+    Args:
+        labels (np.ndarray): Ground truth, 1 for speech, 0 for
+            non-speech.
+        preds (np.ndarray): Predictions, 1 for speech, 0 for non-speech.
+        scores (np.ndarray, optional): Speech probabilities, used for
+            ROC-AUC. Defaults to None, using the hard predictions.
+
+    Returns:
+        Dict[str, float]: accuracy, far (false positives / negatives),
+            mdr (false negatives / positives) and roc_auc.
+    """
+    labels = np.asarray(labels).astype(bool)
+    preds = np.asarray(preds).astype(bool)
+    total_positives = int(labels.sum())
+    total_negatives = len(labels) - total_positives
+    false_positives = int((preds & ~labels).sum())
+    false_negatives = int((~preds & labels).sum())
+    return {
+        "accuracy": float((preds == labels).mean()) if len(labels) else float("nan"),
+        "far": false_positives / total_negatives if total_negatives else float("nan"),
+        "mdr": false_negatives / total_positives if total_positives else float("nan"),
+        "roc_auc": roc_auc(labels, preds if scores is None else scores),
+    }
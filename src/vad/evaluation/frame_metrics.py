@@ -0,0 +1,330 @@
+"""Frame level metrics
+Scores speech segments or speech posteriors against RTTM references,
+frame by frame, with numpy only.
+
+Reference and hypothesis segments are turned into frame labels with
+AudioUtils.frame_labels, a frame being speech when more than half of it
+is covered. Frames within `collar` seconds of a reference boundary are
+not scored, the forgiveness collar of NIST md-eval.
+"""
+
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.folder_audio_utils.audio_management import AudioUtils
+
+logger = logging.getLogger(__name__)
+
+COUNT_KEYS = ("scored", "speech", "non_speech", "false_alarm", "missed", "hit")
+
+
+def read_segments(
+    rttm_paths: Union[str, Path, List[Union[str, Path]]], num_workers: int = 1
+) -> Dict[str, List[Tuple[float, float]]]:
+    """Reads RTTM files with read_rttm_bulk into speech segments per file
+    id, the RTTM file name without extension as `vad infer` writes it.
+
+    Args:
+        rttm_paths (str | Path | List): An RTTM file, a directory searched
+            recursively for *.rttm files, or a list of RTTM files.
+        num_workers (int, optional): See read_rttm_bulk. Defaults to 1.
+
+    Returns:
+        Dict[str, List[Tuple[float, float]]]: {file_id: [(start, end)]}.
+    """
+    from src.vad.data_prep.speech_segments import (
+        read_rttm_bulk,
+        rttm_table_to_segments,
+    )
+
+    table, _ = read_rttm_bulk(rttm_paths, num_workers=num_workers)
+    return {
+        Path(rttm_path).stem: segments
+        for rttm_path, segments in rttm_table_to_segments(table).items()
+    }
+
+
+def _frame_labels(segments, number_of_frames: int, frame_shift: float) -> np.ndarray:
+    return AudioUtils.frame_labels(
+        segments,
+        number_of_frames * frame_shift,
+        sample_rate=1 / frame_shift,
+        frame_duration=frame_shift,
+        per=0.5,
+    )[:number_of_frames]
+
+
+def scored_frames(
+    reference_segments: List[Tuple[float, float]],
+    number_of_frames: int,
+    frame_shift: float = 0.01,
+    collar: float = 0.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Reference frame labels and the mask of frames outside the collars.
+
+    Args:
+        reference_segments (List[Tuple[float, float]]): Reference speech
+            segments in seconds.
+        number_of_frames (int): Number of frames of the recording.
+        frame_shift (float, optional): Frame length in seconds. Defaults
+            to 0.01.
+        collar (float, optional): Seconds on each side of every
+            reference boundary which are not scored. Defaults to 0.0.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: uint8 reference labels and bool
+            mask of scored frames, both of length number_of_frames.
+    """
+    reference = _frame_labels(reference_segments, number_of_frames, frame_shift)
+    if collar <= 0 or not len(reference_segments):
+        return reference, np.ones(number_of_frames, dtype=bool)
+    boundaries = np.asarray(reference_segments, dtype=float).reshape(-1)
+    collars = np.stack((boundaries - collar, boundaries + collar), axis=1)
+    return reference, _frame_labels(collars, number_of_frames, frame_shift) == 0
+
+
+def frame_counts(
+    reference: np.ndarray, hypothesis: np.ndarray, mask: Optional[np.ndarray] = None
+) -> Dict[str, int]:
+    """Frame counts of a hypothesis against a reference.
+
+    Args:
+        reference (np.ndarray): 0/1 reference frame labels.
+        hypothesis (np.ndarray): 0/1 hypothesis frame labels, same length.
+        mask (np.ndarray, optional): Frames to score. Defaults to None,
+            every frame.
+
+    Returns:
+        Dict[str, int]: scored, speech, non_speech, false_alarm, missed
+            and hit frame counts.
+    """
+    reference = np.asarray(reference).astype(bool)
+    hypothesis = np.asarray(hypothesis).astype(bool)
+    if mask is not None:
+        reference, hypothesis = reference[mask], hypothesis[mask]
+    return {
+        "scored": int(len(reference)),
+        "speech": int(reference.sum()),
+        "non_speech": int((~reference).sum()),
+        "false_alarm": int((hypothesis & ~reference).sum()),
+        "missed": int((~hypothesis & reference).sum()),
+        "hit": int((hypothesis & reference).sum()),
+    }
+
+
+def rates(counts: Dict[str, int], frame_shift: float = 0.01) -> Dict[str, float]:
+    """Error rates of frame counts, counts of several files are summed
+    first so the aggregate is weighted by duration.
+
+    Returns:
+        Dict[str, float]: detection_error ((false alarm + missed) /
+            speech), far (false alarm / non-speech), mdr (missed /
+            speech), precision, recall and the scored, speech,
+            false_alarm and missed durations in seconds.
+    """
+
+    def ratio(numerator, denominator):
+        return numerator / denominator if denominator else float("nan")
+
+    return {
+        "detection_error": ratio(
+            counts["false_alarm"] + counts["missed"], counts["speech"]
+        ),
+        "far": ratio(counts["false_alarm"], counts["non_speech"]),
+        "mdr": ratio(counts["missed"], counts["speech"]),
+        "precision": ratio(counts["hit"], counts["hit"] + counts["false_alarm"]),
+        "recall": ratio(counts["hit"], counts["speech"]),
+        "scored_seconds": counts["scored"] * frame_shift,
+        "speech_seconds": counts["speech"] * frame_shift,
+        "false_alarm_seconds": counts["false_alarm"] * frame_shift,
+        "missed_seconds": counts["missed"] * frame_shift,
+    }
+
+
+def evaluate_segments(
+    references: Dict[str, List[Tuple[float, float]]],
+    hypotheses: Dict[str, List[Tuple[float, float]]],
+    durations: Optional[Dict[str, float]] = None,
+    frame_shift: float = 0.01,
+    collar: float = 0.0,
+) -> Dict[str, dict]:
+    """Scores hypothesis speech segments against reference segments.
+
+    Args:
+        references (Dict[str, List[Tuple[float, float]]]): Reference
+            segments per file id, e.g. from the RTTM files.
+        hypotheses (Dict[str, List[Tuple[float, float]]]): Hypothesis
+            segments per file id, a file without hypothesis counts as
+            no speech detected.
+        durations (Dict[str, float], optional): Duration in seconds per
+            file id. Defaults to None, the last reference or hypothesis
+            segment end.
+        frame_shift (float, optional): Frame length in seconds. Defaults
+            to 0.01.
+        collar (float, optional): Seconds on each side of every
+            reference boundary which are not scored. Defaults to 0.0.
+
+    Returns:
+        Dict[str, dict]: {"files": {file_id: rates}, "total": rates}, see
+            `rates`.
+
+    Examples:
+        >>> evaluate_segments({"a": [(1.0, 2.0)]}, {"a": [(1.0, 2.5)]}, {"a": 4.0})["total"]["far"]
+        0.16666666666666666
+    """
+    files = {}
+    total = dict.fromkeys(COUNT_KEYS, 0)
+    for file_id, reference_segments in references.items():
+        hypothesis_segments = hypotheses.get(file_id, [])
+        if durations and file_id in durations:
+            duration = durations[file_id]
+        else:
+            duration = max(
+                [end for _, end in reference_segments]
+                + [end for _, end in hypothesis_segments]
+                + [0.0]
+            )
+        number_of_frames = int(round(duration / frame_shift))
+        reference, mask = scored_frames(
+            reference_segments, number_of_frames, frame_shift, collar
+        )
+        hypothesis = _frame_labels(hypothesis_segments, number_of_frames, frame_shift)
+        counts = frame_counts(reference, hypothesis, mask)
+        files[file_id] = rates(counts, frame_shift)
+        for key in COUNT_KEYS:
+            total[key] += counts[key]
+    missing = set(hypotheses) - set(references)
+    if missing:
+        logger.warning(f"{len(missing)} hypothesis files without reference ignored")
+    return {"files": files, "total": rates(total, frame_shift)}
+
+
+def roc_curve(
+    labels: np.ndarray, scores: np.ndarray, n_thresholds: Optional[int] = None
+) -> Dict[str, np.ndarray]:
+    """ROC curve of speech posteriors, every distinct score being a
+    threshold, or n_thresholds evenly spaced ones in [0, 1] which bounds
+    the memory and cost for hundreds of hours of frames.
+
+    Args:
+        labels (np.ndarray): 0/1 reference labels.
+        scores (np.ndarray): Speech posteriors, higher means speech.
+        n_thresholds (int, optional): Number of histogram bins. Defaults
+            to None, exact curve.
+
+    Returns:
+        Dict[str, np.ndarray]: thresholds (decreasing), fpr and tpr, a
+            frame being speech when its score is >= threshold, starting
+            at (0, 0) with an infinite threshold.
+    """
+    labels = np.asarray(labels).astype(bool)
+    scores = np.asarray(scores)
+    if not np.issubdtype(scores.dtype, np.floating):
+        scores = scores.astype(np.float64)
+    if n_thresholds:
+        edges = np.linspace(0.0, 1.0, n_thresholds + 1)
+        bins = np.clip((scores * n_thresholds).astype(np.int64), 0, n_thresholds - 1)
+        positives = np.bincount(bins[labels], minlength=n_thresholds)[::-1]
+        negatives = np.bincount(bins[~labels], minlength=n_thresholds)[::-1]
+        thresholds = edges[:-1][::-1]
+    else:
+        # the order within equal scores does not matter, they are grouped
+        order = np.argsort(scores)[::-1]
+        sorted_scores = scores[order]
+        sorted_labels = labels[order]
+        # last index of every group of equal scores
+        distinct = np.flatnonzero(np.diff(sorted_scores)) if len(scores) else []
+        group_ends = np.append(distinct, len(scores) - 1) if len(scores) else []
+        cumulative_positives = np.cumsum(sorted_labels)[group_ends]
+        positives = np.diff(np.concatenate(([0], cumulative_positives)))
+        negatives = (
+            np.diff(np.concatenate(([0], np.asarray(group_ends) + 1))) - positives
+        )
+        thresholds = sorted_scores[group_ends].astype(np.float64)
+    tp = np.concatenate(([0], np.cumsum(positives)))
+    fp = np.concatenate(([0], np.cumsum(negatives)))
+    total_positives = tp[-1]
+    total_negatives = fp[-1]
+    return {
+        "thresholds": np.concatenate(([np.inf], thresholds)),
+        "fpr": fp / total_negatives if total_negatives else np.full(len(fp), np.nan),
+        "tpr": tp / total_positives if total_positives else np.full(len(tp), np.nan),
+    }
+
+
+def curve_auc(curve: Dict[str, np.ndarray]) -> float:
+    """Area under a roc_curve, by the trapezoidal rule."""
+    fpr, tpr = curve["fpr"], curve["tpr"]
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+
+def det_curve(curve: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """DET curve, false alarm rate against missed detection rate, of a
+    roc_curve."""
+    return {
+        "thresholds": curve["thresholds"],
+        "far": curve["fpr"],
+        "mdr": 1 - curve["tpr"],
+    }
+
+
+def equal_error_rate(curve: Dict[str, np.ndarray]) -> Tuple[float, float]:
+    """Equal error rate of a roc_curve and its threshold, at the first
+    threshold where the missed detection rate is not above the false
+    alarm rate."""
+    mdr = 1 - curve["tpr"]
+    index = int(np.argmax(mdr <= curve["fpr"]))
+    return float((mdr[index] + curve["fpr"][index]) / 2), float(
+        curve["thresholds"][index]
+    )
+
+
+def evaluate_posteriors(
+    references: Dict[str, List[Tuple[float, float]]],
+    posteriors: Dict[str, np.ndarray],
+    frame_shift: float = 0.01,
+    collar: float = 0.0,
+    n_thresholds: Optional[int] = None,
+) -> Dict[str, object]:
+    """ROC and DET curves of per frame speech posteriors, e.g. from
+    model_eval_sliding_window, over every scored frame of every file.
+
+    Args:
+        references (Dict[str, List[Tuple[float, float]]]): Reference
+            segments per file id.
+        posteriors (Dict[str, np.ndarray]): Speech probability per frame
+            of frame_shift seconds, per file id.
+        frame_shift (float, optional): Frame length in seconds of the
+            posteriors. Defaults to 0.01.
+        collar (float, optional): Seconds on each side of every
+            reference boundary which are not scored. Defaults to 0.0.
+        n_thresholds (int, optional): See roc_curve. Defaults to None.
+
+    Returns:
+        Dict[str, object]: roc (roc_curve), det (det_curve), roc_auc,
+            eer and eer_threshold.
+    """
+    labels, scores = [], []
+    for file_id, probs in posteriors.items():
+        if file_id not in references:
+            continue
+        probs = np.asarray(probs)
+        reference, mask = scored_frames(
+            references[file_id], len(probs), frame_shift, collar
+        )
+        labels.append(reference[mask])
+        scores.append(probs[mask])
+    labels = np.concatenate(labels) if labels else np.zeros(0, dtype=np.uint8)
+    scores = np.concatenate(scores) if scores else np.zeros(0)
+    curve = roc_curve(labels, scores, n_thresholds)
+    eer, eer_threshold = equal_error_rate(curve)
+    return {
+        "roc": curve,
+        "det": det_curve(curve),
+        "roc_auc": curve_auc(curve),
+        "eer": eer,
+        "eer_threshold": eer_threshold,
+    }
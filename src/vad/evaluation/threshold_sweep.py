@@ -0,0 +1,220 @@
+"""Threshold sweep
+Computes FAR, MDR and accuracy of saved speech posteriors over a grid
+of thresholds and smoothing parameters, and picks the operating point
+meeting a target false alarm rate.
+
+Each smoothing setting smooths the posteriors once; every threshold is
+then scored at once by counting, with a binary search in the sorted
+speech and non-speech posteriors, how many are >= the threshold.
+"""
+
+import json
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.vad.inference.posteriors import IGNORE_LABEL, load_posteriors
+from src.vad.inference.sliding_window import SMOOTHING_METHODS, smooth_window_probs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLDS = np.round(np.linspace(0.0, 1.0, 101), 2)
+
+
+def smooth_probs(probs: np.ndarray, frames: int, method: str = "mean") -> np.ndarray:
+    """Centred moving mean or median of a posterior track over `frames`
+    frames, fewer at both ends. frames <= 1 leaves the track as is.
+
+    Examples:
+        >>> smooth_probs(np.array([0.0, 1.0, 0.0, 0.0]), 3)
+        array([0.5       , 0.33333334, 0.33333334, 0.        ], dtype=float32)
+    """
+    probs = np.asarray(probs, dtype=np.float32)
+    if frames <= 1 or not len(probs):
+        return probs
+    # smooth_window_probs aggregates the `frames` values ending at every
+    # frame, shifting it by half a span centres it
+    trailing = smooth_window_probs(
+        probs, frames, number_of_frames=len(probs) + frames - 1, method=method
+    )
+    start = frames - 1 - frames // 2
+    return trailing[start : start + len(probs)]
+
+
+def threshold_counts(
+    probs: np.ndarray, labels: np.ndarray, thresholds: Sequence[float]
+) -> Dict[str, np.ndarray]:
+    """Confusion counts of `probs >= threshold` for every threshold.
+
+    Args:
+        probs (np.ndarray): Speech posteriors.
+        labels (np.ndarray): 0/1 labels, IGNORE_LABEL is not scored.
+        thresholds (Sequence[float]): Thresholds to score.
+
+    Returns:
+        Dict[str, np.ndarray]: tp, fp, fn and tn per threshold.
+    """
+    labels = np.asarray(labels)
+    probs = np.asarray(probs)
+    speech = np.sort(probs[labels == 1])
+    non_speech = np.sort(probs[labels == 0])
+    thresholds = np.asarray(thresholds, dtype=probs.dtype)
+    tp = len(speech) - np.searchsorted(speech, thresholds, side="left")
+    fp = len(non_speech) - np.searchsorted(non_speech, thresholds, side="left")
+    return {
+        "tp": tp,
+        "fp": fp,
+        "fn": len(speech) - tp,
+        "tn": len(non_speech) - fp,
+    }
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1), np.nan)
+
+
+def sweep(
+    probs: Dict[str, np.ndarray],
+    labels: Dict[str, np.ndarray],
+    thresholds: Sequence[float] = DEFAULT_THRESHOLDS,
+    smoothing: Sequence[Tuple[str, int]] = (("mean", 1),),
+) -> Dict[str, np.ndarray]:
+    """Scores every (smoothing, threshold) pair of the grid.
+
+    Recordings are smoothed separately, so smoothing never spans two
+    recordings, then scored together.
+
+    Args:
+        probs (Dict[str, np.ndarray]): Speech posteriors per recording,
+            see load_posteriors.
+        labels (Dict[str, np.ndarray]): Labels per recording.
+        thresholds (Sequence[float], optional): A frame is speech when
+            its posterior is >= threshold. Defaults to 0.0 to 1.0 by 0.01.
+        smoothing (Sequence[Tuple[str, int]], optional): (method, frames)
+            pairs, method "mean" or "median". Defaults to no smoothing.
+
+    Returns:
+        Dict[str, np.ndarray]: Columns method, frames, threshold, far,
+            mdr, accuracy, precision and recall, one row per pair.
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    ids = list(probs)
+    labels_all = (
+        np.concatenate([np.asarray(labels[key]) for key in ids])
+        if ids
+        else np.zeros(0, dtype=np.uint8)
+    )
+    columns: Dict[str, List[np.ndarray]] = {
+        name: []
+        for name in (
+            "method",
+            "frames",
+            "threshold",
+            "far",
+            "mdr",
+            "accuracy",
+            "precision",
+            "recall",
+        )
+    }
+    for method, frames in smoothing:
+        if method not in SMOOTHING_METHODS:
+            raise ValueError(f"method must be one of {SMOOTHING_METHODS}, got {method}")
+        smoothed = (
+            np.concatenate([smooth_probs(probs[key], frames, method) for key in ids])
+            if ids
+            else np.zeros(0, dtype=np.float32)
+        )
+        counts = threshold_counts(smoothed, labels_all, thresholds.astype(np.float32))
+        scored = counts["tp"] + counts["fp"] + counts["fn"] + counts["tn"]
+        columns["method"].append(np.full(len(thresholds), method))
+        columns["frames"].append(np.full(len(thresholds), frames))
+        columns["threshold"].append(thresholds)
+        columns["far"].append(_ratio(counts["fp"], counts["fp"] + counts["tn"]))
+        columns["mdr"].append(_ratio(counts["fn"], counts["tp"] + counts["fn"]))
+        columns["accuracy"].append(_ratio(counts["tp"] + counts["tn"], scored))
+        columns["precision"].append(_ratio(counts["tp"], counts["tp"] + counts["fp"]))
+        columns["recall"].append(_ratio(counts["tp"], counts["tp"] + counts["fn"]))
+    return {name: np.concatenate(values) for name, values in columns.items()}
+
+
+def operating_point(
+    results: Dict[str, np.ndarray], target_far: float
+) -> Optional[Dict[str, object]]:
+    """The row of a sweep with the lowest MDR among those with
+    FAR <= target_far, the highest accuracy breaking ties.
+
+    Returns:
+        Optional[Dict[str, object]]: The row, or None when no row meets
+            the target.
+    """
+    candidates = np.flatnonzero(results["far"] <= target_far)
+    if not len(candidates):
+        logger.warning(f"No threshold reaches a FAR <= {target_far}")
+        return None
+    order = np.lexsort((-results["accuracy"][candidates], results["mdr"][candidates]))
+    row = candidates[order[0]]
+    return {name: values[row].item() for name, values in results.items()}
+
+
+def parse_smoothing(specification: str) -> List[Tuple[str, int]]:
+    """Parses "mean:1,mean:5,median:9" into [(method, frames), ...]."""
+    grid = []
+    for item in specification.split(","):
+        method, _, frames = item.strip().partition(":")
+        grid.append((method, int(frames or 1)))
+    return grid
+
+
+def sweep_file(
+    posteriors_path: str,
+    thresholds: Sequence[float] = DEFAULT_THRESHOLDS,
+    smoothing: Sequence[Tuple[str, int]] = (("mean", 1),),
+    target_far: float = 0.05,
+    output_path: Optional[str] = None,
+) -> Dict[str, object]:
+    """Sweeps the posteriors of a save_posteriors file.
+
+    Args:
+        posteriors_path (str): The .npz file.
+        thresholds (Sequence[float], optional): See sweep.
+        smoothing (Sequence[Tuple[str, int]], optional): See sweep.
+            Chunk posteriors, saved with frame_shift 0, cannot be
+            smoothed.
+        target_far (float, optional): FAR of the operating point.
+            Defaults to 0.05.
+        output_path (str, optional): Writes the report as JSON there.
+            Defaults to None.
+
+    Returns:
+        Dict[str, object]: operating_point (see operating_point), target_far,
+            frame_shift and the sweep rows.
+
+    Example:
+        # Usage of the sweep_file function
+        smoothing = parse_smoothing("mean:1,mean:25")
+        report = sweep_file("chunked_audio/posteriors.npz", smoothing=smoothing)
+        threshold = report["operating_point"]["threshold"]
+    """
+    probs, labels, frame_shift = load_posteriors(posteriors_path)
+    if frame_shift == 0 and any(frames > 1 for _, frames in smoothing):
+        raise ValueError("Chunk posteriors (frame_shift 0) cannot be smoothed")
+    results = sweep(probs, labels, thresholds, smoothing)
+    report = {
+        "target_far": target_far,
+        "frame_shift": frame_shift,
+        "scored": int(
+            sum(
+                int((np.asarray(value) != IGNORE_LABEL).sum())
+                for value in labels.values()
+            )
+        ),
+        "operating_point": operating_point(results, target_far),
+        "sweep": {name: values.tolist() for name, values in results.items()},
+    }
+    if output_path:
+        with open(output_path, "w", encoding="UTF-8") as outfile:
+            json.dump(report, outfile, indent=2)
+    return report
@@ -0,0 +1,7 @@
+"""This `inference` module includes module(s) which run MarbleNet on
+audio that is already held in memory, without going through chunked
+WAV files and NeMo manifests.
+
+Submodules are imported explicitly by their callers so that importing
+this package does not pull in NeMo.
+"""
@@ -0,0 +1,267 @@
+"""Dynamic micro-batching
+Collects the windows submitted by concurrent callers, forms batches up
+to a maximum size or a maximum wait time, runs one forward pass per
+batch and scatters the logits back to the callers.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable
+
+import numpy as np
+
+from src.vad.inference.marblenet_model import infer_chunks
+
+logger = logging.getLogger(__name__)
+
+# number of recent requests kept for the latency percentiles
+_LATENCY_HISTORY = 10000
+
+
+class _Request:
+    __slots__ = ("windows", "future", "arrival", "scheduled", "parts", "completed")
+
+    def __init__(self, windows, future):
+        self.windows = windows
+        self.future = future
+        self.arrival = time.monotonic()
+        self.scheduled = 0
+        self.parts = []
+        self.completed = 0
+
+    @property
+    def unscheduled(self):
+        return len(self.windows) - self.scheduled
+
+
+class DynamicBatchScheduler:
+    """Runs the windows of concurrent callers through one model.
+
+    A background thread forms a batch as soon as `max_batch_size`
+    windows are waiting, or when the oldest waiting request has waited
+    `max_wait_ms`. Batches are filled round-robin from every waiting
+    request, each getting an equal share of the room left, so a request
+    queued behind a long recording is answered after about as many
+    batches as its own share needs, not after the whole recording.
+
+    With `latency_target_ms`, the wait is shortened so that waiting plus
+    the forward pass, estimated from recent batches, stays within the
+    target: interactive callers are answered quickly when the load is
+    light, while under load batches fill up before the wait expires and
+    run at full size.
+
+    Args:
+        model (torch.nn.Module): The model to use for inference.
+        max_batch_size (int, optional): Maximum number of windows per
+            forward pass. Defaults to 320.
+        max_wait_ms (float, optional): Maximum time the oldest request
+            waits for a batch to fill up. Defaults to 10.
+        latency_target_ms (float, optional): Target latency of a request
+            of at most one batch. Defaults to None, waiting max_wait_ms.
+        infer_fn (Callable, optional): Function mapping a window array
+            to a logits array, defaults to infer_chunks with `model`.
+
+    Example:
+        scheduler = DynamicBatchScheduler(load_model(), max_wait_ms=5)
+        logits = scheduler.infer(windows)
+        print(scheduler.stats())
+        scheduler.close()
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_size: int = 320,
+        max_wait_ms: float = 10.0,
+        latency_target_ms: float = None,
+        infer_fn: Callable = None,
+    ):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.latency_target = (
+            None if latency_target_ms is None else latency_target_ms / 1000
+        )
+        self.infer_fn = infer_fn or (
+            lambda windows: infer_chunks(model, windows, len(windows)).numpy()
+        )
+        self.number_of_classes = len(model.cfg.labels) if model is not None else 2
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._forward_time_per_window = None
+        self._latencies = deque(maxlen=_LATENCY_HISTORY)
+        self._batch_count = 0
+        self._window_count = 0
+        self._busy_time = 0.0
+        self._start_time = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, windows: np.ndarray) -> Future:
+        """Queues windows of shape (n_windows, window_len) for inference.
+
+        Returns:
+            Future: resolves to the logits, of shape (n_windows, n_classes).
+        """
+        future = Future()
+        if len(windows) == 0:
+            future.set_result(np.zeros((0, self.number_of_classes), np.float32))
+            return future
+        self._queue.put(_Request(windows, future))
+        return future
+
+    def infer(self, windows: np.ndarray) -> np.ndarray:
+        """Blocking inference, see submit.
+
+        Returns:
+            np.ndarray: logits of shape (n_windows, n_classes).
+        """
+        return self.submit(windows).result()
+
+    def stats(self) -> dict:
+        """Throughput, batch size and latency of the batches run so far.
+
+        Returns:
+            dict: batches, windows, mean_batch_size, windows_per_second
+                (over the wall time since start), busy_fraction (share
+                of that time spent in forward passes) and p50/p95/p99
+                request latency in milliseconds.
+        """
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            batch_count = self._batch_count
+            window_count = self._window_count
+            busy_time = self._busy_time
+        wall_time = max(time.monotonic() - self._start_time, 1e-9)
+        stats = {
+            "batches": batch_count,
+            "windows": window_count,
+            "mean_batch_size": window_count / batch_count if batch_count else 0.0,
+            "windows_per_second": window_count / wall_time,
+            "busy_fraction": busy_time / wall_time,
+        }
+        for percentile in (50, 95, 99):
+            stats[f"latency_p{percentile}_ms"] = (
+                float(np.percentile(latencies, percentile)) if len(latencies) else 0.0
+            )
+        return stats
+
+    def close(self):
+        """Stops the background thread once the queued requests are done."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _wait_budget(self):
+        if self.latency_target is None or self._forward_time_per_window is None:
+            return self.max_wait
+        expected_forward = self._forward_time_per_window * self.max_batch_size
+        return min(self.max_wait, max(self.latency_target - expected_forward, 0.0))
+
+    def _run(self):
+        pending = deque()
+        closing = False
+        while True:
+            if not pending:
+                request = self._queue.get()
+                if request is None:
+                    return
+                pending.append(request)
+            # requests which arrived while the previous batch ran share the
+            # next one with the requests already pending
+            while not closing:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                else:
+                    pending.append(request)
+
+            queued_windows = sum(request.unscheduled for request in pending)
+            deadline = min(request.arrival for request in pending) + self._wait_budget()
+            while queued_windows < self.max_batch_size and not closing:
+                timeout = deadline - time.monotonic()
+                try:
+                    request = (
+                        self._queue.get(timeout=timeout)
+                        if timeout > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                pending.append(request)
+                queued_windows += request.unscheduled
+
+            self._run_batch(self._take_batch(pending))
+            # the windows left of a failed or cancelled request are not run
+            pending = deque(request for request in pending if not request.future.done())
+            if closing and not pending:
+                return
+
+    def _take_batch(self, pending):
+        pieces = []
+        batch_size = 0
+        while pending and batch_size < self.max_batch_size:
+            share = max((self.max_batch_size - batch_size) // len(pending), 1)
+            for _ in range(len(pending)):
+                if batch_size == self.max_batch_size:
+                    break
+                request = pending.popleft()
+                take = min(request.unscheduled, share, self.max_batch_size - batch_size)
+                pieces.append((request, request.scheduled, request.scheduled + take))
+                request.scheduled += take
+                batch_size += take
+                # requests with windows left go behind the others
+                if request.unscheduled:
+                    pending.append(request)
+        return pieces
+
+    def _run_batch(self, pieces):
+        start_time = time.monotonic()
+        try:
+            windows = np.concatenate(
+                [request.windows[start:end] for request, start, end in pieces]
+            )
+            logits = self.infer_fn(windows)
+        except Exception as error:
+            for request, _, _ in pieces:
+                if not request.future.done():
+                    request.future.set_exception(error)
+            return
+        end_time = time.monotonic()
+
+        offset = 0
+        finished_latencies = []
+        for request, start, end in pieces:
+            request.parts.append(logits[offset : offset + end - start])
+            offset += end - start
+            request.completed += end - start
+            if request.completed == len(request.windows) and not request.future.done():
+                request.future.set_result(
+                    request.parts[0]
+                    if len(request.parts) == 1
+                    else np.concatenate(request.parts)
+                )
+                finished_latencies.append(end_time - request.arrival)
+
+        forward_time = end_time - start_time
+        per_window = forward_time / len(windows)
+        with self._lock:
+            self._forward_time_per_window = (
+                per_window
+                if self._forward_time_per_window is None
+                else 0.8 * self._forward_time_per_window + 0.2 * per_window
+            )
+            self._batch_count += 1
+            self._window_count += len(windows)
+            self._busy_time += forward_time
+            self._latencies.extend(finished_latencies)
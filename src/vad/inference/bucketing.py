@@ -0,0 +1,152 @@
+"""Length-bucketed batching
+Groups inputs of different lengths into batches of similar lengths, with
+a budget on the padded samples of a batch instead of a fixed number of
+inputs, so that short inputs are not padded to the longest one of a
+mixed batch and long inputs do not make batches too large.
+"""
+
+import logging
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+
+def entry_lengths(entries: List[dict], sample_rate: int) -> np.ndarray:
+    """Number of samples the model receives for every manifest entry, the
+    duration of entries without one being read from the audio header.
+
+    Args:
+        entries (List[dict]): Manifest entries, see read_manifests.
+        sample_rate (int): Sample rate of the model.
+
+    Returns:
+        np.ndarray: int64 lengths in samples.
+    """
+    lengths = np.empty(len(entries), dtype=np.int64)
+    for row, entry in enumerate(entries):
+        duration = entry.get("duration")
+        if duration:
+            lengths[row] = int(duration * sample_rate)
+        else:
+            offset = int((entry.get("offset") or 0.0) * sample_rate)
+            lengths[row] = max(sf.info(entry["audio_filepath"]).frames - offset, 0)
+    return lengths
+
+
+def padding_efficiency(
+    lengths: Sequence[int], batches: List[List[int]]
+) -> Dict[str, float]:
+    """Share of real samples in the zero-padded batches.
+
+    Args:
+        lengths (Sequence[int]): Length of every input.
+        batches (List[List[int]]): Input indices of every batch, each
+            batch padded to its longest input.
+
+    Returns:
+        Dict[str, float]: batches, samples, padded_samples and
+            efficiency (samples / padded_samples).
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    padded = sum(
+        int(lengths[batch].max()) * len(batch) for batch in batches if len(batch)
+    )
+    samples = int(lengths.sum())
+    return {
+        "batches": len(batches),
+        "samples": samples,
+        "padded_samples": padded,
+        "efficiency": samples / padded if padded else 1.0,
+    }
+
+
+def fixed_batches(number_of_inputs: int, batch_size: int) -> List[List[int]]:
+    """Consecutive batches of batch_size inputs, in input order."""
+    return [
+        list(range(start, min(start + batch_size, number_of_inputs)))
+        for start in range(0, number_of_inputs, batch_size)
+    ]
+
+
+class BucketBatchSampler:
+    """Batch sampler grouping inputs of similar length under a budget.
+
+    Inputs are sorted by length and cut into consecutive batches, a batch
+    being closed before its padded size, number of inputs times its
+    longest input, exceeds `max_batch_samples`. An input longer than the
+    budget forms a batch on its own. Each batch is a list of input
+    indices, so the sampler can be passed to a torch DataLoader as
+    `batch_sampler`.
+
+    Args:
+        lengths (Sequence[int]): Length of every input in samples.
+        max_batch_samples (int): Budget of padded samples per batch, e.g.
+            320 * 10080 for the memory of 320 windows of 0.63 s.
+        max_batch_size (int, optional): Maximum number of inputs per
+            batch. Defaults to None, only the budget applies.
+
+    Examples:
+        >>> sampler = BucketBatchSampler([16000, 80000, 16000, 79000], 160000)
+        >>> list(sampler)
+        [[0, 2], [3, 1]]
+        >>> sampler.padding_efficiency()["efficiency"]
+        0.9947916666666666
+    """
+
+    def __init__(
+        self,
+        lengths: Sequence[int],
+        max_batch_samples: int,
+        max_batch_size: Optional[int] = None,
+    ):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.max_batch_samples = max_batch_samples
+        self.max_batch_size = max_batch_size
+        self.batches = self._build()
+
+    def _build(self) -> List[List[int]]:
+        order = np.argsort(self.lengths, kind="stable")
+        sorted_lengths = self.lengths[order]
+        batches = []
+        first = 0
+        for row in range(1, len(order) + 1):
+            if row < len(order):
+                # sorted, so the new input is the longest of the batch
+                padded = (row - first + 1) * int(sorted_lengths[row])
+                size = row - first + 1
+                if padded <= self.max_batch_samples and (
+                    self.max_batch_size is None or size <= self.max_batch_size
+                ):
+                    continue
+            batches.append(order[first:row].tolist())
+            first = row
+        return batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        return iter(self.batches)
+
+    def __len__(self) -> int:
+        return len(self.batches)
+
+    def padding_efficiency(self) -> Dict[str, float]:
+        """padding_efficiency of the bucketed batches."""
+        return padding_efficiency(self.lengths, self.batches)
+
+
+def bucketing_report(
+    lengths: Sequence[int], max_batch_samples: int, batch_size: int = 320
+) -> Dict[str, Dict[str, float]]:
+    """Padding efficiency of bucketed batches against fixed batches of
+    batch_size inputs in input order, the NeMo test dataloader batches.
+    """
+    bucketed = BucketBatchSampler(lengths, max_batch_samples).padding_efficiency()
+    fixed = padding_efficiency(lengths, fixed_batches(len(lengths), batch_size))
+    logger.info(
+        f"Padding efficiency: bucketed {bucketed['efficiency']:.3f} in "
+        f"{bucketed['batches']} batches, fixed {fixed['efficiency']:.3f} in "
+        f"{fixed['batches']} batches"
+    )
+    return {"bucketed": bucketed, "fixed": fixed}
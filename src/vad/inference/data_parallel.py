@@ -0,0 +1,231 @@
+"""Data-parallel inference
+Splits manifest entries into contiguous shards classified by worker
+processes, each with its own copy of the model and a fixed number of
+torch threads, and merges their logits back in manifest order.
+
+A model as small as MarbleNet-3x2x64 does not keep many cores busy with
+torch intra-op threads alone; several single-threaded copies working on
+different entries scale much closer to the number of cores.
+
+Workers are started with the "spawn" method, so no torch or NeMo state
+is inherited through fork, and each one runs its shard through an
+InferencePipeline.
+"""
+
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from src.vad.inference.marblenet_model import MODEL_PATH
+
+logger = logging.getLogger(__name__)
+
+# model of the worker process, restored by _init_worker
+_WORKER = {}
+
+
+def shard_bounds(entries: List[dict], number_of_shards: int) -> List[Tuple[int, int]]:
+    """Contiguous [start, end) shards of entries with about the same
+    total duration, or the same number of entries when durations are
+    missing.
+
+    Examples:
+        >>> shard_bounds([{"duration": 5}] * 3 + [{"duration": 15}], 2)
+        [(0, 3), (3, 4)]
+    """
+    if not entries:
+        return []
+    number_of_shards = max(min(number_of_shards, len(entries)), 1)
+    weights = np.array([entry.get("duration") or 0.0 for entry in entries])
+    if not weights.any():
+        weights = np.ones(len(entries))
+    cumulative = np.cumsum(weights)
+    targets = cumulative[-1] * np.arange(1, number_of_shards) / number_of_shards
+    # an entry goes to the shard its end falls in
+    cuts = (np.searchsorted(cumulative, targets, side="left") + 1).tolist()
+    # every shard keeps >= 1 entry: strictly increasing cuts from the left,
+    # then room for one entry per remaining shard from the right
+    for shard in range(len(cuts)):
+        cuts[shard] = max(cuts[shard], cuts[shard - 1] + 1 if shard else 1)
+    for shard in reversed(range(len(cuts))):
+        upper = len(entries) - (len(cuts) - shard)
+        if shard + 1 < len(cuts):
+            upper = min(upper, cuts[shard + 1] - 1)
+        cuts[shard] = min(cuts[shard], upper)
+    bounds = [0, *cuts, len(entries)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _init_worker(
+    model_path: str,
+    threads: int,
+    quantize: Optional[str],
+    calibration: Optional[np.ndarray],
+):
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    from src.vad.inference.marblenet_model import load_model
+
+    model = load_model(model_path)
+    if quantize:
+        from src.vad.inference.quantization import quantize_model
+
+        model = quantize_model(model, quantize, calibration)
+    _WORKER["model"] = model
+
+
+def _infer_shard(
+    shard_index: int,
+    entries: List[dict],
+    batch_size: int,
+    decode_workers: int,
+    max_batch_samples: Optional[int],
+    cores: Optional[List[int]],
+):
+    from src.vad.inference.pipeline import InferencePipeline
+
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    pipeline = InferencePipeline(
+        _WORKER["model"],
+        batch_size=batch_size,
+        decode_workers=decode_workers,
+        max_batch_samples=max_batch_samples,
+    )
+    logits, labels = pipeline.run(entries)
+    return shard_index, logits.numpy(), labels.numpy(), pipeline.stats()
+
+
+class DataParallelInference:
+    """Classifies manifest entries with one model copy per process.
+
+    Args:
+        num_workers (int): Number of worker processes, e.g. the number of
+            cores divided by threads_per_worker.
+        threads_per_worker (int, optional): torch threads of every
+            worker. Defaults to 1.
+        model_path (str, optional): Checkpoint or exported artifact every
+            worker restores. Defaults to MODEL_PATH.
+        batch_size (int, optional): Entries per batch. Defaults to 320.
+        decode_workers (int, optional): Decoding threads of every worker.
+            Defaults to 1.
+        max_batch_samples (int, optional): See InferencePipeline.
+            Defaults to None.
+        quantize (str, optional): "dynamic" or "static", see
+            quantize_model. Defaults to None (fp32).
+        calibration (np.ndarray, optional): Calibration windows of
+            "static". Defaults to None.
+        pin_cores (bool, optional): Binds worker i to cores
+            [i * threads_per_worker, (i + 1) * threads_per_worker) on
+            Linux. Defaults to False.
+
+    Examples:
+        >>> engine = DataParallelInference(num_workers=32, threads_per_worker=2)
+        >>> logits, labels = engine.run(read_manifests(inference_files))
+        >>> engine.stats()["items_per_second"]
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        threads_per_worker: int = 1,
+        model_path: str = MODEL_PATH,
+        batch_size: int = 320,
+        decode_workers: int = 1,
+        max_batch_samples: Optional[int] = None,
+        quantize: Optional[str] = None,
+        calibration: Optional[np.ndarray] = None,
+        pin_cores: bool = False,
+    ):
+        self.num_workers = max(num_workers, 1)
+        self.threads_per_worker = max(threads_per_worker, 1)
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.max_batch_samples = max_batch_samples
+        self.quantize = quantize
+        self.calibration = calibration
+        self.pin_cores = pin_cores
+        self._stats: Dict[str, object] = {}
+
+    def _cores(self, shard_index: int) -> Optional[List[int]]:
+        if not self.pin_cores:
+            return None
+        cpu_count = os.cpu_count() or 1
+        first = shard_index * self.threads_per_worker
+        return [
+            core % cpu_count for core in range(first, first + self.threads_per_worker)
+        ]
+
+    def run(self, entries: List[dict]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Classifies manifest entries, see read_manifests.
+
+        Returns:
+            torch.Tensor: A tensor containing the concatenated logits.
+            torch.Tensor: A tensor containing the ground truth labels.
+        """
+        bounds = shard_bounds(entries, self.num_workers)
+        if not bounds:
+            return torch.empty((0, 2)), torch.empty((0,), dtype=torch.long)
+        start_time = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=len(bounds),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                self.model_path,
+                self.threads_per_worker,
+                self.quantize,
+                self.calibration,
+            ),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _infer_shard,
+                    shard_index,
+                    entries[start:end],
+                    self.batch_size,
+                    self.decode_workers,
+                    self.max_batch_samples,
+                    self._cores(shard_index),
+                )
+                for shard_index, (start, end) in enumerate(bounds)
+            ]
+            shards = [future.result() for future in futures]
+        wall_time = time.perf_counter() - start_time
+
+        self._stats = {
+            "workers": len(bounds),
+            "threads_per_worker": self.threads_per_worker,
+            "items": len(entries),
+            "wall_seconds": wall_time,
+            "items_per_second": len(entries) / wall_time if wall_time else 0.0,
+            "shards": [
+                {"entries": end - start, **shard[3]}
+                for (start, end), shard in zip(bounds, shards)
+            ],
+        }
+        logger.info(
+            f"{len(entries)} entries in {wall_time:.1f} s with {len(bounds)} workers, "
+            f"{self._stats['items_per_second']:.1f} entries/s"
+        )
+        # shards are contiguous, concatenating them in shard order keeps
+        # the manifest order
+        logits = torch.from_numpy(np.concatenate([shard[1] for shard in shards]))
+        labels = torch.from_numpy(np.concatenate([shard[2] for shard in shards]))
+        return logits, labels
+
+    def stats(self) -> Dict[str, object]:
+        """Statistics of the last run: workers, threads_per_worker, items,
+        wall_seconds, items_per_second end to end and the InferencePipeline
+        stats of every shard."""
+        return self._stats
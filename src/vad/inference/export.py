@@ -0,0 +1,195 @@
+"""Model export
+Converts the MarbleNet .nemo checkpoint, preprocessor included, to an
+ONNX or TorchScript artifact that runtime.ExportedMarbleNet runs without
+NeMo, and checks that both produce the same logits.
+"""
+
+import json
+import logging
+from typing import Optional
+
+import numpy as np
+import torch
+
+from src.vad.inference.marblenet_model import (
+    MODEL_PATH,
+    extract_logits,
+    infer_chunks,
+    load_model,
+)
+from src.vad.inference.runtime import ExportedMarbleNet, metadata_path
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("onnx", "torchscript")
+
+
+class _MarbleNetForExport(torch.nn.Module):
+    """Raw audio to logits, i.e. EncDecClassificationModel.forward with
+    positional inputs so that it can be traced."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_signal, input_signal_length):
+        return self.model(
+            input_signal=input_signal, input_signal_length=input_signal_length
+        )
+
+
+def export_model(
+    output_path: str,
+    restore_path: str = MODEL_PATH,
+    export_format: Optional[str] = None,
+    window: float = 0.63,
+    opset: int = 17,
+) -> str:
+    """Exports MarbleNet, preprocessor included, to ONNX or TorchScript.
+
+    A JSON metadata file with the labels, sample rate and window length
+    is written next to the artifact. The artifact is traced with windows
+    of `window` seconds, which is the window length it should be run
+    with.
+
+    Args:
+        output_path (str): Path of the artifact, .onnx or .ts.
+        restore_path (str, optional): Path to the .nemo checkpoint.
+            Defaults to MODEL_PATH.
+        export_format (str, optional): 'onnx' or 'torchscript'.
+            Defaults to the format given by the output_path suffix.
+        window (float, optional): Window length in seconds of the
+            example input. Defaults to 0.63.
+        opset (int, optional): ONNX opset, 17 is the first with STFT.
+            Defaults to 17.
+
+    Returns:
+        str: output_path
+    """
+    from nemo.core.classes.common import typecheck
+
+    if export_format is None:
+        export_format = "onnx" if output_path.endswith(".onnx") else "torchscript"
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"export_format must be one of {EXPORT_FORMATS}")
+
+    model = load_model(restore_path)
+    sample_rate = model.cfg.sample_rate
+    wrapper = _MarbleNetForExport(model).eval()
+    window_len = round(window * sample_rate)
+    example_signal = torch.randn(2, window_len) * 0.1
+    example_length = torch.full((2,), window_len, dtype=torch.long)
+
+    with torch.no_grad(), typecheck.disable_checks():
+        if export_format == "onnx":
+            torch.onnx.export(
+                wrapper,
+                (example_signal, example_length),
+                output_path,
+                input_names=["input_signal", "input_signal_length"],
+                output_names=["logits"],
+                dynamic_axes={
+                    "input_signal": {0: "batch", 1: "time"},
+                    "input_signal_length": {0: "batch"},
+                    "logits": {0: "batch"},
+                },
+                opset_version=opset,
+            )
+        else:
+            traced = torch.jit.trace(wrapper, (example_signal, example_length))
+            traced.save(output_path)
+
+    with open(metadata_path(output_path), "w", encoding="UTF-8") as f:
+        json.dump(
+            {
+                "labels": list(model.cfg.labels),
+                "sample_rate": sample_rate,
+                "window": window,
+                "format": export_format,
+                "source": str(restore_path),
+            },
+            f,
+            indent=1,
+        )
+    logger.info(f"{restore_path} exported to {output_path}")
+    return output_path
+
+
+def verify_export(
+    exported_path: str,
+    restore_path: str = MODEL_PATH,
+    inference_files: Optional[str] = None,
+    n_windows: int = 64,
+    atol: float = 1e-3,
+) -> float:
+    """Checks that an exported artifact reproduces the NeMo logits.
+
+    With `inference_files`, the reference logits are computed by
+    extract_logits over the NeMo test dataloader of those manifests, and
+    the artifact is run on the same batches. Otherwise both are run on
+    `n_windows` random windows.
+
+    Args:
+        exported_path (str): Path to the .onnx or .ts artifact.
+        restore_path (str, optional): Path to the .nemo checkpoint.
+            Defaults to MODEL_PATH.
+        inference_files (str, optional): Comma-separated manifest paths,
+            as passed to model_eval. Defaults to None.
+        n_windows (int, optional): Number of random windows when no
+            manifest is given. Defaults to 64.
+        atol (float, optional): Maximum absolute logit difference.
+            Defaults to 1e-3.
+
+    Returns:
+        float: The maximum absolute logit difference.
+
+    Raises:
+        RuntimeError: If the difference is larger than atol.
+    """
+    model = load_model(restore_path)
+    exported = ExportedMarbleNet(exported_path)
+
+    with torch.no_grad():
+        if inference_files:
+            from omegaconf import OmegaConf
+
+            test_config = OmegaConf.create(
+                {
+                    "manifest_filepath": inference_files,
+                    "sample_rate": model.cfg.sample_rate,
+                    "labels": list(model.cfg.labels),
+                    "batch_size": 64,
+                    "shuffle": False,
+                    "num_workers": 0,
+                }
+            )
+            model.setup_test_data(test_config)
+            reference, _ = extract_logits(model, model._test_dl)
+            candidate = []
+            for audio_signal, audio_signal_len, _, _ in model._test_dl:
+                # padded batches are run through the artifact with their lengths
+                candidate.append(
+                    exported._run(
+                        np.ascontiguousarray(audio_signal.numpy(), dtype=np.float32),
+                        audio_signal_len.numpy().astype(np.int64),
+                    )
+                )
+            candidate = np.concatenate(candidate)
+        else:
+            window_len = round(
+                exported.metadata.get("window", 0.63) * model.cfg.sample_rate
+            )
+            windows = (
+                np.random.default_rng(0).standard_normal((n_windows, window_len)) * 0.1
+            ).astype(np.float32)
+            reference = infer_chunks(model, windows)
+            candidate = exported.infer_windows(windows)
+
+    max_abs_diff = float(np.abs(reference.numpy() - candidate).max())
+    logger.info(f"max absolute logit difference: {max_abs_diff}")
+    if max_abs_diff > atol:
+        raise RuntimeError(
+            f"{exported_path} does not match {restore_path}: "
+            f"max absolute logit difference {max_abs_diff} > {atol}"
+        )
+    return max_abs_diff
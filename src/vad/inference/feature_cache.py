@@ -0,0 +1,376 @@
+"""Feature cache
+Keeps the preprocessor features (log-mel spectrograms) of manifest
+entries on disk, so that re-evaluating the same chunks, e.g. with another
+threshold or decoder, skips decoding the audio and the preprocessor.
+
+Features are appended to shards, .npy files of shape (n_features,
+n_frames) holding the frames of many entries one after the other, each
+with an index file mapping the key of every entry to its offset and
+number of frames in the shard. The key hashes the audio file content,
+the offset/duration read from it and the preprocessor config, so a
+changed file or config is a miss. Shards are memory-mapped, and the
+least recently used shards are evicted whole once the cache grows above
+`max_bytes`, so the cache holds a few large files rather than one file
+per chunk.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from src.vad.inference.manifest_audio import load_entry_audio
+
+logger = logging.getLogger(__name__)
+
+SHARD_SUFFIX = ".npy"
+INDEX_SUFFIX = ".index.json"
+
+
+def preprocessor_config_hash(model) -> str:
+    """Hashes the preprocessor config of a restored model.
+
+    Returns:
+        str: sha1 hex digest of the preprocessor config and sample rate.
+    """
+    from omegaconf import OmegaConf
+
+    config = {
+        "preprocessor": OmegaConf.to_container(model.cfg.preprocessor, resolve=True),
+        "sample_rate": model.cfg.sample_rate,
+    }
+    return hashlib.sha1(
+        json.dumps(config, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class FeatureCache:
+    """On-disk cache of preprocessor features, keyed by audio content.
+
+    Stored features are buffered in memory and written as one shard once
+    they reach `shard_bytes`, and on flush. Call flush after the last put.
+
+    Args:
+        cache_dir (str): Folder of the cache, created if missing.
+        max_bytes (int, optional): Size above which the least recently
+            used shards are evicted. Defaults to 2 GiB, None never
+            evicts.
+        shard_bytes (int, optional): Size of the features written per
+            shard. Defaults to 64 MiB.
+
+    Examples:
+        >>> cache = FeatureCache("feature_cache/")
+        >>> key = cache.key(entry, preprocessor_config_hash(model))
+        >>> features = cache.get(key)  # view of a memory-mapped shard or None
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: Optional[int] = 2 * 1024**3,
+        shard_bytes: int = 64 * 1024**2,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.shard_bytes = shard_bytes
+        self.hits = 0
+        self.misses = 0
+        self._file_hashes: Dict[Tuple[str, int, int], str] = {}
+        # key -> (shard, offset, frames) of every stored entry
+        self._index: Dict[str, Tuple[str, int, int]] = {}
+        self._shard_sizes: Dict[str, int] = {}
+        self._shards: Dict[str, np.ndarray] = {}
+        self._touched = set()
+        self._pending: Dict[str, np.ndarray] = {}
+        self._pending_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _shard_path(self, shard: str) -> str:
+        return os.path.join(self.cache_dir, f"{shard}{SHARD_SUFFIX}")
+
+    def _index_path(self, shard: str) -> str:
+        return os.path.join(self.cache_dir, f"{shard}{INDEX_SUFFIX}")
+
+    def _load_index(self):
+        shards = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(INDEX_SUFFIX):
+                shard = entry.name[: -len(INDEX_SUFFIX)]
+                try:
+                    stat = os.stat(self._shard_path(shard))
+                except FileNotFoundError:
+                    continue
+                shards.append((stat.st_mtime_ns, shard, stat.st_size))
+        # a key stored in several shards is read from the most recent one
+        for _, shard, size in sorted(shards):
+            with open(self._index_path(shard), "r", encoding="UTF-8") as infile:
+                for key, (offset, frames) in json.load(infile).items():
+                    self._index[key] = (shard, offset, frames)
+            self._shard_sizes[shard] = size
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(self._shard_sizes.values())
+
+    def file_hash(self, audio_path: str) -> str:
+        """sha1 of the audio file content, hashed once per process for a
+        given path, size and modification time."""
+        stat = os.stat(audio_path)
+        memo_key = (os.path.abspath(audio_path), stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._file_hashes:
+            digest = hashlib.sha1()
+            with open(audio_path, "rb") as audio_file:
+                for block in iter(lambda: audio_file.read(1 << 20), b""):
+                    digest.update(block)
+            self._file_hashes[memo_key] = digest.hexdigest()
+        return self._file_hashes[memo_key]
+
+    def key(self, entry: dict, config_hash: str) -> str:
+        """Cache key of a manifest entry for a preprocessor config."""
+        return hashlib.sha1(
+            "|".join(
+                (
+                    self.file_hash(entry["audio_filepath"]),
+                    str(entry.get("offset") or 0.0),
+                    str(entry.get("duration") or 0.0),
+                    config_hash,
+                )
+            ).encode()
+        ).hexdigest()
+
+    def _shard(self, shard: str) -> np.ndarray:
+        if shard not in self._shards:
+            self._shards[shard] = np.load(self._shard_path(shard), mmap_mode="r")
+        if shard not in self._touched:
+            # once per shard and process, the modification time orders eviction
+            os.utime(self._shard_path(shard))
+            self._touched.add(shard)
+        return self._shards[shard]
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Returns the read-only (n_features, n_frames) features of `key`,
+        a view of its memory-mapped shard, or None."""
+        if key in self._pending:
+            self.hits += 1
+            return self._pending[key]
+        location = self._index.get(key)
+        if location is not None:
+            shard, offset, frames = location
+            try:
+                features = self._shard(shard)[:, offset : offset + frames]
+            except (FileNotFoundError, ValueError):
+                # evicted by another process
+                del self._index[key]
+            else:
+                self.hits += 1
+                return features
+        self.misses += 1
+        return None
+
+    def put(self, key: str, features: np.ndarray):
+        """Stores the (n_features, n_frames) features of `key`, writing a
+        shard once the buffered features reach shard_bytes."""
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        pending = next(iter(self._pending.values()), None)
+        if pending is not None and pending.shape[0] != features.shape[0]:
+            # a shard holds features of one preprocessor config
+            self.flush()
+        self._pending[key] = features
+        self._pending_bytes += features.nbytes
+        if self._pending_bytes >= self.shard_bytes:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered features as a new shard, then evicts the
+        least recently used shards above max_bytes."""
+        if not self._pending:
+            return
+        shard = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        index = {}
+        offset = 0
+        for key, features in self._pending.items():
+            index[key] = (offset, features.shape[1])
+            offset += features.shape[1]
+        # the shard is complete before its index exists, readers only
+        # consider shards with an index
+        temporary_path = f"{self._shard_path(shard)}.tmp"
+        with open(temporary_path, "wb") as outfile:
+            np.save(outfile, np.concatenate(list(self._pending.values()), axis=1))
+        os.replace(temporary_path, self._shard_path(shard))
+        with open(f"{self._index_path(shard)}.tmp", "w", encoding="UTF-8") as outfile:
+            json.dump(index, outfile)
+        os.replace(f"{self._index_path(shard)}.tmp", self._index_path(shard))
+
+        for key, (offset, frames) in index.items():
+            self._index[key] = (shard, offset, frames)
+        self._shard_sizes[shard] = os.path.getsize(self._shard_path(shard))
+        self._touched.add(shard)
+        self._pending = {}
+        self._pending_bytes = 0
+        if self.max_bytes is not None and self.size_bytes > self.max_bytes:
+            self.evict(self.max_bytes)
+
+    def evict(self, max_bytes: int) -> int:
+        """Removes the least recently used shards until the cache holds at
+        most max_bytes.
+
+        Returns:
+            int: number of removed shards.
+        """
+        shards = []
+        for shard in list(self._shard_sizes):
+            try:
+                stat = os.stat(self._shard_path(shard))
+            except FileNotFoundError:
+                del self._shard_sizes[shard]
+                continue
+            shards.append((stat.st_mtime_ns, shard))
+        shards.sort()
+        removed = set()
+        for _, shard in shards:
+            if self.size_bytes <= max_bytes:
+                break
+            for path in (self._index_path(shard), self._shard_path(shard)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            del self._shard_sizes[shard]
+            self._shards.pop(shard, None)
+            removed.add(shard)
+        if removed:
+            self._index = {
+                key: location
+                for key, location in self._index.items()
+                if location[0] not in removed
+            }
+            logger.info(f"Evicted {len(removed)} feature shards from {self.cache_dir}")
+        return len(removed)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._index),
+            "shards": len(self._shard_sizes),
+            "size_bytes": self.size_bytes,
+        }
+
+
+def _pad_features(features: List[np.ndarray], pad_to: int, pad_value: float):
+    """Stacks (n_features, n_frames) features into a zero-padded batch the
+    way the NeMo preprocessor pads its output."""
+    lengths = [feature.shape[1] for feature in features]
+    max_length = max(lengths)
+    if pad_to and max_length % pad_to:
+        max_length += pad_to - max_length % pad_to
+    batch = torch.full(
+        (len(features), features[0].shape[0], max_length),
+        pad_value,
+        dtype=torch.float32,
+    )
+    batch_view = batch.numpy()
+    for row, feature in enumerate(features):
+        # single copy from the memory-mapped file into the batch
+        batch_view[row, :, : feature.shape[1]] = feature
+    return batch, torch.tensor(lengths, dtype=torch.long)
+
+
+def preprocess_signals(model, signals: List[np.ndarray]):
+    """Zero-pads 1D signals into a batch and runs the model preprocessor.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: processed_signal and
+            processed_signal_length, the inputs of the model forward.
+    """
+    lengths = torch.tensor([len(signal) for signal in signals], dtype=torch.long)
+    audio_signal = torch.zeros((len(signals), int(lengths.max())))
+    for row, signal in enumerate(signals):
+        audio_signal[row, : len(signal)] = torch.from_numpy(signal)
+    return model.preprocessor(input_signal=audio_signal, length=lengths)
+
+
+def _compute_features(model, entries: List[dict]) -> List[np.ndarray]:
+    signals = []
+    for entry in entries:
+        signal, sample_rate = load_entry_audio(entry)
+        if sample_rate != model.cfg.sample_rate:
+            raise ValueError(
+                f"{entry['audio_filepath']} is sampled at {sample_rate} Hz, "
+                f"the model expects {model.cfg.sample_rate} Hz"
+            )
+        signals.append(signal)
+    processed, processed_len = preprocess_signals(model, signals)
+    return [
+        processed[row, :, :length].numpy()
+        for row, length in enumerate(processed_len.tolist())
+    ]
+
+
+def cached_logits(
+    model, entries: List[dict], cache: FeatureCache, batch_size: int = 320
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Classifies manifest entries, reading their features from `cache`
+    and computing and storing the missing ones.
+
+    This is the cached counterpart of extract_logits over the NeMo test
+    dataloader: the features are passed to the model as processed_signal,
+    so the preprocessor only runs on cache misses.
+
+    Args:
+        model (EncDecClassificationModel): Model from load_model.
+        entries (List[dict]): Manifest entries, see read_manifests.
+        cache (FeatureCache): The feature cache.
+        batch_size (int, optional): Entries per forward pass. Defaults to
+            320.
+
+    Returns:
+        torch.Tensor: A tensor containing the concatenated logits.
+        torch.Tensor: A tensor containing the ground truth labels.
+    """
+    config_hash = preprocessor_config_hash(model)
+    featurizer = getattr(model.preprocessor, "featurizer", None)
+    pad_to = getattr(featurizer, "pad_to", 0)
+    pad_value = getattr(featurizer, "pad_value", 0.0)
+    if not isinstance(pad_to, int):
+        pad_to = 0
+    labels = list(model.cfg.labels)
+
+    logits_buffer = []
+    with torch.no_grad():
+        for start in range(0, len(entries), batch_size):
+            batch_entries = entries[start : start + batch_size]
+            keys = [cache.key(entry, config_hash) for entry in batch_entries]
+            features = [cache.get(key) for key in keys]
+            missing = [row for row, feature in enumerate(features) if feature is None]
+            if missing:
+                computed = _compute_features(
+                    model, [batch_entries[row] for row in missing]
+                )
+                for row, feature in zip(missing, computed):
+                    cache.put(keys[row], feature)
+                    features[row] = feature
+            processed_signal, processed_signal_length = _pad_features(
+                features, pad_to, pad_value
+            )
+            logits_buffer.append(
+                model(
+                    processed_signal=processed_signal,
+                    processed_signal_length=processed_signal_length,
+                )
+            )
+    cache.flush()
+    logger.info(f"Feature cache: {cache.stats()}")
+    if not logits_buffer:
+        return torch.empty((0, len(labels))), torch.empty((0,), dtype=torch.long)
+    label_ids = torch.tensor([labels.index(entry["label"]) for entry in entries])
+    return torch.cat(logits_buffer, 0), label_ids
@@ -0,0 +1,81 @@
+"""Manifest audio
+Reads NeMo manifests and loads the audio of their entries into equal
+length windows, the way NeMo's test dataloader reads them.
+"""
+
+import json
+import logging
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+
+def read_manifests(inference_files: Union[str, List[str]]) -> List[dict]:
+    """Reads the entries of one or more NeMo manifests, in order.
+
+    Args:
+        inference_files (str | List[str]): Comma-separated string of
+            manifest paths, as passed to model_eval, or a list of paths.
+
+    Returns:
+        List[dict]: the manifest entries.
+    """
+    if isinstance(inference_files, str):
+        inference_files = [path for path in inference_files.split(",") if path]
+    entries = []
+    for manifest_path in inference_files:
+        with open(manifest_path, "r", encoding="UTF-8") as manifest:
+            entries.extend(json.loads(line) for line in manifest if line.strip())
+    return entries
+
+
+def load_entry_audio(entry: dict, dtype: str = "float32") -> Tuple[np.ndarray, int]:
+    """Loads the audio of a manifest entry, reading `duration` seconds
+    from `offset` seconds into `audio_filepath` like NeMo does.
+
+    Returns:
+        Tuple[np.ndarray, int]: 1D signal and sample rate.
+    """
+    info = sf.info(entry["audio_filepath"])
+    # NeMo's AudioSegment truncates the offset and duration to samples
+    start = int(float(entry.get("offset") or 0.0) * info.samplerate)
+    duration = entry.get("duration")
+    stop = None if not duration else start + int(float(duration) * info.samplerate)
+    signal, sample_rate = sf.read(
+        entry["audio_filepath"], start=start, stop=stop, dtype=dtype
+    )
+    if signal.ndim > 1:
+        signal = signal.mean(axis=1).astype(dtype)
+    return signal, sample_rate
+
+
+def entries_to_windows(
+    entries: List[dict],
+    window_len: int,
+    labels: Optional[List[str]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Loads manifest entries into a (n_entries, window_len) array,
+    zero padding or truncating every entry to window_len samples.
+
+    Args:
+        entries (List[dict]): Manifest entries.
+        window_len (int): Number of samples per window.
+        labels (List[str], optional): Model labels, e.g.
+            ['background', 'speech'], to map the entry labels to class
+            indices. Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: float32 windows, and the class
+            index of every entry (-1 when labels is None).
+    """
+    windows = np.zeros((len(entries), window_len), dtype=np.float32)
+    label_ids = np.full(len(entries), -1, dtype=np.int64)
+    for row, entry in enumerate(entries):
+        signal, _ = load_entry_audio(entry)
+        windows[row, : min(len(signal), window_len)] = signal[:window_len]
+        if labels is not None:
+            label_ids[row] = labels.index(entry["label"])
+    return windows, label_ids
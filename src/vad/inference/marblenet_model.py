@@ -0,0 +1,175 @@
+"""MarbleNet model helpers
+Restores the MarbleNet checkpoint and runs it directly on batches of
+in-memory audio windows.
+"""
+
+import logging
+from types import SimpleNamespace
+from typing import Optional
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = "./MarbleNet-3x2x64.nemo"
+
+EXPORTED_SUFFIXES = (".onnx", ".ts")
+
+
+def load_model(restore_path: str = MODEL_PATH, labels: Optional[list] = None):
+    """Restores the MarbleNet classification model on CPU in eval mode.
+
+    NeMo is imported here rather than at module level, so that modules
+    which only need `infer_chunks` do not pay the NeMo import cost.
+    Artifacts written by `vad export` (.onnx or .ts) are loaded with
+    ExportedMarbleNet instead, without NeMo.
+
+    Args:
+        restore_path (str, optional): Path to the .nemo checkpoint, or
+            to an exported .onnx/.ts artifact. Defaults to MODEL_PATH.
+        labels (list, optional): Overrides the labels stored in the
+            checkpoint e.g. ['non-speech', 'speech']. Defaults to None.
+
+    Returns:
+        EncDecClassificationModel: The restored model.
+    """
+    if str(restore_path).endswith(EXPORTED_SUFFIXES):
+        from src.vad.inference.runtime import ExportedMarbleNet
+
+        model = ExportedMarbleNet(restore_path)
+        if labels is not None:
+            model.cfg.labels = labels
+        return model
+
+    import nemo.collections.asr as nemo_asr
+
+    model = nemo_asr.models.EncDecClassificationModel.restore_from(
+        restore_path=restore_path
+    )
+    if labels is not None:
+        model.cfg.labels = labels
+    model = model.cpu()
+    model.eval()
+    return model
+
+
+def load_model_config(restore_path: str = MODEL_PATH):
+    """The config of the model without restoring its weights.
+
+    For processes that only read `model.cfg`, e.g. speech_label_index
+    and RunWriter.set_model, while the model itself runs elsewhere.
+    Exported artifacts are cheap to load and are returned by load_model.
+
+    Args:
+        restore_path (str, optional): Path to the .nemo checkpoint, or
+            to an exported .onnx/.ts artifact. Defaults to MODEL_PATH.
+
+    Returns:
+        SimpleNamespace: Object with the checkpoint config as `cfg`.
+    """
+    if str(restore_path).endswith(EXPORTED_SUFFIXES):
+        return load_model(restore_path)
+
+    import nemo.collections.asr as nemo_asr
+
+    config = nemo_asr.models.EncDecClassificationModel.restore_from(
+        restore_path=restore_path, return_config=True
+    )
+    return SimpleNamespace(cfg=config)
+
+
+def extract_logits(model, dataloader):
+    """Extract logits from the model for each batch in the dataloader.
+
+    This function processes the data in 'dataloader' in batches using the provided 'model'
+    and extracts the logits (model's raw outputs) for each batch. It also collects the corresponding
+    ground truth labels from the dataloader.
+
+    Args:
+        model (torch.nn.Module): The model to use for inference.
+        dataloader (torch.utils.data.DataLoader): The DataLoader containing the data for inference.
+
+    Returns:
+        torch.Tensor: A tensor containing the concatenated logits for all batches.
+        torch.Tensor: A tensor containing the concatenated ground truth labels for all batches.
+
+    Example:
+        test_dl = model._test_dl
+        model = model.from_pretrained(model.ckpt)
+        logits, labels = extract_logits(model, test_dl)
+    """
+    logits_buffer = []
+    label_buffer = []
+    for count, batch in enumerate(dataloader, start=1):
+        logger.debug(f"batch {count}")
+        audio_signal, audio_signal_len, labels, labels_len = batch
+        logits = model(input_signal=audio_signal, input_signal_length=audio_signal_len)
+        logits_buffer.append(logits)
+        label_buffer.append(labels)
+
+    logger.info("Finished extracting logits !")
+    logits = torch.cat(logits_buffer, 0)
+    labels = torch.cat(label_buffer, 0)
+    return logits, labels
+
+
+def speech_label_index(model) -> int:
+    """Returns the index of the speech class in the model output.
+
+    Args:
+        model (EncDecClassificationModel): The restored model.
+
+    Returns:
+        int: index of 'speech' in the model labels.
+    """
+    return list(model.cfg.labels).index("speech")
+
+
+def infer_chunks(model, chunks: np.ndarray, batch_size: int = 320) -> torch.Tensor:
+    """Runs the model over a 2D array of equal-length audio windows.
+
+    Only one batch at a time is copied into a contiguous buffer, so
+    overlapping windows from AudioUtils.frame_signal are never
+    materialised all at once. int16 windows are scaled to [-1, 1) the
+    way soundfile decodes them to float.
+
+    Args:
+        model (torch.nn.Module): The model to use for inference.
+        chunks (np.ndarray): Array of shape (n_windows, window_len),
+            float32 or int16, possibly a strided view.
+        batch_size (int, optional): Number of windows per forward
+            pass. Defaults to 320.
+
+    Returns:
+        torch.Tensor: Logits of shape (n_windows, n_classes).
+
+    Examples:
+        >>> model = load_model()
+        >>> logits = infer_chunks(model, np.zeros((4, 10080), np.float32))
+        >>> logits.shape
+        torch.Size([4, 2])
+    """
+    if hasattr(model, "infer_windows"):
+        # exported model, see runtime.ExportedMarbleNet
+        return torch.from_numpy(model.infer_windows(chunks, batch_size))
+
+    logits_buffer = []
+    with torch.no_grad():
+        for start in range(0, chunks.shape[0], batch_size):
+            batch = chunks[start : start + batch_size]
+            if batch.dtype == np.int16:
+                batch = batch.astype(np.float32) / 32768.0
+            audio_signal = torch.from_numpy(
+                np.require(batch, dtype=np.float32, requirements=["C", "W"])
+            )
+            audio_signal_len = torch.full(
+                (audio_signal.shape[0],), audio_signal.shape[1], dtype=torch.long
+            )
+            logits = model(
+                input_signal=audio_signal, input_signal_length=audio_signal_len
+            )
+            logits_buffer.append(logits)
+    if not logits_buffer:
+        return torch.empty((0, len(model.cfg.labels)))
+    return torch.cat(logits_buffer, 0)
@@ -0,0 +1,110 @@
+"""Inference options
+How model_eval runs the model over the entries of its manifests. Only
+some of the execution options work together, so they are validated
+together rather than silently ignored:
+
+    dataloader     the NeMo test dataloader of marblenet_lite.yaml
+    feature_cache  preprocessor features read from a FeatureCache
+    pipeline       InferencePipeline with pipeline_workers decode threads
+    data_parallel  DataParallelInference, one model copy per process
+"""
+
+from typing import Optional
+
+QUANTIZE_MODES = ("dynamic", "static")
+
+
+class InferenceOptions:
+    """Execution options of model_eval.
+
+    Args:
+        quantize (str, optional): "dynamic" or "static" runs the model
+            with INT8 quantization, see quantize_model. Defaults to None
+            (fp32).
+        feature_cache_dir (str, optional): Folder of a FeatureCache the
+            preprocessor features of every chunk are read from, and only
+            computed and stored when missing. Defaults to None.
+        pipeline_workers (int, optional): When > 0, the chunks are
+            decoded by this many threads, featurized and classified as
+            concurrent stages of an InferencePipeline. With processes,
+            the threads are shared between the processes. Defaults to 0.
+        max_batch_samples (int, optional): The chunks of the pipeline
+            are bucketed by length into batches of at most this many
+            padded samples, see BucketBatchSampler. Defaults to None.
+        processes (int, optional): When > 1, the chunks are split into
+            this many shards, each classified by its own process with its
+            own copy of the model, see DataParallelInference. Defaults
+            to 0.
+        threads_per_process (int, optional): torch threads of every
+            process, processes * threads_per_process should not exceed
+            the number of cores. Defaults to 1.
+
+    Raises:
+        ValueError: When an option is out of range or two options
+            conflict, e.g. feature_cache_dir with processes > 1.
+
+    Examples:
+        >>> options = InferenceOptions(pipeline_workers=8, processes=4)
+        >>> options.mode
+        'data_parallel'
+    """
+
+    def __init__(
+        self,
+        quantize: Optional[str] = None,
+        feature_cache_dir: Optional[str] = None,
+        pipeline_workers: int = 0,
+        max_batch_samples: Optional[int] = None,
+        processes: int = 0,
+        threads_per_process: int = 1,
+    ):
+        if quantize is not None and quantize not in QUANTIZE_MODES:
+            raise ValueError(
+                f"quantize must be one of {QUANTIZE_MODES} or None, not {quantize!r}"
+            )
+        if pipeline_workers < 0 or processes < 0 or threads_per_process < 1:
+            raise ValueError(
+                "pipeline_workers and processes must be >= 0 and "
+                "threads_per_process >= 1"
+            )
+        if max_batch_samples is not None and max_batch_samples <= 0:
+            raise ValueError(f"max_batch_samples must be > 0, not {max_batch_samples}")
+        if feature_cache_dir and (processes > 1 or pipeline_workers):
+            raise ValueError(
+                "feature_cache_dir reads cached features in this process, "
+                "it cannot be combined with processes > 1 or pipeline_workers"
+            )
+        if max_batch_samples and not (processes > 1 or pipeline_workers):
+            raise ValueError(
+                "max_batch_samples buckets the batches of the pipeline, "
+                "set pipeline_workers or processes > 1"
+            )
+        if threads_per_process != 1 and processes <= 1:
+            raise ValueError("threads_per_process needs processes > 1")
+        self.quantize = quantize
+        self.feature_cache_dir = feature_cache_dir
+        self.pipeline_workers = pipeline_workers
+        self.max_batch_samples = max_batch_samples
+        self.processes = processes
+        self.threads_per_process = threads_per_process
+
+    @property
+    def mode(self) -> str:
+        """How the model runs: dataloader, feature_cache, pipeline or data_parallel."""
+        if self.feature_cache_dir:
+            return "feature_cache"
+        if self.processes > 1:
+            return "data_parallel"
+        if self.pipeline_workers:
+            return "pipeline"
+        return "dataloader"
+
+    def as_dict(self) -> dict:
+        return {
+            "quantize": self.quantize,
+            "feature_cache_dir": self.feature_cache_dir,
+            "pipeline_workers": self.pipeline_workers,
+            "max_batch_samples": self.max_batch_samples,
+            "processes": self.processes,
+            "threads_per_process": self.threads_per_process,
+        }
@@ -0,0 +1,360 @@
+"""Pipelined inference
+Classifies manifest entries with the audio decoding, the preprocessor
+(featurization) and the model forward pass running as concurrent stages,
+joined by bounded queues, instead of one after the other on one thread.
+
+    decode (thread or process pool) -> featurize (thread) -> forward
+
+Batches hold `batch_size` entries in manifest order, or with
+`max_batch_samples` the length-bucketed batches of a BucketBatchSampler,
+the logits being returned in manifest order either way.
+
+The bounded queues keep at most `queue_size` batches between two stages,
+so a fast stage waits for a slow one instead of filling the memory.
+Every stage records the time it works, waits for input (starved) and
+waits for room in its output queue (blocked), so the stage limiting the
+throughput is visible in `stats`.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from src.vad.inference.bucketing import (
+    BucketBatchSampler,
+    entry_lengths,
+    fixed_batches,
+)
+from src.vad.inference.feature_cache import preprocess_signals
+from src.vad.inference.manifest_audio import load_entry_audio
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("decode", "featurize", "forward")
+
+# marks the end of the stream in a stage queue
+_DONE = object()
+
+# seconds between two checks of the stop event while waiting on a queue
+_POLL_INTERVAL = 0.1
+
+
+def _timed_decode(entry: dict) -> Tuple[np.ndarray, int, float]:
+    start = time.perf_counter()
+    signal, sample_rate = load_entry_audio(entry)
+    return signal, sample_rate, time.perf_counter() - start
+
+
+class _StageStats:
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+        self.items = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+
+    def as_dict(self, wall_time: float) -> dict:
+        capacity = self.busy / self.workers
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "workers": self.workers,
+            "busy_seconds": self.busy,
+            "starved_seconds": self.starved,
+            "blocked_seconds": self.blocked,
+            # rate the stage would reach if it never waited
+            "items_per_second": self.items / capacity if capacity else float("inf"),
+            "utilization": capacity / wall_time if wall_time else 0.0,
+        }
+
+
+class InferencePipeline:
+    """Runs manifest entries through decode, featurize and forward stages.
+
+    Args:
+        model (EncDecClassificationModel): Model from load_model. Exported
+            models, without preprocessor, run the padded audio through
+            infer_windows in the forward stage.
+        batch_size (int, optional): Entries per batch. Defaults to 320.
+        decode_workers (int, optional): Decoding threads or processes.
+            Defaults to 2.
+        queue_size (int, optional): Batches held between two stages.
+            Defaults to 4.
+        use_processes (bool, optional): Decode in a process pool rather
+            than a thread pool, for codecs holding the GIL. Defaults to
+            False.
+        max_batch_samples (int, optional): Budget of padded samples per
+            batch, see BucketBatchSampler, replacing batch_size. Defaults
+            to None, batches of batch_size entries.
+
+    Examples:
+        >>> pipeline = InferencePipeline(load_model(), decode_workers=4)
+        >>> logits, labels = pipeline.run(read_manifests(inference_files))
+        >>> pipeline.stats()["bottleneck"]
+        'forward'
+    """
+
+    def __init__(
+        self,
+        model,
+        batch_size: int = 320,
+        decode_workers: int = 2,
+        queue_size: int = 4,
+        use_processes: bool = False,
+        max_batch_samples: Optional[int] = None,
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.decode_workers = max(decode_workers, 1)
+        self.queue_size = max(queue_size, 1)
+        self.use_processes = use_processes
+        self.max_batch_samples = max_batch_samples
+        self._samples = 0
+        self._padded_samples = 0
+        self._stats = {name: _StageStats() for name in STAGES}
+        self._wall_time = 0.0
+
+    def _put(self, output: queue.Queue, item, stop: threading.Event, stats):
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                output.put(item, timeout=_POLL_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        stats.blocked += time.perf_counter() - start
+
+    def _get(self, source: queue.Queue, stop: threading.Event, stats):
+        start = time.perf_counter()
+        item = _DONE
+        while not stop.is_set():
+            try:
+                item = source.get(timeout=_POLL_INTERVAL)
+                break
+            except queue.Empty:
+                continue
+        stats.starved += time.perf_counter() - start
+        return item
+
+    def _decode_stage(self, entries, batches, output, stop):
+        stats = self._stats["decode"]
+        sample_rate = self.model.cfg.sample_rate
+        executor_class = (
+            ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        )
+        with executor_class(max_workers=self.decode_workers) as executor:
+            pending = []
+            indices = iter([index for batch in batches for index in batch])
+            batch_sizes = iter([len(batch) for batch in batches])
+            batch_size = next(batch_sizes, 0)
+            batch = []
+            while not stop.is_set():
+                # keep twice as many entries in flight as workers
+                while len(pending) < 2 * self.decode_workers:
+                    index = next(indices, None)
+                    if index is None:
+                        break
+                    entry = entries[index]
+                    pending.append(
+                        (index, entry, executor.submit(_timed_decode, entry))
+                    )
+                if not pending:
+                    break
+                index, entry, future = pending.pop(0)
+                signal, entry_rate, seconds = future.result()
+                # summed over the workers, as_dict divides by their number
+                stats.busy += seconds
+                if entry_rate != sample_rate:
+                    raise ValueError(
+                        f"{entry['audio_filepath']} is sampled at {entry_rate} Hz, "
+                        f"the model expects {sample_rate} Hz"
+                    )
+                stats.items += 1
+                batch.append((index, signal, entry.get("label")))
+                if len(batch) == batch_size:
+                    stats.batches += 1
+                    self._put(output, batch, stop, stats)
+                    batch = []
+                    batch_size = next(batch_sizes, 0)
+            for _, _, future in pending:
+                future.cancel()
+
+    def _featurize_stage(self, source, output, stop):
+        stats = self._stats["featurize"]
+        has_preprocessor = hasattr(self.model, "preprocessor")
+        with torch.no_grad():
+            while True:
+                batch = self._get(source, stop, stats)
+                if batch is _DONE:
+                    break
+                start = time.perf_counter()
+                signals = [signal for _, signal, _ in batch]
+                self._samples += sum(len(signal) for signal in signals)
+                self._padded_samples += len(signals) * max(
+                    len(signal) for signal in signals
+                )
+                if has_preprocessor:
+                    features = preprocess_signals(self.model, signals)
+                else:
+                    features = np.zeros(
+                        (len(signals), max(len(signal) for signal in signals)),
+                        dtype=np.float32,
+                    )
+                    for row, signal in enumerate(signals):
+                        features[row, : len(signal)] = signal
+                stats.busy += time.perf_counter() - start
+                stats.items += len(batch)
+                stats.batches += 1
+                self._put(
+                    output,
+                    (
+                        features,
+                        [index for index, _, _ in batch],
+                        [label for _, _, label in batch],
+                    ),
+                    stop,
+                    stats,
+                )
+
+    def _forward(self, features) -> torch.Tensor:
+        if not hasattr(self.model, "preprocessor"):
+            # exported model, see runtime.ExportedMarbleNet
+            return torch.from_numpy(self.model.infer_windows(features, len(features)))
+        processed_signal, processed_signal_length = features
+        return self.model(
+            processed_signal=processed_signal,
+            processed_signal_length=processed_signal_length,
+        )
+
+    def _stage(self, target, errors, stop, *args):
+        try:
+            target(*args, stop)
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            if not stop.is_set():
+                self._put(args[-1], _DONE, stop, _StageStats())
+
+    def run(self, entries: List[dict]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Classifies manifest entries, see read_manifests.
+
+        Returns:
+            torch.Tensor: A tensor containing the concatenated logits.
+            torch.Tensor: A tensor containing the ground truth labels.
+        """
+        labels_list = list(self.model.cfg.labels)
+        if self.max_batch_samples:
+            batches = BucketBatchSampler(
+                entry_lengths(entries, self.model.cfg.sample_rate),
+                self.max_batch_samples,
+            ).batches
+        else:
+            batches = fixed_batches(len(entries), self.batch_size)
+        self._samples = 0
+        self._padded_samples = 0
+        self._stats = {
+            "decode": _StageStats(self.decode_workers),
+            "featurize": _StageStats(),
+            "forward": _StageStats(),
+        }
+        decoded = queue.Queue(maxsize=self.queue_size)
+        featurized = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = []
+        threads = [
+            threading.Thread(
+                target=self._stage,
+                args=(self._decode_stage, errors, stop, entries, batches, decoded),
+                name="pipeline-decode",
+                daemon=True,
+            ),
+            threading.Thread(
+                target=self._stage,
+                args=(self._featurize_stage, errors, stop, decoded, featurized),
+                name="pipeline-featurize",
+                daemon=True,
+            ),
+        ]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        stats = self._stats["forward"]
+        logits_buffer = []
+        order = []
+        label_names = []
+        try:
+            with torch.no_grad():
+                while True:
+                    item = self._get(featurized, stop, stats)
+                    if item is _DONE:
+                        break
+                    features, batch_indices, batch_labels = item
+                    start = time.perf_counter()
+                    logits_buffer.append(self._forward(features))
+                    stats.busy += time.perf_counter() - start
+                    stats.items += len(batch_labels)
+                    stats.batches += 1
+                    order.extend(batch_indices)
+                    label_names.extend(batch_labels)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            self._wall_time = time.perf_counter() - start_time
+        if errors:
+            raise errors[0]
+        logger.info(f"Pipeline stages: {self.stats()}")
+
+        if not logits_buffer:
+            return (
+                torch.empty((0, len(labels_list))),
+                torch.empty((0,), dtype=torch.long),
+            )
+        # batches may be bucketed, back to manifest order
+        order = torch.tensor(order)
+        logits = torch.cat(logits_buffer, 0)
+        ordered_logits = torch.empty_like(logits)
+        ordered_logits[order] = logits
+        label_ids = torch.empty(len(order), dtype=torch.long)
+        label_ids[order] = torch.tensor(
+            [
+                labels_list.index(label) if label in labels_list else -1
+                for label in label_names
+            ]
+        )
+        return ordered_logits, label_ids
+
+    def stats(self) -> Dict[str, object]:
+        """Per stage statistics of the last run.
+
+        Returns:
+            Dict[str, object]: for every stage, its items, batches,
+                workers, busy/starved/blocked seconds, items_per_second
+                (while busy, per worker pool) and utilization (busy share
+                of the wall time), then wall_seconds, items_per_second
+                end to end, the bottleneck stage, the one with the
+                lowest items_per_second, and padding_efficiency, the
+                share of real samples in the padded batches.
+        """
+        stats = {
+            name: stage.as_dict(self._wall_time) for name, stage in self._stats.items()
+        }
+        items = self._stats["forward"].items
+        stats["wall_seconds"] = self._wall_time
+        stats["items_per_second"] = items / self._wall_time if self._wall_time else 0.0
+        stats["padding_efficiency"] = (
+            self._samples / self._padded_samples if self._padded_samples else 1.0
+        )
+        stats["bottleneck"] = min(
+            STAGES, key=lambda name: stats[name]["items_per_second"]
+        )
+        return stats
@@ -0,0 +1,118 @@
+"""Posterior store
+Saves speech posteriors once, so that thresholds and smoothing can be
+tuned afterwards without running the model again.
+
+The posteriors of every recording (or of every manifest, for chunk
+level inference) are concatenated into one float16 array, with the
+ground truth label of every frame or chunk and the offsets of every
+recording, in a single uncompressed .npz file. Labels equal to
+IGNORE_LABEL mark frames which are not scored, e.g. within a collar.
+"""
+
+import logging
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+IGNORE_LABEL = 255
+
+
+def save_posteriors(
+    path: str,
+    probs: Dict[str, np.ndarray],
+    labels: Dict[str, np.ndarray],
+    frame_shift: float = 0.0,
+) -> str:
+    """Writes speech posteriors and their labels to a .npz file.
+
+    Args:
+        path (str): Output path, ".npz" is appended when missing.
+        probs (Dict[str, np.ndarray]): Speech probability per frame (or
+            chunk) per recording id.
+        labels (Dict[str, np.ndarray]): 0/1 label per frame (or chunk),
+            or IGNORE_LABEL, per recording id, same lengths as probs.
+        frame_shift (float, optional): Frame length in seconds, 0.0 for
+            chunk posteriors which are not smoothed. Defaults to 0.0.
+
+    Returns:
+        str: The path written.
+
+    Example:
+        # Usage of the save_posteriors function
+        probs = {"example_1": frame_probs}
+        labels = {"example_1": frame_labels}
+        save_posteriors("chunked_audio/posteriors.npz", probs, labels, 0.01)
+    """
+    if not path.endswith(".npz"):
+        path = f"{path}.npz"
+    ids = list(probs)
+    lengths = [len(probs[key]) for key in ids]
+    for key, length in zip(ids, lengths):
+        if len(labels[key]) != length:
+            raise ValueError(
+                f"{key}: {length} posteriors but {len(labels[key])} labels"
+            )
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez(
+        path,
+        ids=np.array(ids, dtype=str),
+        offsets=np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+        probs=(
+            np.concatenate([np.asarray(probs[key]) for key in ids]).astype(np.float16)
+            if ids
+            else np.zeros(0, dtype=np.float16)
+        ),
+        labels=(
+            np.concatenate([np.asarray(labels[key]) for key in ids]).astype(np.uint8)
+            if ids
+            else np.zeros(0, dtype=np.uint8)
+        ),
+        frame_shift=np.float64(frame_shift),
+    )
+    logger.info(f"{sum(lengths)} posteriors of {len(ids)} recordings saved to {path}")
+    return path
+
+
+def load_posteriors(
+    path: str,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray], float]:
+    """Reads a file of save_posteriors.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray], float]:
+            float16 probs and uint8 labels per recording id, views of
+            the concatenated arrays, and the frame shift.
+    """
+    with np.load(path) as data:
+        ids = data["ids"].tolist()
+        offsets = data["offsets"]
+        probs = data["probs"]
+        labels = data["labels"]
+        frame_shift = float(data["frame_shift"])
+    bounds = list(zip(ids, offsets[:-1], offsets[1:]))
+    return (
+        {key: probs[start:end] for key, start, end in bounds},
+        {key: labels[start:end] for key, start, end in bounds},
+        frame_shift,
+    )
+
+
+def reference_frame_labels(
+    segments,
+    number_of_frames: int,
+    frame_shift: float,
+    collar: float = 0.0,
+) -> np.ndarray:
+    """uint8 frame labels of reference speech segments, IGNORE_LABEL
+    within `collar` seconds of a reference boundary, see
+    frame_metrics.scored_frames."""
+    # imported here, the evaluation package imports this module
+    from src.vad.evaluation.frame_metrics import scored_frames
+
+    reference, mask = scored_frames(segments, number_of_frames, frame_shift, collar)
+    labels = reference.astype(np.uint8)
+    labels[~mask] = IGNORE_LABEL
+    return labels
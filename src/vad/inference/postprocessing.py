@@ -0,0 +1,201 @@
+"""Posterior post-processing
+Turns per-frame (or per-window) speech probabilities into speech
+segments with hysteresis thresholds, padding and minimum duration
+filtering, and writes them out in RTTM format.
+"""
+
+import logging
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from src.vad.data_prep import speech_segments as sseg
+
+logger = logging.getLogger(__name__)
+
+
+def binarize_probs(
+    probs: np.ndarray, onset: float = 0.5, offset: float = None
+) -> np.ndarray:
+    """Hysteresis thresholding of speech probabilities.
+
+    A frame is speech when it belongs to a run of consecutive frames
+    with probability >= `offset` that contains at least one frame with
+    probability >= `onset`. Speech therefore starts only above `onset`
+    and only ends once the probability drops below `offset`.
+
+    Args:
+        probs (np.ndarray): Speech probability per frame.
+        onset (float, optional): Threshold to start speech.
+            Defaults to 0.5.
+        offset (float, optional): Threshold to end speech, <= onset.
+            Defaults to onset.
+
+    Returns:
+        np.ndarray: bool array, True where the frame is speech.
+
+    Examples:
+        >>> binarize_probs(np.array([0.1, 0.45, 0.8, 0.45, 0.2, 0.45]), 0.7, 0.4)
+        array([False,  True,  True,  True, False, False])
+    """
+    offset = onset if offset is None else offset
+    if offset > onset:
+        raise ValueError(f"offset ({offset}) must not be larger than onset ({onset})")
+    probs = np.asarray(probs)
+    above_offset = probs >= offset
+    if not above_offset.any():
+        return above_offset
+
+    # label every run of frames above offset, then keep the runs that
+    # reach onset at least once
+    run_starts = above_offset & ~np.concatenate(([False], above_offset[:-1]))
+    run_ids = np.cumsum(run_starts) - 1
+    onset_hits = np.bincount(
+        run_ids[above_offset],
+        weights=(probs[above_offset] >= onset),
+        minlength=run_ids[-1] + 1,
+    )
+    return above_offset & (onset_hits[run_ids] > 0)
+
+
+def frames_to_segments(
+    active: np.ndarray, frame_shift: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Converts a per-frame speech mask into segment boundaries.
+
+    Args:
+        active (np.ndarray): bool array, True where the frame is speech.
+        frame_shift (float): Frame length in seconds.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: start and end times in seconds of
+            every run of speech frames.
+    """
+    edges = np.diff(np.concatenate(([0], np.asarray(active, dtype=np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) * frame_shift
+    ends = np.flatnonzero(edges == -1) * frame_shift
+    return starts, ends
+
+
+def merge_segment_arrays(
+    starts: np.ndarray, ends: np.ndarray, min_gap: float = 0.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorised counterpart of speech_segments.merge_overlap_segments
+    for segments given as arrays. Overlapping segments, and segments
+    separated by less than `min_gap` seconds, are merged.
+
+    Args:
+        starts (np.ndarray): Segment start times in seconds.
+        ends (np.ndarray): Segment end times in seconds.
+        min_gap (float, optional): Gaps shorter than this are filled.
+            Defaults to 0.0, merging only overlapping segments.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: start and end times of the
+            merged segments, sorted by start time.
+
+    Examples:
+        >>> merge_segment_arrays(np.array([0, 3, 0.5]), np.array([1, 5, 1.5]))
+        (array([0., 3.]), array([1.5, 5. ]))
+    """
+    if len(starts) == 0:
+        return np.asarray(starts, dtype=float), np.asarray(ends, dtype=float)
+    order = np.argsort(starts, kind="stable")
+    starts = np.asarray(starts, dtype=float)[order]
+    ends = np.asarray(ends, dtype=float)[order]
+    running_end = np.maximum.accumulate(ends)
+    new_group = np.concatenate(([True], starts[1:] - running_end[:-1] >= min_gap))
+    if min_gap <= 0:
+        # touching segments are merged, as in merge_overlap_segments
+        new_group[1:] = starts[1:] > running_end[:-1]
+    group_first = np.flatnonzero(new_group)
+    return starts[group_first], np.maximum.reduceat(ends, group_first)
+
+
+def probs_to_segments(
+    probs: np.ndarray,
+    frame_shift: float,
+    onset: float = 0.5,
+    offset: float = None,
+    pad_onset: float = 0.0,
+    pad_offset: float = 0.0,
+    min_duration_on: float = 0.0,
+    min_duration_off: float = 0.0,
+    duration: float = None,
+) -> List[Tuple[float]]:
+    """Turns a speech probability track into merged speech segments.
+
+    Steps: hysteresis thresholding, padding of every segment, merging
+    of overlapping segments, filling of silences shorter than
+    `min_duration_off`, and removal of speech shorter than
+    `min_duration_on`.
+
+    Args:
+        probs (np.ndarray): Speech probability per frame (or per
+            non-overlapping window).
+        frame_shift (float): Frame (or window) length in seconds.
+        onset (float, optional): Threshold to start speech.
+            Defaults to 0.5.
+        offset (float, optional): Threshold to end speech.
+            Defaults to onset.
+        pad_onset (float, optional): Seconds added before every
+            segment. Defaults to 0.0.
+        pad_offset (float, optional): Seconds added after every
+            segment. Defaults to 0.0.
+        min_duration_on (float, optional): Speech segments shorter than
+            this are dropped. Defaults to 0.0.
+        min_duration_off (float, optional): Silences shorter than this
+            are filled. Defaults to 0.0.
+        duration (float, optional): Duration of the recording, segments
+            are clipped to it. Defaults to len(probs) * frame_shift.
+
+    Returns:
+        List[Tuple[float]]: List of (start_time, end_time) speech
+            segments in seconds.
+
+    Examples:
+        >>> probs_to_segments(np.array([0, 0, 1, 1, 0, 1, 0, 0]), 0.5, min_duration_off=0.6)
+        [(1.0, 3.0)]
+    """
+    duration = len(probs) * frame_shift if duration is None else duration
+    starts, ends = frames_to_segments(binarize_probs(probs, onset, offset), frame_shift)
+
+    starts = np.clip(starts - pad_onset, 0.0, duration)
+    ends = np.clip(ends + pad_offset, 0.0, duration)
+    starts, ends = merge_segment_arrays(starts, ends, min_gap=min_duration_off)
+
+    keep = (ends - starts) >= max(min_duration_on, np.finfo(float).eps)
+    return [
+        (round(float(start), 3), round(float(end), 3))
+        for start, end in zip(starts[keep], ends[keep])
+    ]
+
+
+def write_rttm_from_probs(
+    probs: np.ndarray,
+    frame_shift: float,
+    output_rttm_filepath: Union[Path, str],
+    file_id: str,
+    **postprocessing_params,
+) -> List[Tuple[float]]:
+    """Post-processes a speech probability track with probs_to_segments
+    and writes the segments with speech_segments.write_rttm.
+
+    Args:
+        probs (np.ndarray): Speech probability per frame.
+        frame_shift (float): Frame length in seconds.
+        output_rttm_filepath (Path | str): Path to save RTTM file.
+        file_id (str): File ID written in the RTTM, usually the
+            recording file stem.
+        **postprocessing_params: onset, offset, pad_onset, pad_offset,
+            min_duration_on, min_duration_off and duration, see
+            probs_to_segments.
+
+    Returns:
+        List[Tuple[float]]: The segments written.
+    """
+    segments = probs_to_segments(probs, frame_shift, **postprocessing_params)
+    sseg.write_rttm(segments, output_rttm_filepath, file_id=file_id)
+    logger.info(f"{len(segments)} speech segments written to {output_rttm_filepath}")
+    return segments
@@ -0,0 +1,256 @@
+"""INT8 quantization
+Quantizes MarbleNet for CPU inference and reports the accuracy and
+throughput of the quantized model against the fp32 one.
+
+Two modes are supported:
+    - "dynamic": the Linear decoder weights are stored in int8 and
+      activations are quantized on the fly, no calibration needed.
+    - "static": additionally, every Conv1d of the encoder is quantized
+      with activation ranges observed on calibration windows, e.g. the
+      chunks listed in the chunked_audio/ manifests.
+"""
+
+import copy
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import torch
+
+from src.vad.evaluation.chunk_metrics import chunk_metrics
+from src.vad.inference.manifest_audio import entries_to_windows, read_manifests
+from src.vad.inference.marblenet_model import infer_chunks, speech_label_index
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ("dynamic", "static")
+
+
+def _quantization_backend() -> str:
+    engines = torch.backends.quantized.supported_engines
+    for backend in ("x86", "fbgemm", "qnnpack"):
+        if backend in engines:
+            return backend
+    raise RuntimeError(f"No int8 CPU quantization engine available in {engines}")
+
+
+class _QuantConv1d(torch.ao.quantization.QuantWrapper):
+    """QuantWrapper of a Conv1d which still exposes the attributes of the
+    convolution, e.g. padding, kernel_size, stride and dilation, read
+    through `.conv` by NeMo's MaskedConv1d.get_seq_len. After convert
+    they are those of the quantized convolution."""
+
+    def __getattr__(self, name):
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(super().__getattr__("module"), name)
+
+
+def _wrap_convs(module: torch.nn.Module, qconfig) -> int:
+    """Wraps every Conv1d below `module` in quant/dequant stubs, so that
+    eager mode static quantization runs the convolution in int8 while
+    the masking and residual code of the encoder keeps seeing floats.
+
+    Returns:
+        int: number of wrapped convolutions.
+    """
+    wrapped = 0
+    for name, child in module.named_children():
+        if type(child) is torch.nn.Conv1d:
+            wrapper = _QuantConv1d(child)
+            wrapper.qconfig = qconfig
+            setattr(module, name, wrapper)
+            wrapped += 1
+        else:
+            wrapped += _wrap_convs(child, qconfig)
+    return wrapped
+
+
+def calibration_windows(
+    calibration_files: Union[str, List[str]],
+    window_len: int,
+    n_windows: int = 512,
+    seed: int = 0,
+) -> np.ndarray:
+    """Draws calibration windows from the entries of NeMo manifests.
+
+    Args:
+        calibration_files (str | List[str]): Comma-separated manifest
+            paths, e.g. the inference_files of model_eval.
+        window_len (int): Number of samples per window.
+        n_windows (int, optional): Number of entries drawn without
+            replacement. Defaults to 512.
+        seed (int, optional): Seed of the draw. Defaults to 0.
+
+    Returns:
+        np.ndarray: float32 array of shape (n_windows, window_len).
+    """
+    entries = read_manifests(calibration_files)
+    if not entries:
+        raise ValueError(f"No manifest entry in {calibration_files}")
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(entries), size=min(n_windows, len(entries)), replace=False)
+    windows, _ = entries_to_windows([entries[i] for i in np.sort(picked)], window_len)
+    return windows
+
+
+def quantize_model(
+    model,
+    mode: str = "dynamic",
+    calibration: Optional[np.ndarray] = None,
+    batch_size: int = 320,
+):
+    """Returns an int8 copy of a restored MarbleNet model, the fp32
+    model is left untouched.
+
+    Args:
+        model (EncDecClassificationModel): Model from load_model.
+        mode (str, optional): "dynamic" or "static". Defaults to
+            "dynamic".
+        calibration (np.ndarray, optional): Windows of shape
+            (n_windows, window_len) used to observe the activation
+            ranges, required by "static". Defaults to None.
+        batch_size (int, optional): Windows per calibration forward
+            pass. Defaults to 320.
+
+    Returns:
+        EncDecClassificationModel: The quantized model, in eval mode.
+
+    Examples:
+        >>> model = load_model()
+        >>> windows = calibration_windows("chunked_audio/ES2011a_speech_manifest.json", 10080)
+        >>> int8_model = quantize_model(model, "static", windows)
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"mode must be one of {QUANTIZATION_MODES}, got {mode}")
+    if hasattr(model, "infer_windows"):
+        raise ValueError(
+            "Exported models cannot be quantized, use the .nemo checkpoint"
+        )
+
+    backend = _quantization_backend()
+    torch.backends.quantized.engine = backend
+    quantized = copy.deepcopy(model).cpu().eval()
+
+    if mode == "static":
+        if calibration is None or len(calibration) == 0:
+            raise ValueError("Static quantization needs calibration windows")
+        qconfig = torch.ao.quantization.get_default_qconfig(backend)
+        wrapped = _wrap_convs(quantized.encoder, qconfig)
+        torch.ao.quantization.prepare(quantized.encoder, inplace=True)
+        infer_chunks(quantized, calibration, batch_size)
+        torch.ao.quantization.convert(quantized.encoder, inplace=True)
+        logger.info(
+            f"Quantized {wrapped} encoder convolutions with {len(calibration)} "
+            f"calibration windows"
+        )
+
+    torch.ao.quantization.quantize_dynamic(
+        quantized, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+    return quantized
+
+
+def _evaluate(model, windows, labels, speech_index, batch_size, sample_rate):
+    start = time.perf_counter()
+    logits = infer_chunks(model, windows, batch_size)
+    elapsed = time.perf_counter() - start
+    speech_probs = torch.softmax(logits, dim=1)[:, speech_index].numpy()
+    preds = logits.argmax(dim=1).numpy() == speech_index
+    metrics = chunk_metrics(labels, preds)
+    metrics["roc_auc_probs"] = chunk_metrics(labels, preds, speech_probs)["roc_auc"]
+    metrics["seconds"] = elapsed
+    metrics["windows_per_second"] = len(windows) / elapsed if elapsed else float("inf")
+    metrics["real_time_factor"] = elapsed / (windows.size / sample_rate)
+    return metrics, preds
+
+
+def quantization_report(
+    model,
+    inference_files: Union[str, List[str]],
+    mode: str = "dynamic",
+    calibration_files: Optional[Union[str, List[str]]] = None,
+    n_calibration: int = 512,
+    window: float = 0.63,
+    batch_size: int = 320,
+    output_path: Optional[str] = None,
+) -> Dict[str, dict]:
+    """Compares the int8 model with the fp32 model on the entries of
+    NeMo manifests, e.g. the chunked_audio/ manifests written by
+    chunking.
+
+    Both models classify the same windows with the same batch size. The
+    report holds, for "fp32" and "int8", the metrics printed by
+    marblenet_infer.py (accuracy, far, mdr, roc_auc on the hard
+    predictions) plus roc_auc_probs on the speech probabilities and the
+    throughput, then the int8 - fp32 "delta" of every metric and the
+    fraction of windows on which both models agree.
+
+    Args:
+        model (EncDecClassificationModel): fp32 model from load_model.
+        inference_files (str | List[str]): Manifests to evaluate on.
+        mode (str, optional): "dynamic" or "static". Defaults to
+            "dynamic".
+        calibration_files (str | List[str], optional): Manifests to
+            calibrate on. Defaults to None, using inference_files.
+        n_calibration (int, optional): Number of calibration windows.
+            Defaults to 512.
+        window (float, optional): Window length in seconds, entries are
+            padded or truncated to it. Defaults to 0.63.
+        batch_size (int, optional): Windows per forward pass. Defaults
+            to 320.
+        output_path (str, optional): Writes the report as JSON there.
+            Defaults to None.
+
+    Returns:
+        Dict[str, dict]: the report.
+    """
+    sample_rate = int(model.cfg.sample_rate)
+    window_len = round(window * sample_rate)
+    labels_list = list(model.cfg.labels)
+    speech_index = speech_label_index(model)
+
+    windows, label_ids = entries_to_windows(
+        read_manifests(inference_files), window_len, labels_list
+    )
+    labels = label_ids == speech_index
+    calibration = None
+    if mode == "static":
+        calibration = calibration_windows(
+            calibration_files or inference_files, window_len, n_calibration
+        )
+    int8_model = quantize_model(model, mode, calibration, batch_size)
+
+    fp32_metrics, fp32_preds = _evaluate(
+        model, windows, labels, speech_index, batch_size, sample_rate
+    )
+    int8_metrics, int8_preds = _evaluate(
+        int8_model, windows, labels, speech_index, batch_size, sample_rate
+    )
+    report = {
+        "mode": mode,
+        "backend": torch.backends.quantized.engine,
+        "windows": int(len(windows)),
+        "fp32": fp32_metrics,
+        "int8": int8_metrics,
+        "delta": {
+            name: int8_metrics[name] - fp32_metrics[name] for name in fp32_metrics
+        },
+        "agreement": float((fp32_preds == int8_preds).mean()) if len(windows) else 1.0,
+        "speedup": (
+            fp32_metrics["seconds"] / int8_metrics["seconds"]
+            if int8_metrics["seconds"]
+            else float("inf")
+        ),
+    }
+    for name in ("accuracy", "far", "mdr", "roc_auc", "windows_per_second"):
+        logger.info(
+            f"{name}: fp32 {fp32_metrics[name]:.4f}, int8 {int8_metrics[name]:.4f}"
+        )
+    if output_path:
+        with open(output_path, "w", encoding="UTF-8") as outfile:
+            json.dump(report, outfile, indent=2)
+    return report
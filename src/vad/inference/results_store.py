@@ -0,0 +1,284 @@
+"""Results store
+Keeps the window level results of every inference run in a columnar
+binary format, one directory per run, instead of text lines.
+
+A run directory holds numbered part-*.npz files, each one batch of
+appended rows, and a meta.json with the run metadata (model and config
+hash, parameters, timestamps) and the recording ids the rows refer to.
+Appending only writes a new part, and loading concatenates the parts,
+so neither re-parses text or rewrites earlier rows.
+
+Columns:
+    - recording (int32): index into metadata["recordings"].
+    - start, end (float64): window boundaries in seconds.
+    - prob (float32): speech probability.
+    - logits (float32, n_rows x n_labels): raw model outputs, optional.
+    - label (int8): ground truth label id, -1 when unknown.
+    - pred (int8): predicted label id.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+UNKNOWN_LABEL = -1
+
+
+def model_config_hash(model) -> str:
+    """sha1 of the config of a restored (or exported) model."""
+    cfg = model.cfg
+    try:
+        from omegaconf import DictConfig, OmegaConf
+
+        if isinstance(cfg, DictConfig):
+            cfg = OmegaConf.to_container(cfg, resolve=True)
+    except ImportError:
+        pass
+    if not isinstance(cfg, dict):
+        cfg = vars(cfg)
+    return hashlib.sha1(
+        json.dumps(cfg, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def _write_json(path: str, content: dict):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="UTF-8") as outfile:
+        json.dump(content, outfile, indent=1)
+    os.replace(temporary_path, path)
+
+
+class RunWriter:
+    """Appends result rows to one run directory, see ResultsStore.new_run.
+
+    Rows are buffered and written as a part file every `part_rows` rows,
+    on flush and on close. meta.json is rewritten with every part, so an
+    interrupted run can still be loaded up to its last part.
+
+    Args:
+        run_dir (str): The run directory, created if missing.
+        metadata (dict): Run metadata, stored in meta.json.
+        part_rows (int, optional): Rows buffered before a part is
+            written. Defaults to 1 << 20.
+    """
+
+    def __init__(self, run_dir: str, metadata: dict, part_rows: int = 1 << 20):
+        self.run_dir = run_dir
+        self.part_rows = part_rows
+        self.metadata = dict(metadata)
+        self.metadata.setdefault("recordings", [])
+        self.metadata.setdefault("rows", 0)
+        self.metadata.setdefault("parts", 0)
+        self._recording_codes = {
+            recording_id: code
+            for code, recording_id in enumerate(self.metadata["recordings"])
+        }
+        self._buffer: List[Dict[str, np.ndarray]] = []
+        self._buffered_rows = 0
+        os.makedirs(run_dir, exist_ok=True)
+        _write_json(os.path.join(run_dir, META_FILE), self.metadata)
+
+    @property
+    def run_id(self) -> str:
+        return self.metadata["run_id"]
+
+    def set_model(self, model):
+        """Records the labels and config hash of the model of the run."""
+        self.metadata["labels"] = list(model.cfg.labels)
+        self.metadata["config_hash"] = model_config_hash(model)
+
+    def _code(self, recording_id: str) -> int:
+        if recording_id not in self._recording_codes:
+            self._recording_codes[recording_id] = len(self.metadata["recordings"])
+            self.metadata["recordings"].append(recording_id)
+        return self._recording_codes[recording_id]
+
+    def append(
+        self,
+        recording_id: str,
+        starts: Sequence[float],
+        ends: Sequence[float],
+        probs: Sequence[float],
+        preds: Sequence[int],
+        labels: Optional[Sequence[int]] = None,
+        logits: Optional[np.ndarray] = None,
+    ):
+        """Appends the windows of one recording.
+
+        Args:
+            recording_id (str): Recording the windows belong to.
+            starts (Sequence[float]): Window starts in seconds.
+            ends (Sequence[float]): Window ends in seconds.
+            probs (Sequence[float]): Speech probability per window.
+            preds (Sequence[int]): Predicted label id per window.
+            labels (Sequence[int], optional): Ground truth label id per
+                window. Defaults to None, UNKNOWN_LABEL.
+            logits (np.ndarray, optional): (n_windows, n_labels) model
+                outputs. Defaults to None, not stored.
+        """
+        rows = len(probs)
+        part = {
+            "recording": np.full(rows, self._code(recording_id), dtype=np.int32),
+            "start": np.asarray(starts, dtype=np.float64),
+            "end": np.asarray(ends, dtype=np.float64),
+            "prob": np.asarray(probs, dtype=np.float32),
+            "pred": np.asarray(preds, dtype=np.int8),
+            "label": (
+                np.full(rows, UNKNOWN_LABEL, dtype=np.int8)
+                if labels is None
+                else np.asarray(labels, dtype=np.int8)
+            ),
+        }
+        if logits is not None:
+            part["logits"] = np.asarray(logits, dtype=np.float32)
+        for name, column in part.items():
+            if len(column) != rows:
+                raise ValueError(f"{name} has {len(column)} rows, probs has {rows}")
+        self._buffer.append(part)
+        self._buffered_rows += rows
+        if self._buffered_rows >= self.part_rows:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows as a new part file."""
+        if not self._buffer:
+            return
+        names = set.intersection(*(set(part) for part in self._buffer))
+        columns = {
+            name: np.concatenate([part[name] for part in self._buffer])
+            for name in sorted(names)
+        }
+        part_path = os.path.join(self.run_dir, f"part-{self.metadata['parts']:05d}.npz")
+        # written under a temporary name so readers never see a partial part
+        with open(f"{part_path}.tmp", "wb") as outfile:
+            np.savez(outfile, **columns)
+        os.replace(f"{part_path}.tmp", part_path)
+        self.metadata["parts"] += 1
+        self.metadata["rows"] += self._buffered_rows
+        self._buffer = []
+        self._buffered_rows = 0
+        _write_json(os.path.join(self.run_dir, META_FILE), self.metadata)
+
+    def close(self, **metadata) -> str:
+        """Flushes the remaining rows and records the end of the run.
+
+        Args:
+            **metadata: Added to the run metadata, e.g. metrics.
+
+        Returns:
+            str: The run directory.
+        """
+        self.flush()
+        self.metadata.update(metadata)
+        self.metadata["finished"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        _write_json(os.path.join(self.run_dir, META_FILE), self.metadata)
+        logger.info(f"{self.metadata['rows']} results saved to {self.run_dir}")
+        return self.run_dir
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ResultsStore:
+    """Folder of inference runs, one RunWriter directory per run.
+
+    Args:
+        root (str): Folder of the store, e.g. chunked_audio/results.
+
+    Examples:
+        >>> store = ResultsStore("chunked_audio/results")
+        >>> with store.new_run(model, chunking_mode="in_memory") as run:
+        ...     run.append("ES2011a", starts, ends, probs, preds, labels)
+        >>> columns, metadata = store.load()  # latest run
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def new_run(self, model=None, model_path: Optional[str] = None, **metadata):
+        """Starts a run, its id is its start time and a random suffix.
+
+        Args:
+            model (optional): Restored model, its labels and config hash
+                are stored. Defaults to None.
+            model_path (str, optional): Checkpoint path, stored with the
+                sha1 of the file. Defaults to None.
+            **metadata: Any JSON serialisable run parameter.
+
+        Returns:
+            RunWriter: The writer of the new run.
+        """
+        now = datetime.now()
+        created = now.strftime("%Y-%m-%dT%H:%M:%S")
+        # microseconds keep the ids of quickly started runs in start order
+        run_id = f"{now.strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:6]}"
+        run_metadata = {"run_id": run_id, "created": created, **metadata}
+        if model_path and os.path.isfile(model_path):
+            digest = hashlib.sha1()
+            with open(model_path, "rb") as model_file:
+                for block in iter(lambda: model_file.read(1 << 20), b""):
+                    digest.update(block)
+            run_metadata["model_path"] = model_path
+            run_metadata["model_sha1"] = digest.hexdigest()
+        run = RunWriter(os.path.join(self.root, run_id), run_metadata)
+        if model is not None:
+            run.set_model(model)
+        return run
+
+    def runs(self) -> List[str]:
+        """Run ids, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            entry.name
+            for entry in os.scandir(self.root)
+            if entry.is_dir() and os.path.isfile(os.path.join(entry.path, META_FILE))
+        )
+
+    def load(self, run_id: Optional[str] = None) -> Tuple[Dict[str, np.ndarray], dict]:
+        """Loads the columns and metadata of a run.
+
+        Args:
+            run_id (str, optional): Defaults to None, the latest run.
+
+        Returns:
+            Tuple[Dict[str, np.ndarray], dict]: The columns, see the
+                module docstring, and the run metadata.
+        """
+        if run_id is None:
+            runs = self.runs()
+            if not runs:
+                raise FileNotFoundError(f"No run in {self.root}")
+            run_id = runs[-1]
+        return load_run(os.path.join(self.root, run_id))
+
+
+def load_run(run_dir: str) -> Tuple[Dict[str, np.ndarray], dict]:
+    """Loads the columns and metadata of a run directory, see
+    ResultsStore.load."""
+    with open(os.path.join(run_dir, META_FILE), "r", encoding="UTF-8") as infile:
+        metadata = json.load(infile)
+    parts = []
+    for index in range(metadata["parts"]):
+        with np.load(os.path.join(run_dir, f"part-{index:05d}.npz")) as part:
+            parts.append({name: part[name] for name in part.files})
+    if not parts:
+        return {}, metadata
+    names = set.intersection(*(set(part) for part in parts))
+    columns = {
+        name: np.concatenate([part[name] for part in parts]) for name in sorted(names)
+    }
+    return columns, metadata
@@ -0,0 +1,111 @@
+"""Exported model runtime
+Runs a MarbleNet artifact written by `vad export` with onnxruntime
+(.onnx) or bare torch (.ts TorchScript), without NeMo, PyTorch
+Lightning or Hydra. Only numpy is imported at module level.
+"""
+
+import json
+import logging
+import os
+from types import SimpleNamespace
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def metadata_path(artifact_path: str) -> str:
+    """Path of the JSON metadata written next to an exported artifact."""
+    return f"{artifact_path}.json"
+
+
+class ExportedMarbleNet:
+    """MarbleNet loaded from an exported artifact, preprocessor included.
+
+    The artifact takes raw audio windows and returns logits, the same
+    inputs and outputs as EncDecClassificationModel.forward. Labels and
+    sample rate are read from the metadata file written by `vad export`,
+    and are exposed as `cfg.labels` and `cfg.sample_rate` like on the
+    NeMo model, so the artifact can be used wherever `infer_chunks`
+    takes a model.
+
+    Args:
+        artifact_path (str): Path to the .onnx or .ts artifact.
+        num_threads (int, optional): Intra-op threads. Defaults to None,
+            the runtime default.
+
+    Example:
+        model = ExportedMarbleNet("marblenet.onnx")
+        logits = model.infer_windows(windows)
+    """
+
+    def __init__(self, artifact_path: str, num_threads: int = None):
+        self.artifact_path = str(artifact_path)
+        metadata = {"labels": ["background", "speech"], "sample_rate": 16000}
+        if os.path.isfile(metadata_path(self.artifact_path)):
+            with open(metadata_path(self.artifact_path), "r", encoding="UTF-8") as f:
+                metadata.update(json.load(f))
+        else:
+            logger.warning(
+                f"No metadata found for {self.artifact_path}, using {metadata}"
+            )
+        self.metadata = metadata
+        self.cfg = SimpleNamespace(
+            labels=list(metadata["labels"]), sample_rate=metadata["sample_rate"]
+        )
+
+        if self.artifact_path.endswith(".onnx"):
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+            self._session = ort.InferenceSession(
+                self.artifact_path, options, providers=["CPUExecutionProvider"]
+            )
+            self._run = self._run_onnx
+        else:
+            import torch
+
+            if num_threads:
+                torch.set_num_threads(num_threads)
+            self._module = torch.jit.load(self.artifact_path, map_location="cpu")
+            self._module.eval()
+            self._run = self._run_torchscript
+
+    def infer_windows(self, windows: np.ndarray, batch_size: int = 320) -> np.ndarray:
+        """Logits of equal-length audio windows.
+
+        Args:
+            windows (np.ndarray): Array of shape (n_windows, window_len),
+                float32 or int16, possibly a strided view.
+            batch_size (int, optional): Number of windows per run.
+                Defaults to 320.
+
+        Returns:
+            np.ndarray: float32 logits of shape (n_windows, n_classes).
+        """
+        outputs = []
+        for start in range(0, len(windows), batch_size):
+            batch = windows[start : start + batch_size]
+            if batch.dtype == np.int16:
+                batch = batch.astype(np.float32) / 32768.0
+            batch = np.require(batch, dtype=np.float32, requirements=["C", "W"])
+            lengths = np.full(len(batch), batch.shape[1], dtype=np.int64)
+            outputs.append(self._run(batch, lengths))
+        if not outputs:
+            return np.zeros((0, len(self.cfg.labels)), dtype=np.float32)
+        return np.concatenate(outputs).astype(np.float32, copy=False)
+
+    def _run_onnx(self, batch, lengths):
+        return self._session.run(
+            ["logits"], {"input_signal": batch, "input_signal_length": lengths}
+        )[0]
+
+    def _run_torchscript(self, batch, lengths):
+        import torch
+
+        with torch.no_grad():
+            return self._module(
+                torch.from_numpy(batch), torch.from_numpy(lengths)
+            ).numpy()
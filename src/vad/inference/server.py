@@ -0,0 +1,342 @@
+"""Persistent VAD inference server
+Loads MarbleNet once and serves inference over HTTP, on a TCP port or a
+Unix socket, so that short jobs do not pay the cost of restoring the
+.nemo archive. Concurrent requests are micro-batched by a
+DynamicBatchScheduler.
+
+Endpoints:
+    GET  /health   -> {"status": "ok"}
+    GET  /stats    -> throughput and latency of the scheduler
+    POST /infer    JSON {"audio_filepath": ..., <options>}
+    POST /infer?sample_rate=16000&dtype=int16&<options>
+                   raw mono PCM samples as body
+
+Options (JSON keys or query parameters): window, shift, smoothing,
+onset, offset, pad_onset, pad_offset, min_duration_on,
+min_duration_off and return_probs.
+"""
+
+import http.client
+import json
+import logging
+import os
+import socket
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import numpy as np
+import soundfile as sf
+
+from src.folder_audio_utils.audio_management import AudioUtils
+from src.vad.inference.batching import DynamicBatchScheduler
+from src.vad.inference.marblenet_model import speech_label_index
+from src.vad.inference.postprocessing import probs_to_segments
+from src.vad.inference.sliding_window import window_probs_to_frames
+
+logger = logging.getLogger(__name__)
+
+PCM_DTYPES = {"int16": np.int16, "float32": np.float32}
+
+DEFAULT_OPTIONS = {
+    "window": 0.63,
+    "shift": 0.01,
+    "smoothing": "mean",
+    "onset": 0.5,
+    "offset": None,
+    "pad_onset": 0.0,
+    "pad_offset": 0.0,
+    "min_duration_on": 0.0,
+    "min_duration_off": 0.0,
+    "return_probs": False,
+}
+
+
+class VADService:
+    """Model held in memory and shared by every request of the server.
+
+    Args:
+        model (torch.nn.Module): The restored model.
+        batch_size (int, optional): Maximum number of windows per
+            forward pass. Defaults to 320.
+        max_wait_ms (float, optional): Maximum time a request waits for
+            a batch to fill up. Defaults to 10.
+        latency_target_ms (float, optional): Target request latency,
+            see DynamicBatchScheduler. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        model,
+        batch_size: int = 320,
+        max_wait_ms: float = 10.0,
+        latency_target_ms: float = None,
+    ):
+        self.batcher = DynamicBatchScheduler(
+            model,
+            max_batch_size=batch_size,
+            max_wait_ms=max_wait_ms,
+            latency_target_ms=latency_target_ms,
+        )
+        self.speech_index = speech_label_index(model)
+
+    def infer_signal(self, signal: np.ndarray, sample_rate: int, options: dict) -> dict:
+        """Speech segments of a mono signal.
+
+        Args:
+            signal (np.ndarray): 1D float32 or int16 signal.
+            sample_rate (int): Audio sample rate in Hz e.g. 16000
+            options (dict): Overrides of DEFAULT_OPTIONS.
+
+        Returns:
+            dict: {"segments": [[start, end], ...], "frame_shift": float}
+                and "probs" when return_probs is set.
+        """
+        options = {**DEFAULT_OPTIONS, **options}
+        window_len = round(options["window"] * sample_rate)
+        hop_len = round(options["shift"] * sample_rate)
+        windows = AudioUtils.frame_signal(signal, window_len, hop_len)
+        logits = self.batcher.infer(windows)
+        window_probs = _softmax(logits)[:, self.speech_index]
+        probs, frame_shift = window_probs_to_frames(
+            window_probs,
+            len(signal),
+            sample_rate,
+            options["window"],
+            options["shift"],
+            options["smoothing"],
+        )
+        segments = probs_to_segments(
+            probs,
+            frame_shift,
+            onset=options["onset"],
+            offset=options["offset"],
+            pad_onset=options["pad_onset"],
+            pad_offset=options["pad_offset"],
+            min_duration_on=options["min_duration_on"],
+            min_duration_off=options["min_duration_off"],
+            duration=len(signal) / sample_rate,
+        )
+        response = {"segments": segments, "frame_shift": frame_shift}
+        if options["return_probs"]:
+            response["probs"] = np.round(probs, 4).tolist()
+        return response
+
+    def infer_file(self, audio_filepath: str, options: dict) -> dict:
+        """Speech segments of an audio file readable by the server."""
+        signal, sample_rate = sf.read(audio_filepath, dtype="float32")
+        if signal.ndim > 1:
+            signal = signal.mean(axis=1)
+        return self.infer_signal(signal, sample_rate, options)
+
+    def close(self):
+        self.batcher.close()
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+def _parse_options(raw_options: dict) -> dict:
+    options = {}
+    for key, value in raw_options.items():
+        if key not in DEFAULT_OPTIONS:
+            continue
+        if key == "smoothing":
+            options[key] = str(value)
+        elif key == "return_probs":
+            options[key] = str(value).lower() in ("1", "true", "yes")
+        else:
+            options[key] = None if value is None else float(value)
+    return options
+
+
+class VADRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler, `self.server.service` is the shared VADService."""
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif urlparse(self.path).path == "/stats":
+            self._send_json(200, self.server.service.batcher.stats())
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/infer":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            query = dict(parse_qsl(url.query))
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                request = json.loads(body)
+                response = self.server.service.infer_file(
+                    request["audio_filepath"], _parse_options(request)
+                )
+            else:
+                dtype = PCM_DTYPES[query.get("dtype", "int16")]
+                signal = np.frombuffer(body, dtype=dtype)
+                response = self.server.service.infer_signal(
+                    signal, int(query.get("sample_rate", 16000)), _parse_options(query)
+                )
+        except Exception as error:
+            logger.error(f"request {self.path} failed due to {error}")
+            self._send_json(400, {"error": repr(error)})
+            return
+        self._send_json(200, response)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # client_address is an empty string for Unix sockets
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class _ThreadingUnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def serve(
+    service: VADService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: str = None,
+):
+    """Serves `service` until interrupted.
+
+    Args:
+        service (VADService): The service to expose.
+        host (str, optional): Host to bind. Defaults to "127.0.0.1".
+        port (int, optional): TCP port to bind. Defaults to 8765.
+        unix_socket (str, optional): Path of a Unix socket to bind
+            instead of host and port. Defaults to None.
+    """
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        httpd = _ThreadingUnixHTTPServer(unix_socket, VADRequestHandler)
+        address = unix_socket
+    else:
+        httpd = ThreadingHTTPServer((host, port), VADRequestHandler)
+        address = f"http://{host}:{port}"
+    httpd.service = service
+    logger.info(f"VAD server listening on {address}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, unix_socket, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_socket = unix_socket
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_socket)
+
+
+class VADClient:
+    """Client of a running VAD server.
+
+    Args:
+        address (str): "http://host:port" or "unix:/path/to/socket".
+        timeout (float, optional): Socket timeout in seconds.
+            Defaults to None.
+
+    Example:
+        client = VADClient("unix:/tmp/vad.sock")
+        segments = client.infer_file("example_1.wav")["segments"]
+    """
+
+    def __init__(self, address: str, timeout: float = None):
+        self.address = address
+        self.timeout = timeout
+
+    def infer_file(self, audio_filepath: str, **options) -> dict:
+        """Speech segments of an audio file, which must be readable by
+        the server."""
+        body = json.dumps(
+            {"audio_filepath": os.path.abspath(audio_filepath), **options}
+        ).encode("utf-8")
+        return self._post("/infer", body, "application/json")
+
+    def infer_pcm(self, signal: np.ndarray, sample_rate: int, **options) -> dict:
+        """Speech segments of a mono int16 or float32 signal."""
+        dtype = "int16" if signal.dtype == np.int16 else "float32"
+        query = "&".join(
+            f"{key}={value}"
+            for key, value in {
+                "sample_rate": sample_rate,
+                "dtype": dtype,
+                **options,
+            }.items()
+            if value is not None
+        )
+        body = np.ascontiguousarray(signal, dtype=PCM_DTYPES[dtype]).tobytes()
+        return self._post(f"/infer?{query}", body, "application/octet-stream")
+
+    def stats(self) -> dict:
+        """Throughput and latency of the server scheduler."""
+        connection = self._connection()
+        try:
+            connection.request("GET", "/stats")
+            return json.loads(connection.getresponse().read())
+        finally:
+            connection.close()
+
+    def health(self) -> bool:
+        connection = self._connection()
+        try:
+            connection.request("GET", "/health")
+            return connection.getresponse().status == 200
+        except OSError:
+            return False
+        finally:
+            connection.close()
+
+    def _connection(self):
+        if self.address.startswith("unix:"):
+            return _UnixHTTPConnection(self.address[len("unix:") :], self.timeout)
+        url = urlparse(self.address)
+        return http.client.HTTPConnection(url.hostname, url.port, timeout=self.timeout)
+
+    def _post(self, path, body, content_type):
+        connection = self._connection()
+        try:
+            connection.request(
+                "POST", path, body=body, headers={"Content-Type": content_type}
+            )
+            response = connection.getresponse()
+            payload = json.loads(response.read())
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError(f"VAD server error {response.status}: {payload}")
+        return payload
@@ -0,0 +1,323 @@
+"""Array job sharding
+Splits the recordings of a corpus between the jobs of a PBS array job,
+so that every job picks its own share of the same folder without any
+coordination, and merges the results the jobs saved into the metrics of
+the whole corpus without running the model again.
+
+The shard of a job is read from PBS_ARRAY_INDEX (PBS Pro) or PBS_ARRAYID
+(Torque), counted from 0, and the number of shards from VAD_NUM_SHARDS,
+which the submission script sets to the size of the array:
+
+    qsub -J 0-7 -v VAD_NUM_SHARDS=8 inference_array.pbs
+
+Recordings are assigned by their audio file size, largest first, each to
+the shard with the least audio so far. The assignment only depends on
+the recording ids and sizes, so every job computes the same one.
+"""
+
+import heapq
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.vad.inference.posteriors import load_posteriors, save_posteriors
+from src.vad.inference.results_store import META_FILE, ResultsStore, load_run
+
+logger = logging.getLogger(__name__)
+
+SHARD_INDEX_VARIABLES = ("PBS_ARRAY_INDEX", "PBS_ARRAYID")
+NUM_SHARDS_VARIABLE = "VAD_NUM_SHARDS"
+
+
+def _array_job_id(environ: Mapping[str, str]) -> str:
+    # PBS Pro gives the array id, "1234[].server", Torque only the id of
+    # the sub job, "1234[5].server"
+    job_id = environ.get("PBS_ARRAY_ID") or re.sub(
+        r"\[\d+\]", "[]", environ.get("PBS_JOBID", "local")
+    )
+    return re.sub(r"[^\w.-]", "_", job_id.split(".")[0]).strip("_") or "local"
+
+
+def assign_recordings(weights: Mapping[str, float], num_shards: int) -> Dict[str, int]:
+    """Shard of every recording, balancing the total weight of the shards.
+
+    Args:
+        weights (Mapping[str, float]): Weight of every recording id, e.g.
+            its audio file size.
+        num_shards (int): Number of shards.
+
+    Returns:
+        Dict[str, int]: Shard index of every recording id.
+
+    Examples:
+        >>> assign_recordings({"a": 5, "b": 3, "c": 3, "d": 1}, 2)
+        {'a': 0, 'b': 1, 'c': 1, 'd': 0}
+    """
+    # ties broken by id, the order the recordings were listed in does not matter
+    order = sorted(
+        weights, key=lambda recording_id: (-weights[recording_id], recording_id)
+    )
+    loads = [(0.0, shard_index) for shard_index in range(num_shards)]
+    assignment = {}
+    for recording_id in order:
+        load, shard_index = heapq.heappop(loads)
+        assignment[recording_id] = shard_index
+        heapq.heappush(loads, (load + weights[recording_id], shard_index))
+    return {recording_id: assignment[recording_id] for recording_id in sorted(weights)}
+
+
+class Shard:
+    """One shard of an array job.
+
+    Args:
+        index (int): Index of the shard, from 0.
+        count (int): Number of shards.
+        job_id (str, optional): Id of the array job, shared by its
+            shards. Defaults to "local".
+
+    Examples:
+        >>> shard = Shard.from_environment()  # None outside of an array job
+        >>> annote_dict = shard.select(annote_dict)
+    """
+
+    def __init__(self, index: int, count: int, job_id: str = "local"):
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index {index} is not in [0, {count})")
+        self.index = index
+        self.count = count
+        self.job_id = job_id
+
+    @property
+    def name(self) -> str:
+        return f"shard-{self.index:05d}-of-{self.count:05d}"
+
+    def as_dict(self) -> dict:
+        return {"index": self.index, "count": self.count, "job_id": self.job_id}
+
+    @classmethod
+    def from_environment(
+        cls, environ: Optional[Mapping[str, str]] = None
+    ) -> Optional["Shard"]:
+        """The shard of the running PBS array job, None outside of one.
+
+        Raises:
+            ValueError: When VAD_NUM_SHARDS is not set in an array job.
+        """
+        environ = os.environ if environ is None else environ
+        index = next(
+            (environ[name] for name in SHARD_INDEX_VARIABLES if environ.get(name)),
+            None,
+        )
+        if index is None:
+            return None
+        if not environ.get(NUM_SHARDS_VARIABLE):
+            raise ValueError(
+                f"Array job without {NUM_SHARDS_VARIABLE}, submit it with "
+                f"-v {NUM_SHARDS_VARIABLE}=<size of the array>"
+            )
+        return cls(
+            int(index), int(environ[NUM_SHARDS_VARIABLE]), _array_job_id(environ)
+        )
+
+    def select(self, annote_dict: dict) -> dict:
+        """The recordings of this shard in an annotations dictionary.
+
+        Args:
+            annote_dict (dict): {annotation_key: {file_id: {"audio_path",
+                ...}}}, see Annotations.annotations_loader.
+
+        Returns:
+            dict: The same dictionary with only the recordings of this
+                shard, annotation keys left without any being dropped.
+        """
+        weights = {}
+        for annotation_key, recordings in annote_dict.items():
+            for file_id, recording in recordings.items():
+                audio_path = str(recording.get("audio_path", ""))
+                weights[f"{annotation_key}/{file_id}"] = (
+                    os.path.getsize(audio_path) if os.path.isfile(audio_path) else 0
+                )
+        assignment = assign_recordings(weights, self.count)
+        selected = {}
+        for annotation_key, recordings in annote_dict.items():
+            kept = {
+                file_id: recording
+                for file_id, recording in recordings.items()
+                if assignment[f"{annotation_key}/{file_id}"] == self.index
+            }
+            if kept:
+                selected[annotation_key] = kept
+        logger.info(
+            f"{self.name} of job {self.job_id}: "
+            f"{sum(len(recordings) for recordings in selected.values())} of "
+            f"{len(weights)} recordings"
+        )
+        return selected
+
+
+def shard_runs(results_root: str) -> Tuple[List[str], List[int], Optional[int]]:
+    """Finished shard runs of a ResultsStore folder, the latest run of a
+    shard replacing earlier ones, e.g. of a resubmitted job.
+
+    Returns:
+        Tuple[List[str], List[int], Optional[int]]: Run directories in
+            shard order, indices of the missing shards and the number of
+            shards.
+    """
+    store = ResultsStore(results_root)
+    latest = {}
+    count = None
+    for run_id in store.runs():
+        run_dir = os.path.join(results_root, run_id)
+        with open(os.path.join(run_dir, META_FILE), "r", encoding="UTF-8") as infile:
+            metadata = json.load(infile)
+        shard = metadata.get("shard")
+        if not shard:
+            logger.warning(f"{run_id} is not a shard run, skipped")
+            continue
+        if "finished" not in metadata:
+            logger.warning(
+                f"{run_id} of shard {shard['index']} did not finish, skipped"
+            )
+            continue
+        if count is not None and shard["count"] != count:
+            raise ValueError(
+                f"{run_id} is one of {shard['count']} shards, other runs of {count}"
+            )
+        count = shard["count"]
+        latest[shard["index"]] = run_dir
+    missing = [index for index in range(count or 0) if index not in latest]
+    return [latest[index] for index in sorted(latest)], missing, count
+
+
+def merge_runs(run_dirs: Sequence[str]) -> Tuple[Dict[str, np.ndarray], dict]:
+    """Concatenates the columns of several runs, see load_run.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], dict]: The merged columns, their
+            recording column indexing the merged metadata["recordings"],
+            and metadata with the recordings, labels and runs.
+    """
+    recordings = []
+    codes = {}
+    parts = []
+    labels = None
+    for run_dir in run_dirs:
+        columns, metadata = load_run(run_dir)
+        labels = labels or metadata.get("labels")
+        # recording codes of the run to codes of the merged recordings
+        remap = np.array(
+            [
+                codes.setdefault(recording_id, len(codes))
+                for recording_id in metadata["recordings"]
+            ],
+            dtype=np.int32,
+        )
+        recordings = list(codes)
+        if columns:
+            columns["recording"] = remap[columns["recording"]]
+            parts.append(columns)
+    names = set.intersection(*(set(part) for part in parts)) if parts else set()
+    merged = {
+        name: np.concatenate([part[name] for part in parts]) for name in sorted(names)
+    }
+    return merged, {
+        "recordings": recordings,
+        "labels": labels,
+        "runs": [os.path.basename(run_dir) for run_dir in run_dirs],
+        "rows": int(len(merged.get("prob", []))),
+    }
+
+
+def merge_posteriors(paths: Sequence[str], output_path: str) -> str:
+    """Writes the posteriors of several save_posteriors files to one, the
+    ids of a later file which are already taken being prefixed with the
+    name of its folder, e.g. "shard-00003-of-00008/chunks".
+
+    Returns:
+        str: The path written.
+    """
+    merged_probs = {}
+    merged_labels = {}
+    frame_shifts = set()
+    for path in paths:
+        probs, labels, frame_shift = load_posteriors(path)
+        frame_shifts.add(frame_shift)
+        prefix = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        for key in probs:
+            merged_key = f"{prefix}/{key}" if key in merged_probs else key
+            merged_probs[merged_key] = probs[key]
+            merged_labels[merged_key] = labels[key]
+    if len(frame_shifts) > 1:
+        raise ValueError(
+            f"Posteriors with different frame shifts {sorted(frame_shifts)}"
+        )
+    return save_posteriors(
+        output_path,
+        merged_probs,
+        merged_labels,
+        frame_shifts.pop() if frame_shifts else 0.0,
+    )
+
+
+def _metrics(columns: Dict[str, np.ndarray]) -> Optional[Dict[str, float]]:
+    from src.vad.evaluation.chunk_metrics import chunk_metrics
+
+    if not columns:
+        return None
+    # rows without a ground truth label are not scored
+    scored = columns["label"] >= 0
+    if not scored.any():
+        return None
+    return chunk_metrics(
+        columns["label"][scored], columns["pred"][scored], columns["prob"][scored]
+    )
+
+
+def merge_shards(results_root: str, output_path: Optional[str] = None) -> dict:
+    """Global and per shard chunk metrics of the shard runs of an array
+    job, from their saved labels, predictions and probabilities.
+
+    Args:
+        results_root (str): ResultsStore folder the shards saved their
+            runs to, e.g. chunked_audio/shards/<job id>/results.
+        output_path (str, optional): Writes the report as JSON there.
+            Defaults to None.
+
+    Returns:
+        dict: shards (run, rows and metrics of every shard), missing
+            (indices of shards without a finished run), count and total,
+            the metrics of every row of every shard.
+    """
+    run_dirs, missing, count = shard_runs(results_root)
+    if missing:
+        logger.warning(f"Shards {missing} of {count} have no finished run")
+    shards = []
+    for run_dir in run_dirs:
+        columns, metadata = load_run(run_dir)
+        shards.append(
+            {
+                "index": metadata["shard"]["index"],
+                "run_id": metadata["run_id"],
+                "rows": int(len(columns.get("prob", []))),
+                "seconds": metadata.get("seconds"),
+                "metrics": _metrics(columns),
+            }
+        )
+    columns, metadata = merge_runs(run_dirs)
+    report = {
+        "count": count,
+        "missing": missing,
+        "recordings": len(metadata["recordings"]),
+        "rows": metadata["rows"],
+        "shards": shards,
+        "total": _metrics(columns),
+    }
+    if output_path:
+        with open(output_path, "w", encoding="UTF-8") as outfile:
+            json.dump(report, outfile, indent=2)
+    return report
@@ -0,0 +1,217 @@
+"""Sliding window inference
+Runs MarbleNet over overlapping windows of a recording and aggregates
+the overlapping window posteriors into a per-frame speech probability
+track, with one frame per window shift.
+"""
+
+import logging
+from typing import Tuple
+
+import numpy as np
+import soundfile as sf
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.folder_audio_utils.audio_management import AudioUtils
+from src.vad.inference.marblenet_model import infer_chunks, speech_label_index
+
+logger = logging.getLogger(__name__)
+
+SMOOTHING_METHODS = ("mean", "median")
+
+# rows of the median filter computed at a time, bounds its memory use
+_MEDIAN_BLOCK_FRAMES = 65536
+
+
+def window_speech_probs(
+    model,
+    signal: np.ndarray,
+    sample_rate: int,
+    window: float = 0.63,
+    shift: float = 0.01,
+    batch_size: int = 320,
+) -> np.ndarray:
+    """Speech probability of every overlapping window of a signal.
+
+    Args:
+        model (torch.nn.Module): The model to use for inference.
+        signal (np.ndarray): 1D audio signal.
+        sample_rate (int): Audio sample rate in Hz e.g. 16000
+        window (float, optional): Window length in seconds.
+            Defaults to 0.63.
+        shift (float, optional): Time between the starts of two
+            consecutive windows in seconds. Defaults to 0.01.
+        batch_size (int, optional): Number of windows per forward
+            pass. Defaults to 320.
+
+    Returns:
+        np.ndarray: float32 array of shape (n_windows,), where window
+            i starts at i * shift seconds.
+    """
+    window_len = round(window * sample_rate)
+    hop_len = round(shift * sample_rate)
+    windows = AudioUtils.frame_signal(signal, window_len, hop_len)
+    logits = infer_chunks(model, windows, batch_size)
+    probs = torch.softmax(logits, dim=-1)[:, speech_label_index(model)]
+    return probs.numpy().astype(np.float32)
+
+
+def smooth_window_probs(
+    window_probs: np.ndarray,
+    windows_per_span: int,
+    number_of_frames: int = None,
+    method: str = "mean",
+) -> np.ndarray:
+    """Aggregates overlapping window probabilities into frame
+    probabilities.
+
+    Frame f spans one window shift, and is covered by windows
+    f - windows_per_span + 1 to f. Its probability is the mean or the
+    median of the probabilities of those windows.
+
+    Args:
+        window_probs (np.ndarray): Probabilities of shape (n_windows,)
+            of windows spaced one frame apart.
+        windows_per_span (int): Number of frames covered by a window
+            i.e. window / shift.
+        number_of_frames (int, optional): Number of frames to return.
+            Defaults to n_windows + windows_per_span - 1.
+        method (str, optional): 'mean' or 'median'. Defaults to
+            'mean'.
+
+    Returns:
+        np.ndarray: float32 array of shape (number_of_frames,).
+
+    Examples:
+        >>> smooth_window_probs(np.array([0.0, 1.0, 1.0]), 2)
+        array([0. , 0.5, 1. , 1. ], dtype=float32)
+    """
+    if method not in SMOOTHING_METHODS:
+        raise ValueError(f"method must be one of {SMOOTHING_METHODS}, got {method}")
+    n_windows = len(window_probs)
+    span = max(int(windows_per_span), 1)
+    if number_of_frames is None:
+        number_of_frames = n_windows + span - 1 if n_windows else 0
+    if n_windows == 0 or number_of_frames == 0:
+        return np.zeros(number_of_frames, dtype=np.float32)
+
+    frames = np.arange(number_of_frames)
+    first_window = np.clip(frames - span + 1, 0, n_windows)
+    last_window = np.clip(frames + 1, 0, n_windows)
+
+    if method == "mean":
+        cumulative = np.concatenate(([0.0], np.cumsum(window_probs, dtype=np.float64)))
+        count = np.maximum(last_window - first_window, 1)
+        smoothed = (cumulative[last_window] - cumulative[first_window]) / count
+        return smoothed.astype(np.float32)
+
+    # median: frame f is row f of a sliding view over NaN padded
+    # window probabilities, NaNs marking windows outside the recording
+    padded = np.full(n_windows + 2 * (span - 1) + number_of_frames, np.nan)
+    padded[span - 1 : span - 1 + n_windows] = window_probs
+    covering_windows = sliding_window_view(padded, span)[:number_of_frames]
+    smoothed = np.empty(number_of_frames, dtype=np.float32)
+    for start in range(0, number_of_frames, _MEDIAN_BLOCK_FRAMES):
+        block = covering_windows[start : start + _MEDIAN_BLOCK_FRAMES]
+        empty = np.isnan(block).all(axis=1)
+        block_median = np.zeros(len(block))
+        if not empty.all():
+            block_median[~empty] = np.nanmedian(block[~empty], axis=1)
+        smoothed[start : start + len(block)] = block_median
+    return smoothed
+
+
+def frame_speech_probs(
+    model,
+    signal: np.ndarray,
+    sample_rate: int,
+    window: float = 0.63,
+    shift: float = 0.01,
+    smoothing: str = "mean",
+    batch_size: int = 320,
+) -> Tuple[np.ndarray, float]:
+    """Per-frame speech probability track of a signal, from windows of
+    `window` seconds shifted by `shift` seconds.
+
+    Args:
+        model (torch.nn.Module): The model to use for inference.
+        signal (np.ndarray): 1D audio signal.
+        sample_rate (int): Audio sample rate in Hz e.g. 16000
+        window (float, optional): Window length in seconds.
+            Defaults to 0.63.
+        shift (float, optional): Window shift in seconds, which is
+            also the frame length of the returned track.
+            Defaults to 0.01.
+        smoothing (str, optional): 'mean' or 'median' aggregation of
+            the overlapping windows. Defaults to 'mean'.
+        batch_size (int, optional): Number of windows per forward
+            pass. Defaults to 320.
+
+    Returns:
+        Tuple[np.ndarray, float]: float32 speech probability per frame,
+            frame f spanning [f * shift, (f + 1) * shift) seconds, and
+            the frame length in seconds.
+
+    Examples:
+        >>> model = load_model()
+        >>> signal, sample_rate = sf.read("example_1.wav", dtype="float32")
+        >>> probs, frame_shift = frame_speech_probs(model, signal, sample_rate)
+    """
+    window_probs = window_speech_probs(
+        model, signal, sample_rate, window, shift, batch_size
+    )
+    return window_probs_to_frames(
+        window_probs, len(signal), sample_rate, window, shift, smoothing
+    )
+
+
+def window_probs_to_frames(
+    window_probs: np.ndarray,
+    signal_len: int,
+    sample_rate: int,
+    window: float = 0.63,
+    shift: float = 0.01,
+    smoothing: str = "mean",
+) -> Tuple[np.ndarray, float]:
+    """Per-frame speech probability track of a signal of `signal_len`
+    samples from the probabilities of its overlapping windows, see
+    frame_speech_probs.
+
+    Returns:
+        Tuple[np.ndarray, float]: speech probability per frame and the
+            frame length in seconds.
+    """
+    hop_len = round(shift * sample_rate)
+    number_of_frames = -(-signal_len // hop_len)
+    probs = smooth_window_probs(
+        window_probs,
+        round(window / shift),
+        number_of_frames=number_of_frames,
+        method=smoothing,
+    )
+    return probs, hop_len / sample_rate
+
+
+def recording_speech_probs(
+    model,
+    audio_file: str,
+    window: float = 0.63,
+    shift: float = 0.01,
+    smoothing: str = "mean",
+    batch_size: int = 320,
+) -> Tuple[np.ndarray, float]:
+    """Reads an audio file and returns its per-frame speech probability
+    track, see frame_speech_probs.
+
+    Args:
+        model (torch.nn.Module): The model to use for inference.
+        audio_file (str): Path to the audio file.
+
+    Returns:
+        Tuple[np.ndarray, float]: speech probability per frame and the
+            frame length in seconds.
+    """
+    signal, sample_rate = sf.read(audio_file, dtype="float32")
+    return frame_speech_probs(
+        model, signal, sample_rate, window, shift, smoothing, batch_size
+    )
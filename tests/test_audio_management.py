@@ -0,0 +1,203 @@
+"""AudioUtils window and frame labels against their reference
+implementations."""
+
+import numpy as np
+import pytest
+
+from src.folder_audio_utils.audio_management import AudioUtils, SegmentIndex
+
+
+def _check_overlap_labels(timings, segments):
+    labels = [AudioUtils.check_overlap(window, segments) for window in timings]
+    return (
+        np.array([overlap for overlap, _ in labels]),
+        np.array([offset for _, offset in labels]),
+    )
+
+
+def _random_segments(rng, number_of_segments, duration):
+    # boundaries on the 10 ms grid of RTTM files, overlapping and unsorted
+    starts = np.round(rng.uniform(0, duration, number_of_segments), 2)
+    ends = np.round(starts + rng.uniform(0.01, 3.0, number_of_segments), 2)
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_label_windows_matches_check_overlap(seed):
+    rng = np.random.default_rng(seed)
+    segments = _random_segments(rng, int(rng.integers(1, 40)), 60.0)
+    window_len = round(0.63 * 16000)
+    # chunk windows, and windows on the segment grid which often touch them
+    grid_starts = np.round(rng.uniform(0, 60.0, 200), 2)
+    grid_ends = np.round(grid_starts + rng.choice([0.01, 0.5, 1.0, 2.0], 200), 2)
+    timings = np.concatenate(
+        (
+            AudioUtils.window_timings(
+                96, window_len, window_len, round(60.0 * 16000), 16000
+            ),
+            np.stack((grid_starts, grid_ends), axis=1),
+        )
+    )
+
+    overlap, offsets = AudioUtils.label_windows(timings, segments)
+    expected_overlap, expected_offsets = _check_overlap_labels(timings, segments)
+
+    np.testing.assert_array_equal(overlap, expected_overlap)
+    np.testing.assert_array_equal(offsets, expected_offsets)
+
+
+@pytest.mark.parametrize("order", ["sorted", "reversed", "shuffled"])
+def test_label_windows_matches_check_overlap_at_boundaries(order):
+    segments = [(1.0, 2.0), (1.5, 4.0), (4.0, 4.5), (6.0, 6.2), (6.1, 7.0)]
+    if order == "reversed":
+        segments = segments[::-1]
+    elif order == "shuffled":
+        segments = [segments[index] for index in (3, 0, 4, 2, 1)]
+    timings = np.array(
+        [
+            [0.0, 1.0],  # ends where a segment starts
+            [2.0, 3.0],  # starts where a segment ends, inside another
+            [4.5, 5.0],  # starts where the last of a chain ends
+            [5.0, 6.0],  # ends where a segment starts
+            [7.0, 8.0],  # starts where the last segment ends
+            [0.0, 0.99],
+            [7.01, 8.0],
+            [0.5, 6.15],
+        ]
+    )
+
+    overlap, offsets = SegmentIndex(segments).query(timings)
+    expected_overlap, expected_offsets = _check_overlap_labels(timings, segments)
+
+    np.testing.assert_array_equal(overlap, expected_overlap)
+    np.testing.assert_array_equal(offsets, expected_offsets)
+
+
+def _per_sample_frame_labels(
+    segments, duration, sample_rate=16000, frame_duration=0.02, per=0.0, start=0.0
+):
+    # every sample labelled, then averaged per zero padded frame
+    frame_len = round(frame_duration * sample_rate)
+    first_sample = round(start * sample_rate)
+    number_of_samples = round(duration * sample_rate)
+    speech = np.zeros(-(-number_of_samples // frame_len) * frame_len)
+    for segment_start, segment_end in segments:
+        first = min(
+            max(round(segment_start * sample_rate) - first_sample, 0), number_of_samples
+        )
+        last = min(
+            max(round(segment_end * sample_rate) - first_sample, 0), number_of_samples
+        )
+        speech[first:last] = 1
+    return (speech.reshape(-1, frame_len).mean(axis=1) > per).astype(np.uint8)
+
+
+def _legacy_get_label_frame(
+    left_list, right_list, sample_rate=16000, frame_duration=0.02, per=0
+):
+    # get_label_frame before frame_labels, without its prints
+    start_time_left = float(left_list[0])
+    end_time_left = float(left_list[1])
+    duration = int((end_time_left - start_time_left) * sample_rate)
+    data_point_per_frame = int(frame_duration * sample_rate)
+    impt_tuples = [
+        x
+        for x in right_list
+        if not ((x[1] <= start_time_left) | (x[0] >= end_time_left))
+    ]
+    if not impt_tuples:
+        return " ".join(["0"] * 50)
+    impt_tuples.sort(key=lambda x: x[0])
+    if impt_tuples[0][0] < start_time_left:
+        impt_tuples[0] = (start_time_left, impt_tuples[0][1])
+    if impt_tuples[-1][-1] > end_time_left:
+        impt_tuples[-1] = (impt_tuples[-1][0], end_time_left)
+    array_init = np.zeros(duration)
+    for seg in impt_tuples:
+        idx_left_no_adjust = 0 if seg[0] == 0 else (seg[0] * sample_rate) - 1
+        idx_right_no_adjust = seg[1] * sample_rate
+        idx_left_adjusted = (
+            0
+            if idx_left_no_adjust == 0
+            else idx_left_no_adjust - (start_time_left * 16000 - 1)
+        )
+        idx_right_adjusted = idx_right_no_adjust - (start_time_left * 16000)
+        array_init[int(idx_left_adjusted) : int(idx_right_adjusted)] = 1
+    pad = -len(array_init) % data_point_per_frame
+    array_padded = np.pad(array_init, (0, pad), "constant", constant_values=0)
+    mean_per_row = array_padded.reshape(-1, data_point_per_frame).mean(axis=1)
+    return " ".join(map(str, np.where(mean_per_row > float(per), 1, 0).tolist()))
+
+
+def test_frame_labels_at_segment_edges():
+    # 20 ms frames of 320 samples
+    labels = AudioUtils.frame_labels(
+        [(0.02, 0.04), (0.0999375, 0.1), (0.16, 0.1600625)], 0.2
+    )
+    # a segment ending on a frame boundary does not reach the next frame,
+    # one speech sample is enough with per=0
+    np.testing.assert_array_equal(labels, [0, 1, 0, 0, 1, 0, 0, 0, 1, 0])
+
+
+def test_frame_labels_at_the_per_threshold():
+    # frame 0 has exactly half of its samples speech, frame 1 one sample more
+    segments = [(0.0, 0.01), (0.03, 0.0400625)]
+
+    np.testing.assert_array_equal(
+        AudioUtils.frame_labels(segments, 0.04, per=0.5), [0, 0]
+    )
+    np.testing.assert_array_equal(
+        AudioUtils.frame_labels(segments, 0.04, per=0.499), [1, 1]
+    )
+    np.testing.assert_array_equal(
+        AudioUtils.frame_labels(segments, 0.04, per=1.0), [0, 0]
+    )
+
+
+def test_frame_labels_pads_the_last_frame():
+    # 50 ms is two full frames and a 10 ms one, padded to 20 ms with non-speech
+    segments = [(0.04, 0.05)]
+
+    np.testing.assert_array_equal(AudioUtils.frame_labels(segments, 0.05), [0, 0, 1])
+    np.testing.assert_array_equal(
+        AudioUtils.frame_labels(segments, 0.05, per=0.5), [0, 0, 0]
+    )
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("per", [0.0, 0.25, 0.5])
+def test_frame_labels_matches_per_sample_labels_of_a_recording(seed, per):
+    rng = np.random.default_rng(seed)
+    segments = _random_segments(rng, 30, 60.0)
+    start = float(np.round(rng.uniform(0, 10), 3))
+    duration = float(np.round(rng.uniform(1, 50), 3))
+
+    labels = AudioUtils.frame_labels(segments, duration, per=per, start_time=start)
+
+    np.testing.assert_array_equal(
+        labels, _per_sample_frame_labels(segments, duration, per=per, start=start)
+    )
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("per", [0, 0.5])
+def test_get_label_frame_matches_legacy_implementation(seed, per):
+    # boundaries on a 1/64 s grid, where the legacy int() truncation of
+    # seconds * sample_rate is exact, and disjoint segments it handles
+    rng = np.random.default_rng(seed)
+    bounds = np.sort(rng.choice(np.arange(1, 64 * 30), 20, replace=False)) / 64
+    segments = list(zip(bounds[0::2].tolist(), bounds[1::2].tolist()))
+    for first in range(0, 64 * 28, 64 * 5 // 2):
+        window = [first / 64, first / 64 + 5.0]
+        if not any(start < window[1] and end > window[0] for start, end in segments):
+            continue
+        assert AudioUtils.get_label_frame(
+            window, segments, per=per
+        ) == _legacy_get_label_frame(window, segments, per=per)
+
+
+def test_get_label_frame_of_a_window_without_speech_has_one_label_per_frame():
+    # the legacy implementation returned 50 labels whatever the window length
+    labels = AudioUtils.get_label_frame([10.0, 15.0], [(1.0, 2.0), (20.0, 21.0)])
+
+    assert labels == " ".join(["0"] * 250)
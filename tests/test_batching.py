@@ -0,0 +1,69 @@
+"""Scheduling of DynamicBatchScheduler."""
+
+import threading
+
+import numpy as np
+import pytest
+
+from src.vad.inference.batching import DynamicBatchScheduler
+
+
+class _CountingModel:
+    """infer_fn returning the first sample of every window as both logits,
+    holding the first batch until `release` is set."""
+
+    def __init__(self, fail_first=False):
+        self.release = threading.Event()
+        self.batches = []
+        self.fail_first = fail_first
+
+    def __call__(self, windows):
+        self.release.wait()
+        self.batches.append(len(windows))
+        if self.fail_first and len(self.batches) == 1:
+            raise RuntimeError("forward pass failed")
+        return np.repeat(windows[:, :1], 2, axis=1).astype(np.float32)
+
+
+def _windows(n_windows, first=0):
+    return np.arange(first, first + n_windows, dtype=np.float32)[:, None].repeat(4, 1)
+
+
+def test_short_request_is_not_held_behind_a_long_one():
+    model = _CountingModel()
+    scheduler = DynamicBatchScheduler(
+        None, max_batch_size=10, max_wait_ms=50, infer_fn=model
+    )
+    finished_after = {}
+    long_future = scheduler.submit(_windows(200))
+    short_future = scheduler.submit(_windows(3, first=1000))
+    short_future.add_done_callback(
+        lambda _: finished_after.setdefault("short", len(model.batches))
+    )
+    model.release.set()
+
+    long_logits = long_future.result(timeout=10)
+    short_logits = short_future.result(timeout=10)
+    scheduler.close()
+
+    # the first batch may have been formed before the short request arrived
+    assert finished_after["short"] <= 2
+    assert len(model.batches) == 21
+    np.testing.assert_array_equal(long_logits[:, 0], np.arange(200))
+    np.testing.assert_array_equal(short_logits[:, 0], np.arange(1000, 1003))
+
+
+def test_failed_request_is_not_run_further():
+    model = _CountingModel(fail_first=True)
+    model.release.set()
+    scheduler = DynamicBatchScheduler(
+        None, max_batch_size=10, max_wait_ms=1, infer_fn=model
+    )
+
+    with pytest.raises(RuntimeError):
+        scheduler.infer(_windows(50))
+    logits = scheduler.infer(_windows(4))
+    scheduler.close()
+
+    assert model.batches == [10, 4]
+    np.testing.assert_array_equal(logits[:, 0], np.arange(4))
@@ -0,0 +1,31 @@
+"""Arguments checked by `vad infer` before any model is loaded."""
+
+import numpy as np
+import soundfile as sf
+
+from src.vad import cli
+
+
+def _write_silence(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    sf.write(path, np.zeros(1600, dtype=np.float32), 16000)
+
+
+def test_infer_refuses_audio_files_with_the_same_name(tmp_path, caplog):
+    _write_silence(tmp_path / "audio" / "a" / "x.wav")
+    _write_silence(tmp_path / "audio" / "b" / "x.wav")
+    output_dir = tmp_path / "vad_output"
+
+    status = cli.main(
+        ["infer", str(tmp_path / "audio"), "--output-dir", str(output_dir)]
+    )
+
+    assert status == 1
+    assert "same name" in caplog.text
+    assert not output_dir.exists()
+
+
+def test_duplicate_stems_ignores_distinct_names():
+    assert cli._duplicate_stems(["a/x.wav", "b/y.wav", "b/x.flac"]) == {
+        "x": ["a/x.wav", "b/x.flac"]
+    }
@@ -0,0 +1,52 @@
+"""Parity of the exported MarbleNet artifacts with extract_logits."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+pytest.importorskip("nemo.collections.asr")
+
+from src.vad.inference.export import export_model, verify_export  # noqa: E402
+from src.vad.inference.marblenet_model import MODEL_PATH  # noqa: E402
+
+pytestmark = pytest.mark.skipif(
+    not os.path.isfile(MODEL_PATH), reason=f"{MODEL_PATH} not found"
+)
+
+WINDOW = 0.63
+SAMPLE_RATE = 16000
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    # chunks of the window the artifacts are traced with
+    rng = np.random.default_rng(0)
+    manifest_path = tmp_path / "chunks_manifest.json"
+    with open(manifest_path, "w", encoding="UTF-8") as outfile:
+        for index in range(12):
+            audio_path = tmp_path / f"chunk_{index}.wav"
+            level = 0.1 if index % 2 else 0.003
+            signal = rng.standard_normal(round(WINDOW * SAMPLE_RATE)) * level
+            sf.write(audio_path, signal.astype(np.float32), SAMPLE_RATE)
+            entry = {
+                "audio_filepath": str(audio_path),
+                "duration": WINDOW,
+                "label": "speech" if index % 2 else "background",
+            }
+            outfile.write(json.dumps(entry) + "\n")
+    return str(manifest_path)
+
+
+@pytest.mark.parametrize("suffix", [".onnx", ".ts"])
+def test_exported_model_matches_extract_logits(tmp_path, manifest, suffix):
+    if suffix == ".onnx":
+        pytest.importorskip("onnxruntime")
+    exported_path = export_model(str(tmp_path / f"marblenet{suffix}"), window=WINDOW)
+
+    # verify_export raises above atol
+    max_abs_diff = verify_export(exported_path, inference_files=manifest, atol=1e-3)
+
+    assert max_abs_diff <= 1e-3
@@ -0,0 +1,53 @@
+import pytest
+
+from src.vad.inference.options import InferenceOptions
+
+
+@pytest.mark.parametrize(
+    "options, mode",
+    [
+        ({}, "dataloader"),
+        ({"quantize": "static"}, "dataloader"),
+        ({"feature_cache_dir": "cache/", "quantize": "dynamic"}, "feature_cache"),
+        ({"pipeline_workers": 4, "max_batch_samples": 320 * 10080}, "pipeline"),
+        ({"processes": 1, "pipeline_workers": 2}, "pipeline"),
+        ({"processes": 4, "threads_per_process": 2}, "data_parallel"),
+        (
+            {"processes": 4, "pipeline_workers": 8, "max_batch_samples": 100},
+            "data_parallel",
+        ),
+    ],
+)
+def test_mode(options, mode):
+    assert InferenceOptions(**options).mode == mode
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"quantize": "int4"},
+        {"pipeline_workers": -1},
+        {"processes": -2},
+        {"threads_per_process": 0},
+        {"pipeline_workers": 2, "max_batch_samples": 0},
+        # the feature cache runs in this process, without the pipeline
+        {"feature_cache_dir": "cache/", "processes": 4},
+        {"feature_cache_dir": "cache/", "pipeline_workers": 2},
+        # bucketing only applies to the pipeline
+        {"max_batch_samples": 320 * 10080},
+        {"max_batch_samples": 320 * 10080, "processes": 1},
+        # threads per process without processes
+        {"threads_per_process": 4},
+        {"threads_per_process": 4, "processes": 1, "pipeline_workers": 2},
+    ],
+)
+def test_conflicting_options_raise(options):
+    with pytest.raises(ValueError):
+        InferenceOptions(**options)
+
+
+def test_as_dict_round_trips():
+    options = InferenceOptions(pipeline_workers=8, max_batch_samples=100, processes=2)
+
+    assert InferenceOptions(**options.as_dict()).as_dict() == options.as_dict()
+    assert options.as_dict()["threads_per_process"] == 1
@@ -0,0 +1,34 @@
+"""Static INT8 quantization of the restored MarbleNet checkpoint."""
+
+import os
+
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip("nemo.collections.asr")
+
+from src.vad.inference.marblenet_model import (  # noqa: E402
+    MODEL_PATH,
+    infer_chunks,
+    load_model,
+)
+from src.vad.inference.quantization import quantize_model  # noqa: E402
+
+pytestmark = pytest.mark.skipif(
+    not os.path.isfile(MODEL_PATH), reason=f"{MODEL_PATH} not found"
+)
+
+
+def test_static_quantization_runs_on_checkpoint():
+    model = load_model()
+    window_len = round(0.63 * model.cfg.sample_rate)
+    rng = np.random.default_rng(0)
+    windows = (rng.standard_normal((16, window_len)) * 0.1).astype(np.float32)
+
+    # MaskedConv1d reads the geometry of its wrapped .conv while masking
+    int8_model = quantize_model(model, "static", windows, batch_size=8)
+    logits = infer_chunks(int8_model, windows, 8)
+
+    assert logits.shape == (16, len(model.cfg.labels))
+    assert torch.isfinite(logits).all()
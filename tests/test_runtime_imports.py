@@ -0,0 +1,37 @@
+"""The inference CLI imports without the data preparation dependencies."""
+
+import os
+import subprocess
+import sys
+import textwrap
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# imported by annotations and marblenet_infer, not by `vad infer --model x.onnx`
+DATA_PREP_DEPENDENCIES = ("hydra", "pandas", "matplotlib", "textgrid", "nemo")
+
+
+def test_cli_imports_without_data_prep_dependencies():
+    script = textwrap.dedent(
+        f"""
+        import importlib.abc
+        import sys
+
+        class Block(importlib.abc.MetaPathFinder):
+            def find_spec(self, name, path, target=None):
+                if name.split(".")[0] in {DATA_PREP_DEPENDENCIES!r}:
+                    raise ModuleNotFoundError(f"No module named {{name!r}}")
+
+        sys.meta_path.insert(0, Block())
+        import src.vad.cli
+        import src.vad.inference.postprocessing
+        import src.vad.inference.runtime
+        """
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,146 @@
+"""read_rttm_bulk against the line by line RTTM reader."""
+
+import numpy as np
+import pytest
+
+from src.vad.data_prep import speech_segments as sseg
+
+
+def _rttm_line(file_id, onset, duration, speaker="spk0"):
+    return f"SPEAKER {file_id} 1 {onset} {duration} <NA> <NA> {speaker} <NA> <NA>"
+
+
+def _random_rttm(rng, file_id, number_of_lines):
+    lines = []
+    for _ in range(number_of_lines):
+        onset = f"{rng.uniform(0, 3000):.{rng.integers(0, 4)}f}"
+        duration = f"{rng.uniform(1, 20):.{rng.integers(0, 4)}f}"
+        separator = str(rng.choice([" ", "\t", "  "]))
+        fields = _rttm_line(file_id, onset, duration, f"spk{rng.integers(4)}").split()
+        lines.append(separator.join(fields) + str(rng.choice(["", " ", "\r"])))
+    return "".join(line + "\n" for line in lines)
+
+
+def _legacy_segments(rttm_path):
+    return sseg.validate_segments(sseg.read_rttm(rttm_path))
+
+
+def _legacy_bad_rows(rttm_path):
+    bad_rows = []
+    with open(rttm_path, "rb") as infile:
+        for line_number, line in enumerate(infile, 1):
+            if line.startswith(b"SPKR-INFO") or not line.strip():
+                continue
+            try:
+                sseg.parse_rttm_line(line)
+            except IOError as error:
+                bad_rows.append(
+                    (line_number, line.decode().strip(), str(error).split(". LINE")[0])
+                )
+    return bad_rows
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_bulk_segments_match_read_rttm(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    rttm_paths = []
+    for index in range(12):
+        rttm_path = tmp_path / f"file_{index}.rttm"
+        # empty files, a last line without newline and SPKR-INFO lines
+        content = _random_rttm(rng, f"file_{index}", int(rng.choice([0, 1, 50, 400])))
+        if index % 3 == 0:
+            content = "SPKR-INFO file 1 <NA> <NA> <NA> unknown spk0 <NA>\n" + content
+        if index % 4 == 1:
+            content = content.rstrip("\n")
+        rttm_path.write_text(content)
+        rttm_paths.append(str(rttm_path))
+
+    table, bad_rows = sseg.read_rttm_bulk(rttm_paths)
+    segments = sseg.rttm_table_to_segments(table)
+
+    assert bad_rows == []
+    for rttm_path in rttm_paths:
+        assert segments.get(rttm_path, []) == _legacy_segments(rttm_path)
+
+
+def test_bulk_reports_bad_rows_like_parse_rttm_line(tmp_path):
+    rttm_path = tmp_path / "bad.rttm"
+    lines = [
+        _rttm_line("bad", 1.0, 2.0),
+        "SPEAKER bad 1 2.0 1.0 <NA> <NA>",
+        _rttm_line("bad", "x", 1.0),
+        "",
+        _rttm_line("bad", -1.0, 1.0),
+        _rttm_line("bad", 3.0, "y"),
+        "SPKR-INFO bad 1 <NA> <NA> <NA> unknown spk0 <NA>",
+        _rttm_line("bad", 4.0, 0),
+        _rttm_line("bad", 5.0, -2.5),
+        "\x1c",
+        _rttm_line("bad", "nan", 1.0),
+        _rttm_line("bad", 6.0, 1.5) + " extra fields",
+    ]
+    rttm_path.write_text("\n".join(lines) + "\n")
+
+    table, bad_rows = sseg.read_rttm_bulk(str(rttm_path))
+
+    assert [
+        (row["line"], row["text"], row["reason"]) for row in bad_rows
+    ] == _legacy_bad_rows(rttm_path)
+    assert [row["reason"] for row in bad_rows] == [
+        "Number of fields < 9",
+        "Segment onset not FLOAT",
+        "Segment onset < 0 seconds",
+        "Segment duration not FLOAT",
+        "Segment duration <= 0 seconds",
+        "Segment duration <= 0 seconds",
+        "Number of fields < 9",
+    ]
+    # a nan onset passes parse_rttm_line, validate_segments drops it
+    assert table["onset"][:1].tolist() == [1.0] and len(table) == 3
+    assert sseg.rttm_table_to_segments(table)[str(rttm_path)] == [
+        (1.0, 3.0),
+        (6.0, 7.5),
+    ]
+
+
+def test_non_ascii_files_fall_back_to_the_line_parser(tmp_path):
+    lines = [
+        _rttm_line("f", 1.0, 2.0, "spé"),
+        "SPEAKER f 1",
+        _rttm_line("f", 4.0, 1.25),
+    ]
+    non_ascii = tmp_path / "non_ascii.rttm"
+    non_ascii.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    ascii_path = tmp_path / "ascii.rttm"
+    ascii_path.write_text(_rttm_line("g", 0.5, 0.25) + "\n")
+
+    table, bad_rows = sseg.read_rttm_bulk([str(ascii_path), str(non_ascii)])
+    fallback_table, fallback_bad_rows = sseg._parse_rttm_lines(str(non_ascii))
+
+    assert table["speaker"].tolist() == ["spk0", "spé", "spk0"]
+    assert table["rttm_path"].tolist() == [str(ascii_path)] + [str(non_ascii)] * 2
+    assert table[1:].tolist() == fallback_table.tolist()
+    assert bad_rows == fallback_bad_rows
+    assert [(row["line"], row["reason"]) for row in bad_rows] == [
+        (2, "Number of fields < 9")
+    ]
+    assert sseg.rttm_table_to_segments(table)[str(non_ascii)] == [
+        (1.0, 3.0),
+        (4.0, 5.25),
+    ]
+
+
+def test_rttm_table_to_segments_rounds_like_python():
+    onsets = np.array([1333.153, 0.125, 2.675, 10.0])
+    durations = np.array([12.332, 1.0, 0.0001, 0.045])
+    table = np.zeros(len(onsets), dtype=sseg.RTTM_TABLE_DTYPE)
+    table["onset"] = onsets
+    table["duration"] = durations
+    table["rttm_path"] = "a.rttm"
+
+    segments = sseg.rttm_table_to_segments(table)["a.rttm"]
+
+    assert [end for _, end in segments] == [
+        round(onset + duration, 2)
+        for onset, duration in zip(onsets.tolist(), durations.tolist())
+    ]